@@ -0,0 +1,557 @@
+"""
+ASGI-рантайм: HTTP API, бот, планировщик и доставка outbox в одном цикле событий.
+
+Запуск вместо app.py:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --timeout-graceful-shutdown 20
+(или python asgi.py). app.py и раздельный деплой web.py/bot.py/worker.py не меняются.
+
+- HTTP API — те же эндпоинты и ответы, что у web.py, на Starlette. Логика общая
+  (users.py, groups.py, events.py) и выполняется через async_db.run_sync: запросы к БД
+  идут через asyncpg/aiosqlite, не блокируя цикл.
+- Бот — Application python-telegram-bot в этом же цикле: webhook POST /telegram/webhook,
+  если задан TELEGRAM_WEBHOOK_URL, иначе polling (RUN_BOT_POLLING=1).
+- Планировщик — scheduler.AsyncScheduler: куча этапов и одна задача вместо потока на таймер.
+- Outbox — outbox.run_outbox_worker_async с telegram_client.AsyncTelegramClient.
+- Остановка (SIGTERM): uvicorn перестает принимать соединения и дожидается текущих
+  запросов, затем lifespan останавливает бота, дожидается начатых этапов планировщика
+  и отправляет уже готовые сообщения outbox — в пределах ASGI_DRAIN_TIMEOUT на шаг,
+  после чего закрывает HTTP-клиент и пулы БД. Недоделанное подхватит следующий процесс
+  по данным users и outbox.
+
+Только в web.py: профилирование запросов (profiling.py снимает стек потока-обработчика,
+а здесь все запросы выполняются в одном потоке).
+
+starlette, uvicorn, asyncpg (или aiosqlite) и greenlet — необязательные зависимости
+этой точки входа, перечислены в requirements-optional.txt
+"""
+import os
+import hmac
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import async_db
+from config import DB_ROLE_BULK, cors_allowed_origins, env_flag, get_bot_token
+from events import STATUS_EVENTS_MAINTENANCE_INTERVAL, ensure_partitions_async, stats_to_dict
+from groups import GroupError, create_group, group_status, join_group, leave_group, list_user_groups
+from models import User, UserStats, get_engine, get_or_create_user, init_db
+from outbox import run_outbox_worker_async
+from rate_limit import BaseRateLimiter, MemoryTokenBuckets, check_limits, retry_after_header
+from scheduler import AsyncScheduler, cold_start
+from static_files import (
+    MINIAPP_URL_PREFIX,
+    asset_etag,
+    asset_headers,
+    etag_matches,
+    load_miniapp_index,
+    resolve_asset,
+    select_variant,
+)
+from telegram_client import AsyncTelegramClient
+from telegram_webapp_auth import (
+    INIT_DATA_HEADER,
+    init_data_candidates,
+    legacy_user_id,
+    telegram_user_id_from_init_data,
+)
+from users import (
+    STATUS_AWAY,
+    STATUSES,
+    get_emergency_contact,
+    get_timer,
+    normalize_contact,
+    parse_timer_seconds,
+    set_emergency_contact,
+    set_status,
+    set_timer,
+    status_snapshot,
+)
+
+# -------------------- Логирование --------------------
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ASGI_DRAIN_TIMEOUT = float(os.environ.get("ASGI_DRAIN_TIMEOUT", "10"))
+TELEGRAM_WEBHOOK_URL = os.environ.get("TELEGRAM_WEBHOOK_URL", "").strip()
+TELEGRAM_WEBHOOK_PATH = "/telegram/webhook"
+
+
+def _webhook_secret() -> str:
+    """TELEGRAM_WEBHOOK_SECRET или производный от токена (одинаковый у всех экземпляров)"""
+    secret = os.environ.get("TELEGRAM_WEBHOOK_SECRET", "").strip()
+    if secret:
+        return secret
+    return hmac.new(get_bot_token().encode(), b"telegram-webhook", hashlib.sha256).hexdigest()
+
+
+# -------------------- Запрос: тело, аутентификация, лимиты --------------------
+
+async def _json_body(request: Request):
+    """Разобранный JSON-объект или None (как request.get_json(silent=True) во Flask)"""
+    if "application/json" not in request.headers.get("content-type", ""):
+        return None
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def get_verified_telegram_user_id(request: Request) -> int | None:
+    """user.id только из initData с проверенной подписью; результат кешируется на время запроса"""
+    if not hasattr(request.state, "verified_user_id"):
+        request.state.verified_user_id = None
+        body = await _json_body(request)
+        for raw in init_data_candidates(request.headers, request.query_params.get("init_data"), body):
+            uid = telegram_user_id_from_init_data(raw, get_bot_token())
+            if uid is not None:
+                request.state.verified_user_id = uid
+                break
+    return request.state.verified_user_id
+
+
+async def get_authenticated_telegram_user_id(request: Request) -> int | None:
+    uid = await get_verified_telegram_user_id(request)
+    if uid is not None:
+        return uid
+    return legacy_user_id(await _json_body(request), request.query_params.get("user_id"))
+
+
+class AsyncRateLimiter(BaseRateLimiter):
+    """RateLimiter web.py для Starlette: те же хранилище, лимиты по умолчанию и ключ (tg:<id> или ip:<адрес>)"""
+
+    async def _check(self, request: Request, scope: str, limits: list[tuple[int, int]]) -> Response | None:
+        uid = await get_verified_telegram_user_id(request)
+        key = f"tg:{uid}" if uid is not None else f"ip:{request.client.host if request.client else '127.0.0.1'}"
+        if isinstance(self.storage, MemoryTokenBuckets):
+            retry_after = check_limits(self.storage, scope, key, limits)
+        else:
+            # Redis-клиент синхронный — не блокируем цикл событий
+            retry_after = await asyncio.to_thread(check_limits, self.storage, scope, key, limits)
+        if retry_after > 0:
+            return JSONResponse({"error": "rate_limited"}, 429, headers={"Retry-After": retry_after_header(retry_after)})
+        return None
+
+    def _wrap(self, fn, scope: str, limits: list[tuple[int, int]]):
+        @wraps(fn)
+        async def wrapper(request: Request):
+            rejected = await self._check(request, scope, limits)
+            return rejected if rejected is not None else await fn(request)
+
+        return wrapper
+
+    def limit(self, spec: str):
+        """Декоратор: @limiter.limit("45 per minute")"""
+
+        def decorator(fn):
+            return self._wrap(fn, *self._register(fn, spec))
+
+        return decorator
+
+    def with_defaults(self, fn):
+        """Эндпоинт с default_limits, если у него нет limit() и он не exempt() (before_request в web.py)"""
+        scope = self._default_scope(fn.__name__)
+        return fn if scope is None else self._wrap(fn, scope, self.default_limits)
+
+
+limiter = AsyncRateLimiter(
+    default_limits=["180 per minute"],
+    storage_uri=os.environ.get("RATE_LIMIT_STORAGE_URI", "memory://").strip(),
+)
+
+
+def _unauthorized(message: str = "Откройте мини‑апп из Telegram.") -> JSONResponse:
+    return JSONResponse({"success": False, "error": "unauthorized", "message": message}, 401)
+
+
+def _runtime(request: Request) -> "Runtime":
+    return request.app.state.runtime
+
+
+# -------------------- HTTP API --------------------
+
+async def root(request: Request) -> Response:
+    return PlainTextResponse("Backend работает ✅")
+
+
+@limiter.limit("45 per minute")
+async def http_update_status(request: Request) -> Response:
+    try:
+        user_id = await get_authenticated_telegram_user_id(request)
+        if user_id is None:
+            return _unauthorized("Откройте мини‑апп из Telegram или обновите страницу.")
+
+        payload = await _json_body(request) or {}
+        status = payload.get("status")
+        if status not in STATUSES:
+            return JSONResponse({"success": False, "error": "Invalid data"}, 400)
+
+        now = datetime.now(timezone.utc)
+        saved_timer_seconds = await async_db.run_sync(
+            set_status, user_id, status,
+            username=payload.get("username"), timer_seconds=payload.get("timer_seconds"), now=now,
+        )
+        if saved_timer_seconds is None:
+            return JSONResponse({"success": False, "error": "contact_required"}, 400)
+
+        scheduler = _runtime(request).scheduler
+        scheduler.cancel_all_jobs_for_user(user_id)
+        if status == STATUS_AWAY:
+            logger.info("🚶 Пользователь user_id=%s переключился в статус 'не дома'", user_id)
+            scheduler.schedule_sequence_for_user(user_id, saved_timer_seconds, int(now.timestamp()))
+        else:
+            logger.info("🏠 Пользователь user_id=%s переключился в статус 'дома'", user_id)
+        return JSONResponse({"success": True})
+    except Exception as e:
+        logger.exception("Ошибка /status: %s", e)
+        return JSONResponse({"success": False, "error": "Internal Server Error"}, 500)
+
+
+@limiter.limit("90 per minute")
+async def http_get_status(request: Request) -> Response:
+    try:
+        user_id = await get_authenticated_telegram_user_id(request)
+        if user_id is None:
+            return JSONResponse({"error": "unauthorized"}, 401)
+        return JSONResponse(await async_db.run_sync(status_snapshot, user_id))
+    except Exception as e:
+        logger.exception("❌ Ошибка GET /status: %s", e)
+        return JSONResponse({"error": "Internal server error"}, 500)
+
+
+@limiter.limit("60 per minute")
+async def http_update_contact(request: Request) -> Response:
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return _unauthorized()
+    if request.method == "POST":
+        contact = normalize_contact((await _json_body(request) or {}).get("contact"))
+        if contact is None:
+            return JSONResponse({"success": False, "error": "Invalid contact"}, 400)
+        await async_db.run_sync(set_emergency_contact, user_id, contact)
+        return JSONResponse({"success": True})
+    return JSONResponse({"emergency_contact": await async_db.run_sync(get_emergency_contact, user_id)})
+
+
+@limiter.limit("60 per minute")
+async def http_timer(request: Request) -> Response:
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return _unauthorized()
+    if request.method == "POST":
+        timer_seconds, error = parse_timer_seconds((await _json_body(request) or {}).get("timer_seconds"))
+        if error:
+            return JSONResponse({"success": False, "error": error}, 400)
+        await async_db.run_sync(set_timer, user_id, timer_seconds)
+        return JSONResponse({"success": True})
+    return JSONResponse({"timer_seconds": await async_db.run_sync(get_timer, user_id)})
+
+
+def _user_stats(db, user_id: int) -> dict:
+    return stats_to_dict(db.get(UserStats, user_id))
+
+
+@limiter.limit("60 per minute")
+async def http_stats(request: Request) -> Response:
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return JSONResponse({"error": "unauthorized"}, 401)
+    try:
+        return JSONResponse(await async_db.run_sync(_user_stats, user_id))
+    except Exception as e:
+        logger.exception("❌ Ошибка GET /stats: %s", e)
+        return JSONResponse({"error": "Internal server error"}, 500)
+
+
+def _create_group_for(db, user_id: int, name: str) -> dict:
+    get_or_create_user(db, user_id)  # Создатель должен существовать в users, чтобы попасть в статус группы
+    return create_group(db, user_id, name)
+
+
+def _join_group_for(db, user_id: int, invite_code: str) -> dict:
+    get_or_create_user(db, user_id)
+    return join_group(db, user_id, invite_code)
+
+
+@limiter.limit("30 per minute")
+async def http_groups(request: Request) -> Response:
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return _unauthorized()
+    if request.method == "POST":
+        name = (await _json_body(request) or {}).get("name")
+        if not isinstance(name, str) or not name.strip() or len(name.strip()) > 64:
+            return JSONResponse({"success": False, "error": "Invalid name"}, 400)
+        group = await async_db.run_sync(_create_group_for, user_id, name.strip())
+        return JSONResponse({"success": True, **group}, 201)
+    return JSONResponse({"groups": await async_db.run_sync(list_user_groups, user_id)})
+
+
+@limiter.limit("20 per minute")
+async def http_join_group(request: Request) -> Response:
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return _unauthorized()
+    invite_code = (await _json_body(request) or {}).get("invite_code")
+    if not isinstance(invite_code, str) or not invite_code.strip():
+        return JSONResponse({"success": False, "error": "Invalid invite_code"}, 400)
+    try:
+        group = await async_db.run_sync(_join_group_for, user_id, invite_code.strip())
+    except GroupError as e:
+        return JSONResponse({"success": False, "error": e.code}, e.status)
+    return JSONResponse({"success": True, **group})
+
+
+@limiter.limit("20 per minute")
+async def http_leave_group(request: Request) -> Response:
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return _unauthorized()
+    try:
+        await async_db.run_sync(leave_group, user_id, request.path_params["group_id"])
+    except GroupError as e:
+        return JSONResponse({"success": False, "error": e.code}, e.status)
+    return JSONResponse({"success": True})
+
+
+@limiter.limit("90 per minute")
+async def http_group_status(request: Request) -> Response:
+    group_id = request.path_params["group_id"]
+    user_id = await get_authenticated_telegram_user_id(request)
+    if user_id is None:
+        return JSONResponse({"error": "unauthorized"}, 401)
+    try:
+        return JSONResponse(await async_db.run_sync(group_status, group_id, user_id))
+    except GroupError as e:
+        return JSONResponse({"error": e.code}, e.status)
+    except Exception as e:
+        logger.exception("❌ Ошибка GET /groups/%s/status: %s", group_id, e)
+        return JSONResponse({"error": "Internal server error"}, 500)
+
+
+def _users_snapshot(db) -> dict:
+    return {str(user.user_id): user.to_dict() for user in db.query(User).all()}
+
+
+@limiter.limit("10 per minute")
+async def http_debug(request: Request) -> Response:
+    secret = os.environ.get("DEBUG_SECRET", "").strip()
+    if not secret or request.headers.get("X-Debug-Secret", "").strip() != secret:
+        return JSONResponse({"error": "not found"}, 404)
+    runtime = _runtime(request)
+    try:
+        return JSONResponse({
+            "user_data": await async_db.run_sync(_users_snapshot),
+            "jobs_keys": runtime.scheduler.jobs_keys(),
+            "scheduler_cold_start": cold_start,
+            "telegram_breaker": runtime.telegram.breaker.state,
+            "db_pools": async_db.async_pools_snapshot(),
+            "tasks": len(asyncio.all_tasks()),
+        })
+    except Exception as e:
+        logger.exception("Ошибка /debug: %s", e)
+        return JSONResponse({"error": "debug failed"}, 500)
+
+
+async def telegram_webhook(request: Request) -> Response:
+    """Апдейты Telegram в режиме webhook: в очередь Application, обработка — в том же цикле"""
+    from telegram import Update
+
+    supplied = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(supplied.encode(), _webhook_secret().encode()):
+        return Response(status_code=403)
+    application = _runtime(request).bot
+    if application is None:
+        return Response(status_code=503)
+    try:
+        data = await request.json()
+    except ValueError:  # JSONDecodeError, UnicodeDecodeError: пустое или битое тело
+        return Response(status_code=400)
+    if not isinstance(data, dict):
+        return Response(status_code=400)
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return Response(status_code=200)
+
+
+def _miniapp_route(index):
+    """Раздача собранного мини‑аппа: те же варианты, ETag и Cache-Control, что в static_files.py"""
+
+    async def miniapp_static(request: Request) -> Response:
+        asset = resolve_asset(index, request.path_params.get("filename") or "index.html")
+        if asset is None:
+            return PlainTextResponse("Not Found", 404)
+        path, encoding = select_variant(asset, request.headers.get("accept-encoding", ""))
+        etag = f'"{asset_etag(asset, encoding)}"'
+        headers = asset_headers(asset, encoding) | {"ETag": etag}
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type=asset.mimetype, headers=headers)
+
+    return miniapp_static
+
+
+# -------------------- Фоновые задачи и остановка --------------------
+
+class Runtime:
+    """Задачи рантайма в цикле событий: планировщик, outbox, обслуживание журнала и бот"""
+
+    def __init__(self):
+        self.scheduler = AsyncScheduler()
+        self.telegram = AsyncTelegramClient(get_bot_token())
+        self.bot = None
+        self._outbox_stop = asyncio.Event()
+        self._outbox_task: asyncio.Task | None = None
+        self._maintenance_task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self.scheduler.start()
+        self._outbox_task = asyncio.create_task(
+            run_outbox_worker_async(self.telegram.send_message, self._outbox_stop), name="outbox"
+        )
+        self._maintenance_task = asyncio.create_task(self._partition_maintenance(), name="partitions")
+        await self._start_bot()
+        logger.info("✅ ASGI-рантайм запущен: HTTP API, планировщик, outbox и бот в одном цикле событий")
+
+    async def _partition_maintenance(self) -> None:
+        while True:
+            await ensure_partitions_async()
+            await asyncio.sleep(STATUS_EVENTS_MAINTENANCE_INTERVAL)
+
+    async def _start_bot(self) -> None:
+        if not TELEGRAM_WEBHOOK_URL and not env_flag("RUN_BOT_POLLING", "1"):
+            logger.info("⏸️ Бот не запускается: нет TELEGRAM_WEBHOOK_URL, RUN_BOT_POLLING=0")
+            return
+        from telegram import Update
+        from telegram.error import Conflict
+
+        from bot import build_application
+
+        application = build_application(run_db=async_db.run_sync)
+        await application.initialize()
+        await application.start()
+        self.bot = application
+        if TELEGRAM_WEBHOOK_URL:
+            await application.bot.set_webhook(
+                TELEGRAM_WEBHOOK_URL,
+                secret_token=_webhook_secret(),
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+            )
+            logger.info("🤖 Бот принимает апдейты через webhook: %s", TELEGRAM_WEBHOOK_URL)
+            return
+        try:
+            await application.updater.start_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+            logger.info("🤖 Polling бота запущен в цикле событий ASGI")
+        except Conflict as e:
+            # Как в bot.py: при деплое старый экземпляр еще держит getUpdates
+            logger.warning("⚠️ Conflict 409 при запуске polling: %s. Это нормально при деплое.", e)
+
+    async def _stop_bot(self) -> None:
+        application, self.bot = self.bot, None
+        if application is None:
+            return
+        # Новые апдейты не принимаются; уже полученные Application обрабатывает до остановки
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+
+    async def stop(self) -> None:
+        """Graceful drain: бот → этапы планировщика → готовые сообщения outbox → клиенты и пулы"""
+        logger.info("⏹️ Остановка ASGI-рантайма (до %s сек на шаг)", ASGI_DRAIN_TIMEOUT)
+        try:
+            await asyncio.wait_for(self._stop_bot(), ASGI_DRAIN_TIMEOUT)
+        except Exception as e:
+            logger.warning("⚠️ Бот остановлен с ошибкой: %s", e)
+        await self.scheduler.stop(ASGI_DRAIN_TIMEOUT)
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+        if self._outbox_task is not None:
+            self._outbox_stop.set()
+            done, _ = await asyncio.wait({self._outbox_task}, timeout=ASGI_DRAIN_TIMEOUT)
+            if not done:
+                # Захваченные строки будут отправлены повторно после OUTBOX_CLAIM_TTL
+                logger.warning("⏱️ Outbox не опустел за %s сек, дрейнер остановлен", ASGI_DRAIN_TIMEOUT)
+                self._outbox_task.cancel()
+                await asyncio.gather(self._outbox_task, return_exceptions=True)
+        await self.telegram.aclose()
+        await async_db.dispose_async_engines()
+        logger.info("✅ ASGI-рантайм остановлен")
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    # Миграции схемы БД (MIGRATE_ON_STARTUP=0 — если они применяются отдельно: python migrate.py).
+    # Выполняются синхронно до запуска задач: цикл событий в этот момент еще ничего не обслуживает.
+    if env_flag("MIGRATE_ON_STARTUP", "1"):
+        init_db()
+        get_engine(DB_ROLE_BULK).dispose()
+    runtime = Runtime()
+    app.state.runtime = runtime
+    await runtime.start()
+    try:
+        yield
+    finally:
+        await runtime.stop()
+
+
+def _route(path: str, endpoint, **kwargs) -> Route:
+    return Route(path, limiter.with_defaults(endpoint), **kwargs)
+
+
+def create_app() -> Starlette:
+    routes = [
+        _route("/", root),
+        _route("/status", http_update_status, methods=["POST"]),
+        _route("/status", http_get_status, methods=["GET"]),
+        _route("/contact", http_update_contact, methods=["POST", "GET"]),
+        _route("/timer", http_timer, methods=["POST", "GET"]),
+        _route("/stats", http_stats, methods=["GET"]),
+        _route("/groups", http_groups, methods=["POST", "GET"]),
+        _route("/groups/join", http_join_group, methods=["POST"]),
+        _route("/groups/{group_id:int}/leave", http_leave_group, methods=["POST"]),
+        _route("/groups/{group_id:int}/status", http_group_status, methods=["GET"]),
+        _route("/debug", http_debug, methods=["GET"]),
+        _route(TELEGRAM_WEBHOOK_PATH, telegram_webhook, methods=["POST"]),
+    ]
+    index = load_miniapp_index()
+    if index is not None:
+        # Как register_miniapp в web.py: статика не расходует лимит API
+        miniapp_static = limiter.exempt(_miniapp_route(index))
+        routes += [
+            _route(f"{MINIAPP_URL_PREFIX}/", miniapp_static, methods=["GET", "HEAD"]),
+            _route(f"{MINIAPP_URL_PREFIX}/{{filename:path}}", miniapp_static, methods=["GET", "HEAD"]),
+        ]
+    middleware = [
+        Middleware(
+            CORSMiddleware,
+            allow_origins=cors_allowed_origins(),
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type", INIT_DATA_HEADER, "X-Telegram-Web-App-Init-Data", "Authorization"],
+        )
+    ]
+    return Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", 5000)),
+        timeout_graceful_shutdown=int(ASGI_DRAIN_TIMEOUT) * 2,
+    )
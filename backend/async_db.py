@@ -0,0 +1,124 @@
+"""
+Асинхронный доступ к БД для ASGI-рантайма (asgi.py).
+
+Те же роли пулов, что и в models.py (request / scheduler / bulk), с теми же
+настройками DB_*; драйвер — asyncpg для PostgreSQL и aiosqlite для SQLite.
+Доменный код (users.py, groups.py, events.py, scheduler.execute_stage, outbox.claim_rows)
+остается синхронным и выполняется через AsyncSession.run_sync: SQLAlchemy переключает
+его ввод-вывод на цикл событий через greenlet, без потоков.
+
+asyncpg, aiosqlite и greenlet — необязательные зависимости, нужны только asgi.py
+(requirements-optional.txt).
+"""
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import DB_ROLE_REQUEST, PRE_PING_ALWAYS, get_database_url, get_db_pool_settings
+from db_metrics import instrument_engine, pools_snapshot
+
+logger = logging.getLogger(__name__)
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+_engines = {}
+_sessionmakers = {}
+
+
+def async_database_url() -> tuple[str, dict]:
+    """DATABASE_URL с асинхронным драйвером и connect_args, которые нельзя передать в URL"""
+    url = make_url(get_database_url())
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"Нет асинхронного драйвера для {backend!r}")
+    url = url.set(drivername=_ASYNC_DRIVERS[backend])
+    connect_args = {}
+    if backend == "postgresql" and "sslmode" in url.query:
+        # libpq-параметр из DATABASE_URL Render; asyncpg принимает тот же режим как ssl
+        connect_args["ssl"] = url.query["sslmode"]
+        url = url.difference_update_query(["sslmode"])
+    return url.render_as_string(hide_password=False), connect_args
+
+
+def _create_engine_for_role(role: str):
+    url, connect_args = async_database_url()
+    settings = get_db_pool_settings(role)
+    kwargs = {"pool_pre_ping": settings["pre_ping"] == PRE_PING_ALWAYS}
+    if url.startswith("sqlite"):
+        engine = create_async_engine(url, **kwargs)
+        instrument_engine(engine.sync_engine, f"async:{role}", 0, settings["saturation_warn_ratio"])
+        return engine
+    server_settings = {"application_name": settings["application_name"]}
+    if settings["statement_timeout_ms"] > 0:
+        server_settings["statement_timeout"] = str(settings["statement_timeout_ms"])
+    connect_args["server_settings"] = server_settings
+    engine = create_async_engine(
+        url,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        pool_recycle=settings["pool_recycle"],
+        pool_use_lifo=True,
+        connect_args=connect_args,
+        **kwargs,
+    )
+    instrument_engine(
+        engine.sync_engine,
+        f"async:{role}",
+        settings["pool_size"] + settings["max_overflow"],
+        settings["saturation_warn_ratio"],
+    )
+    logger.info("🗄️ Асинхронный пул БД %s: pool_size=%s, max_overflow=%s, statement_timeout=%s мс",
+                role, settings["pool_size"], settings["max_overflow"], settings["statement_timeout_ms"])
+    return engine
+
+
+def get_async_engine(role: str = DB_ROLE_REQUEST):
+    """Возвращает асинхронный engine роли, создавая его при первом вызове.
+
+    Блокировка не нужна: engine создается синхронно внутри одного цикла событий.
+    """
+    engine = _engines.get(role)
+    if engine is None:
+        engine = _create_engine_for_role(role)
+        _engines[role] = engine
+        _sessionmakers[role] = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    return engine
+
+
+@asynccontextmanager
+async def get_async_session(role: str = DB_ROLE_REQUEST):
+    """Асинхронный аналог models.get_db_session: коммит при выходе, откат при ошибке"""
+    get_async_engine(role)
+    session: AsyncSession = _sessionmakers[role]()
+    try:
+        yield session
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def run_sync(fn: Callable, *args, role: str = DB_ROLE_REQUEST, **kwargs):
+    """Выполняет fn(db, *args, **kwargs) с синхронной Session в одной транзакции"""
+    async with get_async_session(role) as session:
+        return await session.run_sync(lambda db: fn(db, *args, **kwargs))
+
+
+def async_pools_snapshot() -> dict:
+    """Телеметрия асинхронных пулов (для /debug)"""
+    return pools_snapshot({f"async:{role}": engine.sync_engine for role, engine in _engines.items()})
+
+
+async def dispose_async_engines() -> None:
+    """Закрывает соединения всех пулов (при остановке рантайма)"""
+    for role, engine in list(_engines.items()):
+        await engine.dispose()
+        logger.info("🗄️ Асинхронный пул БД %s закрыт", role)
+    _engines.clear()
+    _sessionmakers.clear()
@@ -0,0 +1,172 @@
+"""
+Объем и оценка времени первого открытия мини‑аппа.
+
+Запуск из каталога backend после python build_static.py:
+    python benchmarks/bench_first_open.py [--src ../Frontend/build] [--runs 20]
+
+Сравнивает:
+- «до» — сборка CRA как есть (TTF, без сжатия), как ее отдает любой статический хостинг
+  без настройки;
+- «после» — раздача static_files.py (WOFF2-подмножества, .br/.gz), запросы идут
+  через Flask test client с Accept-Encoding: br, gzip.
+Первое открытие — index.html и все, на что он ссылается (скрипты, стили, шрифты,
+в том числе из url() в CSS). Время передачи оценивается моделью сети:
+RTT на каждый уровень зависимостей + объем / пропускная способность.
+Повторное открытие: index.html отвечает 304, остальное берется из кеша (immutable).
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("BOT_TOKEN", "0:first-open-bench")
+
+# Профили сети: (название, Мбит/с, RTT мс) — пресеты throttling Chrome DevTools
+NETWORKS = (("Slow 3G", 0.4, 400), ("Fast 3G", 1.6, 150), ("4G", 9.0, 60))
+
+_HTML_REF_RE = re.compile(r"""(?:src|href)=["']([^"']+)["']""")
+_CSS_URL_RE = re.compile(r"""url\(["']?([^"')]+)["']?\)""")
+
+
+def _references(body: str, content_type: str) -> list[str]:
+    found = []
+    if "html" in content_type:
+        found += [ref for ref in _HTML_REF_RE.findall(body) if not ref.startswith(("http:", "https:", "//", "#"))]
+    if "html" in content_type or "css" in content_type:
+        found += [ref for ref in _CSS_URL_RE.findall(body) if not ref.startswith(("data:", "http:", "https:"))]
+    return found
+
+
+def _local_path(root: str, referrer: str, ref: str) -> str | None:
+    """Путь к файлу сборки по ссылке (абсолютной с PUBLIC_URL или относительной)"""
+    ref = ref.split("?", 1)[0].split("#", 1)[0]
+    if not ref.startswith("/"):
+        candidate = os.path.normpath(os.path.join(os.path.dirname(referrer), ref))
+        return candidate if os.path.isfile(candidate) else None
+    parts = [part for part in ref.split("/") if part]
+    for skip in range(len(parts)):
+        candidate = os.path.join(root, *parts[skip:])
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def crawl_raw(root: str) -> list[tuple[str, int, int]]:
+    """(путь, байт, уровень) для сборки без оптимизаций"""
+    seen, result = set(), []
+    queue = [(os.path.join(root, "index.html"), 1)]
+    while queue:
+        path, depth = queue.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        result.append((os.path.relpath(path, root), os.path.getsize(path), depth))
+        if path.endswith((".html", ".css")):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                body = f.read()
+            for ref in _references(body, "html" if path.endswith(".html") else "css"):
+                target = _local_path(root, path, ref)
+                if target is not None:
+                    queue.append((target, depth + 1))
+    return result
+
+
+def crawl_served(client, prefix: str) -> tuple[list[tuple[str, int, int]], float]:
+    """(URL, байт на проводе, уровень) через Flask и суммарное время обработки, мс"""
+    headers = {"Accept-Encoding": "br, gzip"}
+    seen, result, server_ms = set(), [], 0.0
+    queue = [(f"{prefix}/", 1)]
+    while queue:
+        url, depth = queue.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        data = response.get_data()  # Сжатое тело — ровно то, что уйдет по сети
+        server_ms += (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            print(f"⚠️ {url}: {response.status_code}", file=sys.stderr)
+            continue
+        result.append((url, len(data), depth))
+        content_type = response.headers.get("Content-Type", "")
+        if "html" in content_type or "css" in content_type:
+            body = _decode(data, response.headers.get("Content-Encoding"))
+            base = url if url.endswith("/") else url.rsplit("/", 1)[0] + "/"
+            for ref in _references(body, content_type):
+                absolute = ref if ref.startswith("/") else os.path.normpath(base + ref)
+                queue.append((absolute, depth + 1))
+    return result, server_ms
+
+
+def _decode(data: bytes, encoding: str | None) -> str:
+    if encoding == "br":
+        import brotli
+        data = brotli.decompress(data)
+    elif encoding == "gzip":
+        import gzip
+        data = gzip.decompress(data)
+    return data.decode("utf-8", errors="replace")
+
+
+def modeled_ms(files: list[tuple[str, int, int]], mbit: float, rtt_ms: float) -> float:
+    depth = max((d for _, _, d in files), default=0)
+    total_bytes = sum(size for _, size, _ in files)
+    return depth * rtt_ms + total_bytes * 8 / (mbit * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", default=os.path.join(BACKEND_DIR, "..", "Frontend", "build"))
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    import static_files
+    from web import app
+
+    if static_files.MINIAPP_URL_PREFIX + "/" not in {rule.rule for rule in app.url_map.iter_rules()}:
+        raise SystemExit(f"Раздача не собрана: {static_files.STATIC_DIST_DIR} (python build_static.py)")
+    client = app.test_client()
+
+    before = crawl_raw(os.path.abspath(args.src))
+    after, _ = crawl_served(client, static_files.MINIAPP_URL_PREFIX)
+    server_samples = [crawl_served(client, static_files.MINIAPP_URL_PREFIX)[1] for _ in range(args.runs)]
+    revalidate = client.get(f"{static_files.MINIAPP_URL_PREFIX}/", headers={
+        "Accept-Encoding": "br, gzip",
+        "If-None-Match": client.get(f"{static_files.MINIAPP_URL_PREFIX}/",
+                                    headers={"Accept-Encoding": "br, gzip"}).headers["ETag"],
+    })
+
+    def kb(n: int) -> str:
+        return f"{n / 1024:.1f}"
+
+    print("## Файлы первого открытия\n")
+    print("| Сборка | Файл | КБ | Уровень |")
+    print("|---|---|---:|---:|")
+    for label, files in (("до", before), ("после", after)):
+        for name, size, depth in files:
+            print(f"| {label} | `{name}` | {kb(size)} | {depth} |")
+
+    total_before = sum(size for _, size, _ in before)
+    total_after = sum(size for _, size, _ in after)
+    print("\n## Итого\n")
+    print("| | До | После |")
+    print("|---|---:|---:|")
+    print(f"| Файлов | {len(before)} | {len(after)} |")
+    print(f"| Объем, КБ | {kb(total_before)} | {kb(total_after)} |")
+    for name, mbit, rtt in NETWORKS:
+        print(f"| {name} ({mbit} Мбит/с, RTT {rtt} мс), мс | {modeled_ms(before, mbit, rtt):.0f} | "
+              f"{modeled_ms(after, mbit, rtt):.0f} |")
+    print(f"\nОбработка всех запросов первого открытия во Flask: медиана "
+          f"{statistics.median(server_samples):.2f} мс (запусков: {args.runs}).")
+    print(f"Повторное открытие: index.html → {revalidate.status_code}, "
+          f"{len(revalidate.get_data())} байт тела; остальные файлы — из кеша (immutable).")
+
+
+if __name__ == "__main__":
+    main()
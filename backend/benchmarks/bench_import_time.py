@@ -0,0 +1,70 @@
+"""
+Профиль времени импорта точек входа.
+
+Запуск из каталога backend:
+    python benchmarks/bench_import_time.py [--runs 7] [модуль ...]
+
+Каждый импорт выполняется в новом интерпретаторе (холодный старт процесса, но с
+прогретым кешем ФС и .pyc). Выводит медиану времени импорта и самые дорогие
+пакеты верхнего уровня по данным `python -X importtime`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["web", "worker", "bot", "app"]
+
+_ENV = {
+    **os.environ,
+    # Импорт не должен требовать настоящих секретов и БД
+    "DATABASE_URL": os.environ.get("DATABASE_URL", "sqlite:///:memory:"),
+    "BOT_TOKEN": os.environ.get("BOT_TOKEN", "0:import-time-profile"),
+}
+
+
+def _wall_ms(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=_ENV,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _top_packages(module: str, limit: int) -> list[tuple[str, float]]:
+    """Прямые зависимости модуля (уровень вложенности 1), сгруппированные по пакету верхнего уровня"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=BACKEND_DIR,
+                         env=_ENV, capture_output=True, text=True, check=True)
+    totals: dict[str, float] = defaultdict(float)
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name_field = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name_field) - len(name_field.lstrip()) - 1) // 2
+        if depth == 1:
+            totals[name_field.strip().split(".")[0]] += int(cumulative) / 1000
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"Python {sys.version.split()[0]}, запусков на модуль: {args.runs}\n")
+    print("| Точка входа | Медиана, мс | Мин, мс | Самые дорогие пакеты (мс) |")
+    print("|---|---:|---:|---|")
+    for module in args.modules:
+        samples = [_wall_ms(module) for _ in range(args.runs)]
+        top = ", ".join(f"{name} {ms:.0f}" for name, ms in _top_packages(module, args.top))
+        print(f"| `{module}` | {statistics.median(samples):.0f} | {min(samples):.0f} | {top} |")
+
+
+if __name__ == "__main__":
+    main()
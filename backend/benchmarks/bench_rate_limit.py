@@ -0,0 +1,78 @@
+"""
+Бенчмарк накладных расходов rate limiter'а на запрос.
+
+Запуск из каталога backend:
+    python benchmarks/bench_rate_limit.py
+
+Меряет:
+- MemoryTokenBuckets.hit() для одного «горячего» ключа и для 100k разных пользователей;
+- полный путь RateLimiter._check() внутри контекста Flask-запроса (ключ + jsonify при отказе не попадает).
+"""
+import os
+import sys
+import time
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from rate_limit import MemoryTokenBuckets, RateLimiter  # noqa: E402
+
+N = 200_000
+
+
+def _report(name: str, calls: int, seconds: float) -> None:
+    print(f"{name:<42} {seconds / calls * 1e9:8.0f} нс/вызов  ({calls / seconds:,.0f} вызовов/сек)")
+
+
+def bench_hot_key() -> None:
+    storage = MemoryTokenBuckets()
+    started = time.perf_counter()
+    for _ in range(N):
+        storage.hit("status:45/60:tg:1", 10**9, 60)
+    _report("memory: один ключ", N, time.perf_counter() - started)
+
+
+def bench_many_users() -> None:
+    storage = MemoryTokenBuckets()
+    keys = [f"status:45/60:tg:{i}" for i in range(100_000)]
+    started = time.perf_counter()
+    for i in range(N):
+        storage.hit(keys[i % len(keys)], 45, 60)
+    _report("memory: 100k пользователей", N, time.perf_counter() - started)
+
+
+def bench_threads(threads: int = 8) -> None:
+    storage = MemoryTokenBuckets()
+    per_thread = N // threads
+
+    def worker(offset: int) -> None:
+        for i in range(per_thread):
+            storage.hit(f"tg:{(offset + i) % 1000}", 10**9, 60)
+
+    pool = [Thread(target=worker, args=(t * 7919,)) for t in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    _report(f"memory: {threads} потоков", per_thread * threads, time.perf_counter() - started)
+
+
+def bench_request_path() -> None:
+    app = Flask(__name__)
+    limiter = RateLimiter(lambda: "tg:1", app=app, storage_uri="memory://")
+    limits = [(10**9, 60)]
+    with app.test_request_context("/status"):
+        started = time.perf_counter()
+        for _ in range(N):
+            limiter._check("http_get_status", limits)
+        _report("RateLimiter._check в контексте запроса", N, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    bench_hot_key()
+    bench_many_users()
+    bench_threads()
+    bench_request_path()
@@ -0,0 +1,290 @@
+"""
+Сравнение рантаймов: потоковый (app.py) и однопоточный ASGI (asgi.py).
+
+Запуск из каталога backend:
+    python benchmarks/bench_runtime.py [--pending 2000] [--due 200] [--requests 4000] [--concurrency 64]
+
+Для каждого рантайма бенчмарк:
+1. создает свежую SQLite-базу (или использует BENCH_DATABASE_URL) с --pending пользователями
+   «не дома», чьи таймеры еще не истекли, и --due пользователями с уже истекшим таймером;
+2. поднимает заглушку Bot API в этом процессе (TELEGRAM_API_BASE) — сообщения никуда не уходят;
+3. запускает рантайм отдельным процессом (RUN_BOT_POLLING=0, бот не нужен) и меряет:
+   - время до доставки первого напоминания всем --due пользователям (reconcile + outbox);
+   - RSS и число потоков ОС из /proc/<pid>/status после старта и пиковый RSS после нагрузки;
+   - пропускную способность и задержки GET /status с подписанным initData
+     (запросы распределены по пользователям, чтобы не упираться в лимит 90/мин);
+   - время остановки по SIGTERM.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BOT_TOKEN = "0:runtime-bench"
+RUNTIMES = {
+    "threaded (app.py)": [sys.executable, "app.py"],
+    "asgi (asgi.py)": [sys.executable, "asgi.py"],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StubBotApi:
+    """Заглушка sendMessage: считает доставленные сообщения по chat_id"""
+
+    def __init__(self):
+        self.delivered: set[int] = set()
+        self.count = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub._lock:
+                    stub.count += 1
+                    stub.delivered.add(int(body.get("chat_id", 0)))
+                out = b'{"ok":true,"result":{}}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", _free_port()), Handler)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.delivered.clear()
+            self.count = 0
+
+
+def _due_ids(due: int) -> list[int]:
+    return list(range(1_000_001, 1_000_001 + due))
+
+
+def prepare_database(pending: int, due: int) -> None:
+    """Схема и пользователи в DATABASE_URL (выполняется в отдельном процессе: engine models
+    привязывается к URL при первом обращении)"""
+    from models import OutboxMessage, User, get_db_session, init_db
+
+    init_db()
+    now = datetime.now(timezone.utc)
+    due_ids = _due_ids(due)
+    with get_db_session() as db:
+        db.query(OutboxMessage).delete()
+        db.query(User).delete()
+        rows = [
+            User(user_id=uid, chat_id=uid, status="не дома", timer_seconds=3600,
+                 left_home_time=now, emergency_contact_username="@friend", warnings_sent=0)
+            for uid in range(1, pending + 1)
+        ]
+        rows += [
+            User(user_id=uid, chat_id=uid, status="не дома", timer_seconds=60,
+                 left_home_time=now - timedelta(seconds=120), emergency_contact_username="@friend",
+                 warnings_sent=0)
+            for uid in due_ids
+        ]
+        db.add_all(rows)
+
+
+def init_data(user_id: int) -> str:
+    fields = {"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id})}
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    secret_key = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields, quote_via=urllib.parse.quote)
+
+
+def proc_status(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM", "Threads"):
+                values[key] = int(value.split()[0])
+    return values
+
+
+async def load(base_url: str, users: int, requests: int, concurrency: int) -> tuple[float, list[float], int]:
+    import httpx
+
+    headers = [{"X-Telegram-Init-Data": init_data(uid)} for uid in range(1, users + 1)]
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                response = await client.get("/status", headers=headers[i % users])
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, errors
+
+
+def _wait_http(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Рантайм завершился с кодом {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    raise SystemExit(f"Рантайм не ответил за {timeout} сек: {url}")
+
+
+def run_one(name: str, command: list[str], args, stub: StubBotApi, db_url: str) -> dict:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=db_url,
+        BOT_TOKEN=BOT_TOKEN,
+        TELEGRAM_API_BASE=stub.base,
+        PORT=str(port),
+        RUN_BOT_POLLING="0",
+        MIGRATE_ON_STARTUP="0",
+    )
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--prepare", "--pending", str(args.pending), "--due", str(args.due)],
+        cwd=BACKEND_DIR, env=env, check=True,
+    )
+    due_ids = _due_ids(args.due)
+    stub.reset()
+    log = tempfile.TemporaryFile()
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        _wait_http(base_url + "/", process)
+        ready_s = time.perf_counter() - started
+
+        expected = set(due_ids)
+        while not expected <= stub.delivered:
+            if time.perf_counter() - started > 120:
+                raise SystemExit(f"{name}: доставлено {len(expected & stub.delivered)} из {len(expected)}")
+            time.sleep(0.02)
+        due_s = time.perf_counter() - started
+        time.sleep(1)  # Дать планировщику закончить реконсиляцию таймеров
+        idle = proc_status(process.pid)
+
+        elapsed, latencies, errors = asyncio.run(
+            load(base_url, args.pending, args.requests, args.concurrency)
+        )
+        loaded = proc_status(process.pid)
+
+        stop_started = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+        stop_s = time.perf_counter() - stop_started
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        log.seek(0)
+        tracebacks = log.read().count(b"Traceback")
+        log.close()
+
+    latencies.sort()
+    return {
+        "name": name,
+        "ready_s": ready_s,
+        "due_s": due_s,
+        "rss_idle_mb": idle["VmRSS"] / 1024,
+        "threads_idle": idle["Threads"],
+        "rss_peak_mb": loaded["VmHWM"] / 1024,
+        "threads_loaded": loaded["Threads"],
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "errors": errors,
+        "stop_s": stop_s,
+        "tracebacks": tracebacks,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pending", type=int, default=2000, help="Пользователей «не дома» с активным таймером")
+    parser.add_argument("--due", type=int, default=200, help="Пользователей с уже истекшим таймером")
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--only", choices=("threaded", "asgi"))
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.prepare:
+        prepare_database(args.pending, args.due)
+        return
+
+    stub = StubBotApi()
+    workdir = tempfile.mkdtemp(prefix="bench_runtime_")
+    results = []
+    for name, command in RUNTIMES.items():
+        if args.only and not name.startswith(args.only):
+            continue
+        db_url = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{workdir}/{name.split()[0]}.db"
+        results.append(run_one(name, command, args, stub, db_url))
+
+    print(f"Пользователей с активным таймером: {args.pending}, с истекшим: {args.due}; "
+          f"GET /status: {args.requests} запросов, параллельно {args.concurrency}\n")
+    print("| | " + " | ".join(r["name"] for r in results) + " |")
+    print("|---|" + "---:|" * len(results))
+    rows = (
+        ("Старт до ответа GET /, сек", "ready_s", "{:.2f}"),
+        (f"Первое напоминание всем {args.due} просроченным, сек", "due_s", "{:.2f}"),
+        ("RSS после старта, МБ", "rss_idle_mb", "{:.1f}"),
+        ("Потоков ОС после старта", "threads_idle", "{}"),
+        ("Пиковый RSS под нагрузкой, МБ", "rss_peak_mb", "{:.1f}"),
+        ("Потоков ОС под нагрузкой", "threads_loaded", "{}"),
+        ("GET /status, запросов/сек", "rps", "{:.0f}"),
+        ("p50, мс", "p50_ms", "{:.1f}"),
+        ("p99, мс", "p99_ms", "{:.1f}"),
+        ("Ошибок (не 200)", "errors", "{}"),
+        ("Остановка по SIGTERM, сек", "stop_s", "{:.2f}"),
+        ("Traceback в логе", "tracebacks", "{}"),
+    )
+    for label, key, fmt in rows:
+        print(f"| {label} | " + " | ".join(fmt.format(r[key]) for r in results) + " |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Холодный старт планировщика со снимком и без него.
+
+Запуск из каталога backend:
+    python benchmarks/bench_scheduler_restart.py [--pending 1000 10000 50000] [--due-soon 20] [--due-in 0.2]
+
+Для каждого числа пользователей «не дома» бенчмарк заполняет базу (SQLite во временном
+каталоге или BENCH_DATABASE_URL) и дважды запускает scheduler.AsyncScheduler:
+- без снимка — этапы появляются по мере постраничной сверки с users;
+- со снимком, записанным из того же состояния (как его оставил бы предыдущий процесс).
+--due-soon пользователей с наибольшими user_id (последняя страница сверки) должны получить
+первое напоминание через --due-in секунд после старта; меряется их опоздание.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+_workdir = tempfile.mkdtemp(prefix="bench_scheduler_")
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{_workdir}/bench.db"
+os.environ["SCHEDULER_SNAPSHOT_PATH"] = os.path.join(_workdir, "scheduler.snap")
+os.environ.setdefault("BOT_TOKEN", "0:scheduler-bench")
+
+
+def prepare(pending: int, due_soon: int) -> list[int]:
+    """Пользователи «не дома»: pending со сроком через час и due_soon (срок задает set_due_soon)"""
+    from sqlalchemy import delete, insert
+
+    from models import OutboxMessage, User, get_db_session
+
+    now = datetime.now(timezone.utc)
+    soon_ids = list(range(pending + 1, pending + due_soon + 1))
+    rows = [
+        {"user_id": uid, "chat_id": uid, "status": "не дома", "timer_seconds": 3600, "left_home_time": now,
+         "emergency_contact_username": "@friend", "warnings_sent": 0}
+        for uid in range(1, pending + 1)
+    ]
+    rows += [
+        {"user_id": uid, "chat_id": uid, "status": "не дома", "timer_seconds": 60, "left_home_time": now,
+         "emergency_contact_username": "@friend", "warnings_sent": 0}
+        for uid in soon_ids
+    ]
+    with get_db_session() as db:
+        db.execute(delete(OutboxMessage))
+        db.execute(delete(User))
+        for start in range(0, len(rows), 5000):
+            db.execute(insert(User), rows[start:start + 5000])
+    return soon_ids
+
+
+def set_due_soon(soon_ids: list[int], due_at: float) -> int:
+    """Срок rem1 = left_home_time + timer_seconds (60). Возвращает метку выхода"""
+    from sqlalchemy import update
+
+    from models import User, get_db_session
+
+    left_home_time = datetime.fromtimestamp(due_at - 60, timezone.utc)
+    with get_db_session() as db:
+        db.execute(update(User).where(User.user_id.in_(soon_ids)).values(left_home_time=left_home_time))
+    return int(left_home_time.timestamp())
+
+
+def snapshot_entries_from_db() -> list:
+    """Этапы, которые оставил бы в снимке процесс с полным набором таймеров"""
+    import scheduler
+    from models import get_db_session
+
+    entries, after = [], None
+    while True:
+        with get_db_session() as db:
+            pending, after, exhausted = scheduler.load_pending_batch(db, after, scheduler.SCHEDULER_RECONCILE_BATCH)
+        entries += [
+            (user_id, scheduler.STAGES.index(stage), due_at.timestamp(), outing)
+            for user_id, (stage, due_at, outing) in pending.items()
+        ]
+        if exhausted:
+            return entries
+
+
+async def run_scheduler(soon_ids: list[int], due_at: float) -> dict:
+    """Запускает AsyncScheduler до срабатывания всех due-soon и окончания первой сверки"""
+    import async_db
+    import scheduler
+
+    scheduler.cold_start.clear()
+    instance = scheduler.AsyncScheduler()
+    expected = {(uid, "rem1") for uid in soon_ids}
+    fired_at: dict[tuple[int, str], float] = {}
+    instance.start()
+    deadline = time.monotonic() + 300
+    while (len(fired_at) < len(expected) or not scheduler.cold_start) and time.monotonic() < deadline:
+        now = time.time()
+        for key in expected.intersection(instance._firing):
+            fired_at.setdefault(key, now)
+        await asyncio.sleep(0.001)
+    await instance.stop(timeout=10)
+    await async_db.dispose_async_engines()  # Соединения привязаны к циклу событий этого asyncio.run
+    lateness = sorted(max(0.0, fired_at.get(key, float("inf")) - due_at) for key in expected)
+    return {
+        **scheduler.cold_start,
+        "late_p50_ms": statistics.median(lateness) * 1000,
+        "late_max_ms": lateness[-1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pending", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--due-soon", type=int, default=20)
+    parser.add_argument("--due-in", type=float, default=0.2, help="Секунд от старта до срока due-soon")
+    args = parser.parse_args()
+
+    import logging
+
+    from models import init_db
+    from scheduler_snapshot import SCHEDULER_SNAPSHOT_PATH, write_snapshot
+
+    logging.basicConfig(level=logging.WARNING)
+    init_db()
+
+    print(f"Срок первого напоминания {args.due_soon} пользователей — через {args.due_in} сек после старта, "
+          f"их user_id на последней странице сверки.\n")
+    print("| Не дома | Снимок | Загрузка снимка, сек | Сверка с БД, сек | Опоздание p50, мс | Опоздание max, мс |")
+    print("|---:|---|---:|---:|---:|---:|")
+    notes = []
+    for pending in args.pending:
+        for with_snapshot in (False, True):
+            soon_ids = prepare(pending, args.due_soon)
+            if os.path.exists(SCHEDULER_SNAPSHOT_PATH):
+                os.remove(SCHEDULER_SNAPSHOT_PATH)
+            entries = snapshot_entries_from_db() if with_snapshot else None
+            due_at = time.time() + args.due_in
+            outing = set_due_soon(soon_ids, due_at)
+            if with_snapshot:
+                soon = set(soon_ids)
+                entries = [entry for entry in entries if entry[0] not in soon]
+                entries += [(uid, 0, due_at, outing) for uid in soon_ids]
+                started = time.perf_counter()
+                size = write_snapshot(entries)
+                notes.append(f"{pending + args.due_soon} не дома: снимок {size / 1024:.0f} КБ, "
+                             f"запись {(time.perf_counter() - started) * 1000:.1f} мс")
+            result = asyncio.run(run_scheduler(soon_ids, due_at))
+            print(f"| {result['pending_users']} | {'да' if with_snapshot else 'нет'} "
+                  f"| {result['snapshot_restore_seconds']:.3f} | {result['full_reconcile_seconds']:.3f} "
+                  f"| {result['late_p50_ms']:.0f} | {result['late_max_ms']:.0f} |")
+    print()
+    for note in notes:
+        print(f"- {note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Telegram-бот: обработка апдейтов (polling).
+
+Точка входа процесса-бота: python bot.py
+Только этот модуль (и asgi.py, который запускает бота в своем цикле событий)
+импортирует python-telegram-bot.
+"""
+import logging
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.error import Conflict
+
+from config import get_bot_token
+from models import get_db_session
+from users import register_bot_user
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_db_blocking(fn, *args):
+    """Синхронный доступ к БД прямо в цикле событий (отдельный процесс бота, как раньше)"""
+    with get_db_session() as db:
+        return fn(db, *args)
+
+
+async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user_id = update.effective_user.id
+    username = (
+        f"@{update.effective_user.username}"
+        if getattr(update.effective_user, "username", None)
+        else None
+    )
+
+    # asgi.py подставляет асинхронный доступ к БД, чтобы не блокировать общий цикл событий
+    run_db = context.bot_data.get("run_db", _run_db_blocking)
+    created = await run_db(register_bot_user, user_id, username)
+    if created:
+        await update.message.reply_text(
+            "✅ Ты зарегистрирован в системе! Запускай приложение по кнопке ниже"
+        )
+    else:
+        await update.message.reply_text(
+            "✅ Добро пожаловать обратно! Запускай приложение по кнопке ниже"
+        )
+
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик ошибок для бота"""
+    error = context.error
+    if isinstance(error, Conflict):
+        # Conflict 409 - это нормально при деплое, когда старый экземпляр еще работает
+        # Не останавливаем polling, просто логируем - система сама переключится на новый экземпляр
+        logger.warning("⚠️ Conflict 409: другой экземпляр бота уже запущен. Это нормально при деплое. Продолжаем работу...")
+        return
+    logger.exception("Необработанная ошибка: %s", error)
+
+
+def build_application(run_db=None) -> Application:
+    """Создает Application с обработчиками команд
+
+    run_db(fn, *args) — корутина, выполняющая fn(db, *args) в транзакции
+    (по умолчанию — синхронная сессия models.get_db_session).
+    """
+    application = Application.builder().token(get_bot_token()).build()
+    if run_db is not None:
+        application.bot_data["run_db"] = run_db
+    application.add_handler(CommandHandler("start", cmd_start))
+    application.add_error_handler(error_handler)
+    return application
+
+
+def run_polling() -> None:
+    """Запуск polling в текущем (главном) потоке"""
+    logger.info("🤖 Инициализация Telegram бота, polling…")
+    application = build_application()
+    # Ошибки Conflict обрабатываются через error_handler
+    try:
+        application.run_polling(
+            drop_pending_updates=True,
+            allowed_updates=Update.ALL_TYPES,
+            stop_signals=None  # Не останавливаем при сигналах, чтобы работал в Render
+        )
+    except Conflict as e:
+        # Conflict 409 при запуске - это нормально при деплое, когда старый экземпляр еще работает
+        # Просто логируем и завершаем - Render автоматически переключится на новый экземпляр
+        logger.warning("⚠️ Conflict 409 при запуске polling: %s. Это нормально при деплое. Завершаем этот экземпляр.", e)
+        logger.info("⏹️ Завершение работы из-за конфликта (новый экземпляр должен запуститься)")
+    except KeyboardInterrupt:
+        logger.info("⏹️ Получен сигнал остановки")
+    except Exception as e:
+        logger.exception("❌ Критическая ошибка бота: %s", e)
+        raise
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_polling()
@@ -0,0 +1,223 @@
+"""
+Подготовка собранного мини‑аппа к раздаче из Flask (см. static_files.py).
+
+Запуск после сборки фронтенда:
+    cd Frontend && PUBLIC_URL=/app npm run build
+    cd ../backend && python build_static.py [--src ../Frontend/build] [--out static_dist]
+
+Шаги:
+1. копирует сборку CRA в каталог раздачи;
+2. шрифты TTF, на которые ссылаются HTML/CSS, урезаются до нужных диапазонов
+   (латиница, кириллица, пунктуация) и сохраняются в WOFF2 (без brotli — в WOFF)
+   с хешем содержимого в имени; неиспользуемые TTF в раздачу не попадают;
+3. для текстовых файлов создаются .br и .gz (если они меньше оригинала) —
+   сервер отдает их без сжатия на лету.
+
+fontTools и brotli — необязательные зависимости этапа сборки
+(requirements-optional.txt). Без fontTools шрифты остаются TTF; без brotli (или brotlicffi)
+шрифты сохраняются в WOFF со сжатием zlib, а сжатые варианты — только .gz.
+"""
+import io
+import os
+import re
+import sys
+import gzip
+import shutil
+import hashlib
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SRC = os.path.join(BACKEND_DIR, "..", "Frontend", "build")
+DEFAULT_OUT = os.environ.get("STATIC_DIST_DIR", os.path.join(BACKEND_DIR, "static_dist"))
+
+# Диапазоны символов интерфейса: ASCII, Latin-1, кириллица, типографская пунктуация, №, ₽
+FONT_SUBSET_UNICODES = os.environ.get(
+    "FONT_SUBSET_UNICODES",
+    "U+0020-007E,U+00A0-00FF,U+0400-045F,U+0490-0491,U+2010-2027,U+2030-203A,U+2116,U+20BD,U+2212",
+)
+# Кроме стандартного набора OpenType-фич fontTools: цифры одинаковой ширины в таймере
+FONT_EXTRA_FEATURES = ["tnum"]
+
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg", ".txt", ".map", ".ico", ".xml", ".webmanifest"}
+MIN_COMPRESS_SIZE = 512  # Меньшие файлы не сжимаем: выигрыш меньше накладных расходов
+
+_FONT_URL_RE = re.compile(r"url\((['\"]?)([^'\")]+\.ttf)\1\)(\s*format\((['\"])truetype\4\))?")
+
+
+def content_hash(data: bytes, length: int = 8) -> str:
+    return hashlib.sha256(data).hexdigest()[:length]
+
+
+def _font_flavor() -> str:
+    """WOFF2, если есть brotli для его сжатия (fontTools берет brotli или brotlicffi), иначе WOFF"""
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+            return "woff2"
+        except ImportError:
+            continue
+    logger.warning("⚠️ brotli не установлен — шрифты сохраняются в WOFF (zlib) вместо WOFF2")
+    return "woff"
+
+
+def _subset_font(ttf_path: str, flavor: str) -> bytes:
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    options = subset.Options()
+    options.flavor = flavor
+    options.layout_features = list(options.layout_features) + FONT_EXTRA_FEATURES
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    font = TTFont(ttf_path)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=subset.parse_unicodes(FONT_SUBSET_UNICODES))
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font.flavor = flavor
+    font.save(output)
+    return output.getvalue()
+
+
+def _resolve_url(out_dir: str, referrer: str, url: str) -> str | None:
+    """Файл в сборке по URL из HTML/CSS. Абсолютные URL могут начинаться с PUBLIC_URL (/app/...)"""
+    if not url.startswith("/"):
+        candidate = os.path.normpath(os.path.join(os.path.dirname(referrer), url))
+        return candidate if os.path.isfile(candidate) else None
+    parts = [part for part in url.split("/") if part]
+    for skip in range(len(parts)):
+        candidate = os.path.join(out_dir, *parts[skip:])
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _text_files(root: str, extensions: tuple[str, ...]):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+
+def optimize_fonts(out_dir: str) -> dict[str, str]:
+    """TTF → WOFF2 (без brotli — WOFF) с хешем в имени; переписывает ссылки в HTML/CSS.
+
+    Возвращает {старый путь: новый}.
+    """
+    try:
+        import fontTools  # noqa: F401
+    except ImportError:
+        logger.warning("⚠️ fontTools не установлен — шрифты остаются TTF (pip install fonttools brotli)")
+        return {}
+    flavor = _font_flavor()
+
+    sources = list(_text_files(out_dir, (".html", ".css")))
+    referenced: dict[str, str] = {}  # URL из ссылки -> путь к TTF
+    for path in sources:
+        with open(path, encoding="utf-8") as f:
+            for match in _FONT_URL_RE.finditer(f.read()):
+                url = match.group(2)
+                ttf_path = _resolve_url(out_dir, path, url)
+                if ttf_path is not None:
+                    referenced[url] = ttf_path
+
+    replaced: dict[str, str] = {}
+    for url, ttf_path in referenced.items():
+        if ttf_path in replaced:
+            continue
+        data = _subset_font(ttf_path, flavor)
+        stem = os.path.splitext(os.path.basename(ttf_path))[0]
+        font_path = os.path.join(os.path.dirname(ttf_path), f"{stem}.{content_hash(data)}.{flavor}")
+        with open(font_path, "wb") as f:
+            f.write(data)
+        logger.info("🔤 %s: %s → %s байт (%s, подмножество)", os.path.basename(ttf_path),
+                    os.path.getsize(ttf_path), len(data), flavor.upper())
+        replaced[ttf_path] = font_path
+
+    def rewrite(match):
+        url = match.group(2)
+        ttf_path = referenced.get(url)
+        if ttf_path is None:
+            return match.group(0)
+        new_url = url[: -len(os.path.basename(url))] + os.path.basename(replaced[ttf_path])
+        return f"url({match.group(1)}{new_url}{match.group(1)}) format('{flavor}')"
+
+    for path in sources:
+        with open(path, encoding="utf-8") as f:
+            original = f.read()
+        updated = _FONT_URL_RE.sub(rewrite, original)
+        if updated != original:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(updated)
+
+    # Все TTF заменены или не используются — в раздачу не попадают
+    for ttf_path in _text_files(out_dir, (".ttf",)):
+        os.remove(ttf_path)
+    return replaced
+
+
+def precompress(out_dir: str) -> tuple[int, int]:
+    """Создает .br и .gz рядом с текстовыми файлами. Возвращает (число .gz, число .br)"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        logger.warning("⚠️ brotli не установлен — создаются только .gz")
+    gz_count = br_count = 0
+    for dirpath, _, filenames in os.walk(out_dir):
+        for filename in filenames:
+            if os.path.splitext(filename)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+            # mtime=0: одинаковый вход дает одинаковый .gz (воспроизводимая сборка)
+            gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz_data) < len(data):
+                with open(path + ".gz", "wb") as f:
+                    f.write(gz_data)
+                gz_count += 1
+            if brotli is not None:
+                br_data = brotli.compress(data, quality=11)
+                if len(br_data) < len(data):
+                    with open(path + ".br", "wb") as f:
+                        f.write(br_data)
+                    br_count += 1
+    return gz_count, br_count
+
+
+def build(src_dir: str, out_dir: str) -> None:
+    if not os.path.isfile(os.path.join(src_dir, "index.html")):
+        raise SystemExit(f"Не найдена сборка фронтенда: {src_dir}/index.html (cd Frontend && npm run build)")
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(src_dir, tmp_dir)
+    optimize_fonts(tmp_dir)
+    gz_count, br_count = precompress(tmp_dir)
+    # Подмена каталога целиком: запущенный сервер не увидит наполовину собранную раздачу
+    old_dir = out_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info("✅ Раздача собрана в %s: .gz — %s, .br — %s", out_dir, gz_count, br_count)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Подготовка сборки мини‑аппа к раздаче")
+    parser.add_argument("--src", default=DEFAULT_SRC, help="Сборка CRA (Frontend/build)")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="Каталог раздачи (STATIC_DIST_DIR)")
+    args = parser.parse_args(argv)
+    build(os.path.abspath(args.src), os.path.abspath(args.out))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("fontTools").setLevel(logging.WARNING)
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+Настройки приложения.
+
+Читаются лениво — при первом обращении, а не при импорте модуля, чтобы каждая
+точка входа (web.py, bot.py, worker.py) требовала только нужные ей переменные окружения.
+"""
+import os
+from functools import lru_cache
+
+# Тестовые интервалы: сразу/30/30 секунд. В проде можно заменить на часы.
+TEST_MODE = True
+REMINDER_1_DELAY = 0 if TEST_MODE else 24 * 3600  # Сразу после истечения таймера
+REMINDER_2_DELAY = 30 if TEST_MODE else 3600  # 30 секунд после первого напоминания
+EMERGENCY_DELAY = 30 if TEST_MODE else 3600  # 30 секунд после второго напоминания
+
+DEFAULT_TIMER_SECONDS = 3600  # По умолчанию 1 час
+
+
+def env_flag(name: str, default: str = "0") -> bool:
+    """Булев флаг из окружения: 1/true/yes"""
+    return os.environ.get(name, default).strip().lower() in ("1", "true", "yes")
+
+
+def cors_allowed_origins() -> list[str]:
+    """Origin мини‑аппа для CORS (web.py и asgi.py); EXTRA_CORS_ORIGINS — дополнительные через запятую"""
+    default = [
+        "https://web.telegram.org",
+        "https://webk.telegram.org",
+        "https://telegram.org",
+        "http://localhost:3000",
+        "http://127.0.0.1:3000",
+    ]
+    extra = os.environ.get("EXTRA_CORS_ORIGINS", "").strip()
+    if not extra:
+        return default
+    return default + [x.strip() for x in extra.split(",") if x.strip()]
+
+
+@lru_cache(maxsize=None)
+def get_bot_token() -> str:
+    token = (os.environ.get("BOT_TOKEN") or "").strip()
+    if not token:
+        raise RuntimeError("Переменная окружения BOT_TOKEN не установлена")
+    return token
+
+
+@lru_cache(maxsize=None)
+def get_database_url() -> str:
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        raise RuntimeError("Переменная окружения DATABASE_URL не установлена")
+    # Для PostgreSQL на Render может потребоваться замена postgres:// на postgresql://
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+# -------------------- Пулы соединений БД --------------------
+# Отдельные пулы: запросы HTTP API/бота, планировщик и outbox, массовые задачи (миграции, бэкфиллы).
+DB_ROLE_REQUEST = "request"
+DB_ROLE_SCHEDULER = "scheduler"
+DB_ROLE_BULK = "bulk"
+
+_DB_POOL_DEFAULTS = {
+    DB_ROLE_REQUEST: {"pool_size": 5, "max_overflow": 5, "statement_timeout_ms": 5000, "saturation_warn_ratio": 0.8},
+    DB_ROLE_SCHEDULER: {"pool_size": 2, "max_overflow": 3, "statement_timeout_ms": 15000, "saturation_warn_ratio": 0.8},
+    # Второе соединение держит pg_advisory_lock на время миграций; полная занятость пула здесь — норма
+    DB_ROLE_BULK: {"pool_size": 1, "max_overflow": 1, "statement_timeout_ms": 0, "saturation_warn_ratio": 2.0},
+}
+
+PRE_PING_ALWAYS = "always"  # SELECT 1 при каждом checkout (прежнее поведение)
+PRE_PING_RECYCLE = "recycle"  # Без pre-ping: соединения пересоздаются по pool_recycle, разрывы — через invalidate
+PRE_PING_STRATEGIES = (PRE_PING_ALWAYS, PRE_PING_RECYCLE)
+
+
+def _db_setting(role: str, name: str, default):
+    """DB_<ROLE>_<NAME> имеет приоритет над DB_<NAME>"""
+    raw = os.environ.get(f"DB_{role.upper()}_{name.upper()}")
+    if raw is None:
+        raw = os.environ.get(f"DB_{name.upper()}")
+    if raw is None or not raw.strip():
+        return default
+    return type(default)(raw.strip())
+
+
+@lru_cache(maxsize=None)
+def get_db_pool_settings(role: str) -> dict:
+    """Параметры engine и пула для роли"""
+    if role not in _DB_POOL_DEFAULTS:
+        raise ValueError(f"Неизвестная роль пула БД: {role!r}")
+    defaults = _DB_POOL_DEFAULTS[role]
+    pre_ping = _db_setting(role, "pre_ping", PRE_PING_ALWAYS).lower()
+    if pre_ping not in PRE_PING_STRATEGIES:
+        raise ValueError(f"DB_PRE_PING должен быть одним из {PRE_PING_STRATEGIES}, получено {pre_ping!r}")
+    return {
+        "pool_size": _db_setting(role, "pool_size", defaults["pool_size"]),
+        "max_overflow": _db_setting(role, "max_overflow", defaults["max_overflow"]),
+        "pool_timeout": _db_setting(role, "pool_timeout", 10.0),
+        "pool_recycle": _db_setting(role, "pool_recycle", 1800),
+        "pre_ping": pre_ping,
+        "statement_timeout_ms": _db_setting(role, "statement_timeout_ms", defaults["statement_timeout_ms"]),
+        "application_name": f"{_db_setting(role, 'application_name', 'homealone')}:{role}",
+        "saturation_warn_ratio": _db_setting(role, "saturation_warn_ratio", defaults["saturation_warn_ratio"]),
+    }
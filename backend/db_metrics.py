@@ -0,0 +1,124 @@
+"""
+Телеметрия пулов соединений SQLAlchemy.
+
+Счетчики обновляются из событий пула (connect/checkout/checkin/detach/invalidate).
+Когда занято больше saturation_warn_ratio от pool_size + max_overflow,
+пишется предупреждение — до того, как запросы начнут ждать pool_timeout.
+Снимок доступен в /debug.
+"""
+import time
+import logging
+from threading import Lock
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SATURATION_LOG_INTERVAL = 30  # Не чаще одного предупреждения о насыщении за столько секунд
+
+
+class PoolMetrics:
+    """Счетчики одного пула"""
+
+    def __init__(self, role: str, capacity: int, warn_ratio: float):
+        self.role = role
+        self.capacity = capacity
+        self.warn_ratio = warn_ratio
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.saturation_events = 0
+        self.held_seconds_total = 0.0
+        self.held_seconds_max = 0.0
+        self._held_samples = 0
+        self._last_warning = 0.0
+        self._lock = Lock()
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        # record_info живет вместе с записью пула; info очищается после invalidate() при переподключении
+        connection_record.record_info["checkout_at"] = time.monotonic()
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            if self.checked_out > self.peak_checked_out:
+                self.peak_checked_out = self.checked_out
+            saturated = self.capacity > 0 and self.checked_out >= self.capacity * self.warn_ratio
+            if saturated:
+                self.saturation_events += 1
+            now = time.monotonic()
+            should_log = saturated and now - self._last_warning >= SATURATION_LOG_INTERVAL
+            if should_log:
+                self._last_warning = now
+            checked_out = self.checked_out
+        if should_log:
+            logger.warning("⚠️ Пул БД %s близок к насыщению: занято %s из %s соединений",
+                           self.role, checked_out, self.capacity)
+
+    def on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.record_info.pop("checkout_at", None) if connection_record is not None else None
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(0, self.checked_out - 1)
+            # Без метки соединение все равно возвращено — пропускаем только время удержания
+            if started is not None:
+                held = time.monotonic() - started
+                self.held_seconds_total += held
+                self.held_seconds_max = max(self.held_seconds_max, held)
+                self._held_samples += 1
+
+    def on_detach(self, dbapi_connection, connection_record) -> None:
+        # Отсоединенное соединение (connection.detach()) уходит из пула без checkin
+        connection_record.record_info.pop("checkout_at", None)
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "invalidations": self.invalidations,
+                "saturation_events": self.saturation_events,
+                "held_ms_avg": (round(self.held_seconds_total / self._held_samples * 1000, 2)
+                                if self._held_samples else None),
+                "held_ms_max": round(self.held_seconds_max * 1000, 2),
+            }
+
+
+_metrics: dict[str, PoolMetrics] = {}
+
+
+def instrument_engine(engine, role: str, capacity: int, warn_ratio: float) -> PoolMetrics:
+    """Подписывает счетчики на события пула engine"""
+    metrics = PoolMetrics(role, capacity, warn_ratio)
+    event.listen(engine.pool, "connect", metrics.on_connect)
+    event.listen(engine.pool, "checkout", metrics.on_checkout)
+    event.listen(engine.pool, "checkin", metrics.on_checkin)
+    event.listen(engine.pool, "invalidate", metrics.on_invalidate)
+    event.listen(engine.pool, "detach", metrics.on_detach)
+    _metrics[role] = metrics
+    return metrics
+
+
+def pools_snapshot(engines: dict) -> dict:
+    """Счетчики и pool.status() всех созданных engine"""
+    result = {}
+    for role, engine in engines.items():
+        data = _metrics[role].snapshot() if role in _metrics else {}
+        data["status"] = engine.pool.status()
+        result[role] = data
+    return result
@@ -0,0 +1,257 @@
+"""
+Журнал статусов (status_events) и инкрементальная статистика пользователей (user_stats).
+
+Событие пишется в той же транзакции, что и переход состояния (POST /status,
+этапы эскалации планировщика), и в ней же обновляется строка user_stats —
+поэтому /stats читает одну строку по первичному ключу, а не сканирует журнал.
+
+Перцентили длительности выхода оцениваются по гистограмме с фиксированными
+границами DURATION_BUCKETS: точность — в пределах корзины, зато агрегат
+занимает несколько десятков байт и обновляется за O(1).
+
+На Postgres журнал секционирован по месяцам; секции на STATUS_EVENTS_PARTITIONS_AHEAD
+месяцев вперед создает ensure_partitions() (миграция 0004 и worker).
+"""
+import os
+import logging
+from bisect import bisect_left
+from datetime import datetime, timezone
+from threading import Event, Thread
+
+from sqlalchemy import text
+
+from config import DB_ROLE_BULK
+from models import StatusEvent, UserStats, ensure_utc_aware, get_engine
+
+logger = logging.getLogger(__name__)
+
+EVENT_LEFT_HOME = "left_home"
+EVENT_RETURNED_HOME = "returned_home"
+EVENT_REMINDER_1 = "reminder_1"
+EVENT_REMINDER_2 = "reminder_2"
+EVENT_EMERGENCY = "emergency"
+EVENT_TYPES = (EVENT_LEFT_HOME, EVENT_RETURNED_HOME, EVENT_REMINDER_1, EVENT_REMINDER_2, EVENT_EMERGENCY)
+
+# Верхние границы корзин гистограммы длительности выхода, секунды (последняя корзина — «больше суток»)
+DURATION_BUCKETS = (60, 300, 600, 900, 1800, 2700, 3600, 5400, 7200, 10800, 14400, 21600, 43200, 86400)
+
+STATUS_EVENTS_PARTITIONS_AHEAD = int(os.environ.get("STATUS_EVENTS_PARTITIONS_AHEAD", "2"))
+STATUS_EVENTS_MAINTENANCE_LOCK_TIMEOUT = os.environ.get("STATUS_EVENTS_MAINTENANCE_LOCK_TIMEOUT", "2s")
+STATUS_EVENTS_MAINTENANCE_INTERVAL = float(os.environ.get("STATUS_EVENTS_MAINTENANCE_INTERVAL", str(6 * 3600)))
+
+
+def _lock_stats_row(db, user_id: int) -> UserStats:
+    """Строка user_stats под блокировкой; создается при первом событии пользователя.
+
+    INSERT ... ON CONFLICT DO NOTHING не падает, если строку параллельно создала
+    другая транзакция (HTTP и планировщик).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(
+        insert(UserStats.__table__)
+        .values(user_id=user_id, duration_histogram=[0] * (len(DURATION_BUCKETS) + 1))
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+    return db.query(UserStats).filter(UserStats.user_id == user_id).with_for_update().one()
+
+
+def _add_duration(stats: UserStats, seconds: int) -> None:
+    histogram = list(stats.duration_histogram or [])
+    histogram += [0] * (len(DURATION_BUCKETS) + 1 - len(histogram))
+    histogram[bisect_left(DURATION_BUCKETS, seconds)] += 1
+    # Присваиваем новый список: изменение JSON на месте SQLAlchemy не отслеживает
+    stats.duration_histogram = histogram
+    stats.outings_count = (stats.outings_count or 0) + 1
+    stats.outings_total_seconds = (stats.outings_total_seconds or 0) + seconds
+    stats.outings_max_seconds = max(stats.outings_max_seconds or 0, seconds)
+
+
+def record_event(db, user_id: int, event_type: str, *, occurred_at: datetime | None = None,
+                 outing_started_at: datetime | None = None, warnings_sent: int = 0) -> None:
+    """Добавляет событие в журнал и обновляет user_stats в текущей транзакции.
+
+    Вызывать после блокировки строки users (порядок блокировок users → user_stats
+    одинаков у HTTP API и планировщика).
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Неизвестный тип события: {event_type!r}")
+    occurred_at = ensure_utc_aware(occurred_at) or datetime.now(timezone.utc)
+    outing_started_at = ensure_utc_aware(outing_started_at)
+    duration_seconds = None
+    if event_type == EVENT_RETURNED_HOME and outing_started_at is not None:
+        duration_seconds = max(0, int((occurred_at - outing_started_at).total_seconds()))
+
+    db.add(
+        StatusEvent(
+            user_id=user_id,
+            event_type=event_type,
+            occurred_at=occurred_at,
+            outing_started_at=outing_started_at,
+            duration_seconds=duration_seconds,
+            warnings_sent=warnings_sent,
+        )
+    )
+
+    stats = _lock_stats_row(db, user_id)
+    if duration_seconds is not None:
+        _add_duration(stats, duration_seconds)
+        if warnings_sent > 0:
+            stats.outings_escalated = (stats.outings_escalated or 0) + 1
+    elif event_type in (EVENT_REMINDER_1, EVENT_REMINDER_2):
+        stats.reminders_triggered = (stats.reminders_triggered or 0) + 1
+    elif event_type == EVENT_EMERGENCY:
+        stats.emergencies_triggered = (stats.emergencies_triggered or 0) + 1
+    stats.last_event_at = occurred_at
+    stats.updated_at = datetime.now(timezone.utc)
+
+
+def histogram_percentile(histogram: list[int], q: float, max_seconds: int | None = None) -> float | None:
+    """Оценка q-перцентиля (0..1) длительности по гистограмме — линейно внутри корзины"""
+    total = sum(histogram)
+    if total == 0:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            lower = DURATION_BUCKETS[index - 1] if index > 0 else 0
+            upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else (max_seconds or lower)
+            if max_seconds is not None:
+                upper = min(upper, max_seconds)
+            return lower + (upper - lower) * max(0.0, rank - seen) / count
+        seen += count
+    return float(max_seconds or DURATION_BUCKETS[-1])
+
+
+def stats_to_dict(stats: UserStats | None) -> dict:
+    """Ответ /stats"""
+    if stats is None:
+        return {
+            "outings_count": 0,
+            "outing_seconds_mean": None,
+            "outing_seconds_p50": None,
+            "outing_seconds_p90": None,
+            "outing_seconds_max": None,
+            "outings_escalated": 0,
+            "reminders_triggered": 0,
+            "emergencies_triggered": 0,
+            "last_event_at": None,
+        }
+    count = stats.outings_count or 0
+    histogram = list(stats.duration_histogram or [])
+    max_seconds = stats.outings_max_seconds if count else None
+
+    def rounded(value):
+        return int(round(value)) if value is not None else None
+
+    return {
+        "outings_count": count,
+        "outing_seconds_mean": rounded(stats.outings_total_seconds / count) if count else None,
+        "outing_seconds_p50": rounded(histogram_percentile(histogram, 0.5, max_seconds)),
+        "outing_seconds_p90": rounded(histogram_percentile(histogram, 0.9, max_seconds)),
+        "outing_seconds_max": max_seconds,
+        "outings_escalated": stats.outings_escalated or 0,
+        "reminders_triggered": stats.reminders_triggered or 0,
+        "emergencies_triggered": stats.emergencies_triggered or 0,
+        "last_event_at": stats.last_event_at.isoformat() if stats.last_event_at else None,
+    }
+
+
+# -------------------- Секции status_events (Postgres) --------------------
+
+def _month_start(year: int, month: int) -> datetime:
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def create_monthly_partitions(conn, months_ahead: int = STATUS_EVENTS_PARTITIONS_AHEAD) -> list[str]:
+    """Создает недостающие месячные секции: текущий месяц и months_ahead следующих.
+
+    Возвращает имена созданных секций. Пока секции создаются заранее, DEFAULT-секция
+    остается пустой, и новая секция не требует ее сканирования.
+    """
+    now = datetime.now(timezone.utc)
+    existing = {
+        row[0]
+        for row in conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'status_events'"
+        ))
+    }
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _month_start(now.year, now.month + offset)
+        end = _month_start(now.year, now.month + offset + 1)
+        name = f"status_events_p{start:%Y%m}"
+        if name in existing:
+            continue
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF status_events "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def ensure_partitions() -> list[str]:
+    """Периодическое обслуживание журнала (worker): секции на месяцы вперед.
+
+    CREATE TABLE ... PARTITION OF кратко блокирует status_events, поэтому выполняется
+    с lock_timeout; при неудаче повторится на следующем запуске.
+    """
+    engine = get_engine(DB_ROLE_BULK)
+    if engine.dialect.name != "postgresql":
+        return []
+    try:
+        with engine.begin() as conn:
+            created = _create_partitions_with_lock_timeout(conn)
+    except Exception as e:
+        logger.warning("⚠️ Не удалось создать секции status_events: %s", e)
+        return []
+    if created:
+        logger.info("🗂️ Созданы секции status_events: %s", ", ".join(created))
+    return created
+
+
+def _create_partitions_with_lock_timeout(conn) -> list[str]:
+    conn.execute(text(f"SET LOCAL lock_timeout = '{STATUS_EVENTS_MAINTENANCE_LOCK_TIMEOUT}'"))
+    return create_monthly_partitions(conn)
+
+
+async def ensure_partitions_async() -> list[str]:
+    """ensure_partitions для ASGI-рантайма: через асинхронный пул bulk"""
+    import async_db  # Лениво: потоковому рантайму асинхронные драйверы не нужны
+
+    engine = async_db.get_async_engine(DB_ROLE_BULK)
+    if engine.dialect.name != "postgresql":
+        return []
+    try:
+        async with engine.begin() as conn:
+            created = await conn.run_sync(_create_partitions_with_lock_timeout)
+    except Exception as e:
+        logger.warning("⚠️ Не удалось создать секции status_events: %s", e)
+        return []
+    if created:
+        logger.info("🗂️ Созданы секции status_events: %s", ", ".join(created))
+    return created
+
+
+def run_partition_maintenance(stop_event: Event | None = None) -> None:
+    """Цикл обслуживания секций: сразу при запуске и далее раз в STATUS_EVENTS_MAINTENANCE_INTERVAL"""
+    stop_event = stop_event or Event()
+    while True:
+        ensure_partitions()
+        if stop_event.wait(STATUS_EVENTS_MAINTENANCE_INTERVAL):
+            return
+
+
+def start_partition_maintenance(stop_event: Event | None = None) -> Thread:
+    """Запускает обслуживание секций status_events в фоновом потоке"""
+    thread = Thread(target=run_partition_maintenance, args=(stop_event,), daemon=True, name="PartitionsThread")
+    thread.start()
+    return thread
@@ -0,0 +1,233 @@
+"""
+Группы (семьи): участники видят статусы друг друга.
+
+Статус группы читается одним запросом — join group_memberships → users по первичным
+ключам, — а не get_user() на каждого участника. Результат кешируется в процессе
+по ключу (group_id, status_version): каждый переход участника (POST /status,
+этапы эскалации, смена таймера) в своей транзакции увеличивает groups.status_version
+(bump_member_groups). Опрос группы при неизменной версии — один запрос по первичному
+ключу, который заодно проверяет членство; стоимость не зависит от размера группы.
+Так как версия хранится в БД, инвалидация работает и между процессами (web и worker).
+"""
+import os
+import secrets
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Lock
+
+from sqlalchemy import func, select, update
+
+from config import DEFAULT_TIMER_SECONDS
+from events import EVENT_EMERGENCY, EVENT_REMINDER_1, EVENT_REMINDER_2
+from models import Group, GroupMembership, User, ensure_utc_aware
+
+logger = logging.getLogger(__name__)
+
+GROUP_MAX_MEMBERS = int(os.environ.get("GROUP_MAX_MEMBERS", "20"))
+GROUP_STATUS_CACHE_SIZE = int(os.environ.get("GROUP_STATUS_CACHE_SIZE", "1024"))
+
+ROLE_OWNER = "owner"
+ROLE_MEMBER = "member"
+
+# Этап эскалации по warnings_sent (для пользователей «не дома»)
+STAGE_BY_WARNINGS = {0: "waiting", 1: EVENT_REMINDER_1, 2: EVENT_REMINDER_2, 3: EVENT_EMERGENCY}
+
+
+class GroupError(Exception):
+    """Ошибка операции с группой; code уходит в ответ API"""
+
+    def __init__(self, code: str, status: int = 400):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+
+
+# group_id -> (status_version, участники). OrderedDict — простой LRU
+_status_cache: OrderedDict = OrderedDict()
+_cache_lock = Lock()
+
+
+def _cache_get(group_id: int, version: int):
+    with _cache_lock:
+        entry = _status_cache.get(group_id)
+        if entry is None or entry[0] != version:
+            return None
+        _status_cache.move_to_end(group_id)
+        return entry[1]
+
+
+def _cache_put(group_id: int, version: int, members: tuple) -> None:
+    with _cache_lock:
+        _status_cache[group_id] = (version, members)
+        _status_cache.move_to_end(group_id)
+        while len(_status_cache) > GROUP_STATUS_CACHE_SIZE:
+            _status_cache.popitem(last=False)
+
+
+def bump_member_groups(db, user_id: int) -> None:
+    """Инвалидирует кеш статуса всех групп пользователя в текущей транзакции.
+
+    Строки groups блокируются по возрастанию id, чтобы одновременные переходы
+    участников общих групп не взаимоблокировались.
+    """
+    locked_ids = (
+        select(Group.id)
+        .where(Group.id.in_(select(GroupMembership.group_id).where(GroupMembership.user_id == user_id)))
+        .order_by(Group.id)
+        .with_for_update()
+    )
+    db.execute(
+        update(Group)
+        .where(Group.id.in_(locked_ids))
+        .values(status_version=Group.status_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _group_to_dict(group: Group, members_count: int | None = None) -> dict:
+    data = {"group_id": group.id, "name": group.name, "invite_code": group.invite_code}
+    if members_count is not None:
+        data["members_count"] = members_count
+    return data
+
+
+def create_group(db, owner_user_id: int, name: str) -> dict:
+    """Создает группу; владелец становится ее первым участником"""
+    group = Group(
+        name=name,
+        invite_code=secrets.token_urlsafe(8),
+        owner_user_id=owner_user_id,
+        status_version=0,
+    )
+    db.add(group)
+    db.flush()
+    db.add(GroupMembership(group_id=group.id, user_id=owner_user_id, role=ROLE_OWNER))
+    logger.info("👪 Создана группа group_id=%s владельцем user_id=%s", group.id, owner_user_id)
+    return _group_to_dict(group, 1)
+
+
+def join_group(db, user_id: int, invite_code: str) -> dict:
+    """Добавляет пользователя в группу по коду приглашения"""
+    # Блокировка строки группы сериализует вступления: лимит участников не превышается
+    group = db.query(Group).filter(Group.invite_code == invite_code).with_for_update().first()
+    if group is None:
+        raise GroupError("group_not_found", 404)
+    members_count = db.query(func.count(GroupMembership.user_id)).filter(GroupMembership.group_id == group.id).scalar()
+    already_member = db.get(GroupMembership, (group.id, user_id)) is not None
+    if not already_member:
+        if members_count >= GROUP_MAX_MEMBERS:
+            raise GroupError("group_full", 409)
+        db.add(GroupMembership(group_id=group.id, user_id=user_id, role=ROLE_MEMBER))
+        group.status_version = (group.status_version or 0) + 1
+        members_count += 1
+        logger.info("👪 user_id=%s вступил в группу group_id=%s", user_id, group.id)
+    return _group_to_dict(group, members_count)
+
+
+def leave_group(db, user_id: int, group_id: int) -> None:
+    """Выход пользователя из группы.
+
+    С последним участником удаляется и группа; ушедшего владельца сменяет
+    самый давний участник.
+    """
+    group = db.query(Group).filter(Group.id == group_id).with_for_update().first()
+    membership = db.get(GroupMembership, (group_id, user_id)) if group is not None else None
+    if membership is None:
+        raise GroupError("group_not_found", 404)
+    db.delete(membership)
+    db.flush()
+    successor = (
+        db.query(GroupMembership)
+        .filter(GroupMembership.group_id == group_id)
+        .order_by(GroupMembership.joined_at, GroupMembership.user_id)
+        .first()
+    )
+    if successor is None:
+        db.delete(group)
+        logger.info("👪 Группа group_id=%s удалена: вышел последний участник user_id=%s", group_id, user_id)
+        return
+    if group.owner_user_id == user_id:
+        group.owner_user_id = successor.user_id
+        successor.role = ROLE_OWNER
+    group.status_version = (group.status_version or 0) + 1
+    logger.info("👪 user_id=%s вышел из группы group_id=%s", user_id, group_id)
+
+
+def list_user_groups(db, user_id: int) -> list[dict]:
+    """Группы пользователя"""
+    rows = (
+        db.query(Group)
+        .join(GroupMembership, GroupMembership.group_id == Group.id)
+        .filter(GroupMembership.user_id == user_id)
+        .order_by(Group.id)
+        .all()
+    )
+    return [_group_to_dict(group) for group in rows]
+
+
+def _load_members(db, group_id: int) -> tuple:
+    """Один запрос: участники группы и их состояние"""
+    rows = db.execute(
+        select(
+            User.user_id,
+            User.username,
+            User.status,
+            User.left_home_time,
+            User.timer_seconds,
+            User.warnings_sent,
+        )
+        .join(GroupMembership, GroupMembership.user_id == User.user_id)
+        .where(GroupMembership.group_id == group_id)
+        .order_by(GroupMembership.joined_at, User.user_id)
+    ).all()
+    return tuple(
+        (row.user_id, row.username, row.status or "дома", ensure_utc_aware(row.left_home_time),
+         row.timer_seconds or DEFAULT_TIMER_SECONDS, row.warnings_sent or 0)
+        for row in rows
+    )
+
+
+def _member_to_dict(member: tuple, now: datetime) -> dict:
+    user_id, username, status, left_home_time, timer_seconds, warnings_sent = member
+    time_remaining = None
+    stage = None
+    if status == "не дома":
+        stage = STAGE_BY_WARNINGS.get(warnings_sent, EVENT_EMERGENCY)
+        if left_home_time is not None:
+            elapsed_seconds = (now - left_home_time).total_seconds()
+            time_remaining = int(max(0, timer_seconds - elapsed_seconds))
+    return {
+        "user_id": user_id,
+        "username": username,
+        "status": status,
+        "timer_seconds": timer_seconds,
+        "time_remaining": time_remaining,
+        "stage": stage,
+    }
+
+
+def group_status(db, group_id: int, viewer_user_id: int) -> dict:
+    """Статусы всех участников группы.
+
+    Первый запрос (по первичным ключам) проверяет, что зритель — участник,
+    и возвращает версию статуса; при попадании в кеш второго запроса нет.
+    time_remaining считается при каждом ответе, поэтому кеш не устаревает со временем.
+    """
+    row = db.execute(
+        select(Group.name, Group.status_version)
+        .join(GroupMembership, GroupMembership.group_id == Group.id)
+        .where(Group.id == group_id, GroupMembership.user_id == viewer_user_id)
+    ).first()
+    if row is None:
+        raise GroupError("group_not_found", 404)
+    members = _cache_get(group_id, row.status_version)
+    if members is None:
+        members = _load_members(db, group_id)
+        _cache_put(group_id, row.status_version, members)
+    now = datetime.now(timezone.utc)
+    return {
+        "group_id": group_id,
+        "name": row.name,
+        "members": [_member_to_dict(member, now) for member in members],
+    }
@@ -1,10 +1,9 @@
 """
-Скрипт для инициализации базы данных.
-Запускать один раз при первом деплое или при необходимости пересоздать таблицы.
+Скрипт для инициализации базы данных: применяет все новые миграции (как python migrate.py).
+Безопасно запускать при каждом деплое.
 """
-import os
 import logging
-from models import init_db, engine, Base
+from models import init_db
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -0,0 +1,309 @@
+"""
+Версионные миграции схемы БД.
+
+Миграции лежат в пакете migrations/ в файлах NNNN_описание.py и применяются по
+порядку номеров. Примененные версии хранятся в таблице schema_migrations.
+
+Модуль миграции определяет:
+- description: str — короткое описание;
+- transactional: bool (по умолчанию True) — выполнять ли upgrade() в одной транзакции.
+  Для CREATE INDEX CONCURRENTLY и батчевых бэкфиллов нужен False;
+- upgrade(ctx: MigrationContext) — сами изменения.
+
+Запуск:
+    python migrate.py           # применить все новые миграции
+    python migrate.py status    # показать состояние
+
+На Postgres одновременный запуск из нескольких процессов сериализуется через
+pg_advisory_lock; DDL выполняется с lock_timeout и повторяется, если блокировку
+не удалось получить быстро, — чтобы миграция не выстраивала очередь из записей в users.
+"""
+import os
+import re
+import sys
+import time
+import logging
+import importlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from config import DB_ROLE_BULK
+from models import get_engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_LOCK_TIMEOUT = os.environ.get("MIGRATION_LOCK_TIMEOUT", "3s")
+MIGRATION_LOCK_RETRIES = int(os.environ.get("MIGRATION_LOCK_RETRIES", "10"))
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "5000"))
+MIGRATION_BATCH_PAUSE = float(os.environ.get("MIGRATION_BATCH_PAUSE", "0.1"))  # Секунд между батчами
+ADVISORY_LOCK_KEY = 7_203_615_001  # Произвольная константа для pg_advisory_lock
+
+_FILENAME_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+class MigrationError(RuntimeError):
+    """Ошибка применения миграции"""
+
+
+def _is_lock_timeout(error: OperationalError) -> bool:
+    return getattr(getattr(error, "orig", None), "pgcode", None) == "55P03"  # lock_not_available
+
+
+class MigrationContext:
+    """Инструменты, доступные миграции"""
+
+    def __init__(self, engine, conn=None):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self._conn = conn  # Соединение транзакционной миграции
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.dialect == "postgresql"
+
+    def _set_lock_timeout(self, conn) -> None:
+        if self.is_postgres:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+
+    def _retry_on_lock_timeout(self, attempt_fn):
+        """Повторяет attempt_fn() с паузой, пока она падает по lock_timeout (55P03)"""
+        for attempt in range(1, MIGRATION_LOCK_RETRIES + 1):
+            try:
+                return attempt_fn()
+            except OperationalError as e:
+                if not _is_lock_timeout(e) or attempt == MIGRATION_LOCK_RETRIES:
+                    raise
+                pause = min(30.0, 0.5 * 2 ** attempt)
+                logger.warning("🔒 Не удалось получить блокировку (попытка %s), повтор через %.1f сек", attempt, pause)
+                time.sleep(pause)
+
+    def run_in_transaction(self, fn):
+        """Выполняет fn(conn) в короткой транзакции с lock_timeout.
+
+        Если блокировку не удалось получить за lock_timeout, транзакция откатывается
+        и повторяется с паузой — вместо долгого ожидания, блокирующего запись в таблицу.
+        """
+        if self._conn is not None:
+            return fn(self._conn)
+
+        def attempt():
+            with self.engine.begin() as conn:
+                self._set_lock_timeout(conn)
+                return fn(conn)
+
+        return self._retry_on_lock_timeout(attempt)
+
+    def execute(self, sql: str, **params) -> int:
+        """Выполняет один оператор (в транзакции миграции или в отдельной короткой транзакции).
+        Возвращает rowcount"""
+        return self.run_in_transaction(lambda conn: conn.execute(text(sql), params).rowcount)
+
+    def scalar(self, sql: str, **params):
+        return self.run_in_transaction(lambda conn: conn.execute(text(sql), params).scalar())
+
+    def column_type(self, table: str, column: str) -> str | None:
+        """Тип колонки из information_schema (только Postgres)"""
+        return self.scalar(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column",
+            table=table,
+            column=column,
+        )
+
+    def create_index_concurrently(self, name: str, table: str, columns: str, *, where: str | None = None,
+                                  unique: bool = False) -> None:
+        """CREATE INDEX CONCURRENTLY: не блокирует запись в таблицу.
+
+        Невалидный индекс, оставшийся от прерванной попытки, удаляется и строится заново.
+        Вне Postgres — обычный CREATE INDEX IF NOT EXISTS.
+        """
+        unique_sql = "UNIQUE " if unique else ""
+        where_sql = f" WHERE {where}" if where else ""
+        if not self.is_postgres:
+            self.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({columns}){where_sql}")
+            return
+        if self._conn is not None:
+            raise MigrationError("CREATE INDEX CONCURRENTLY требует transactional = False")
+        self._retry_on_lock_timeout(lambda: self._build_index_concurrently(name, table, columns, where_sql, unique_sql))
+
+    def _build_index_concurrently(self, name: str, table: str, columns: str, where_sql: str,
+                                  unique_sql: str) -> None:
+        # Одна попытка: после отказа по lock_timeout индекс остается невалидным и пересоздается
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            # lock_timeout ограничивает только ожидание блокировок, сама сборка может идти долго.
+            # SET действует на сессию пулового соединения — RESET обязателен и при ошибке
+            conn.execute(text(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+            conn.execute(text("SET statement_timeout = 0"))
+            try:
+                valid = conn.execute(
+                    text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                         "WHERE c.relname = :name"),
+                    {"name": name},
+                ).scalar()
+                if valid is True:
+                    logger.info("⏭️ Индекс %s уже существует", name)
+                    return
+                if valid is False:
+                    logger.warning("♻️ Индекс %s невалиден после прерванной сборки — пересоздаем", name)
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                started = time.monotonic()
+                conn.execute(text(f"CREATE {unique_sql}INDEX CONCURRENTLY {name} ON {table} ({columns}){where_sql}"))
+                logger.info("✅ Индекс %s построен за %.1f сек", name, time.monotonic() - started)
+            finally:
+                conn.execute(text("RESET lock_timeout"))
+                conn.execute(text("RESET statement_timeout"))
+
+    def backfill(self, table: str, key_column: str, set_sql: str, *, where: str | None = None,
+                 batch_size: int = MIGRATION_BATCH_SIZE, pause: float = MIGRATION_BATCH_PAUSE) -> int:
+        """Батчевое обновление по возрастанию ключа (keyset pagination).
+
+        Каждый батч — отдельная короткая транзакция с lock_timeout; между батчами пауза,
+        чтобы не забивать WAL/реплики и не вытеснять рабочую нагрузку.
+        Возвращает количество обновленных строк.
+        """
+        if self._conn is not None:
+            raise MigrationError("Батчевый бэкфилл требует transactional = False")
+        where_sql = f" AND ({where})" if where else ""
+        last_key = None
+        total = 0
+
+        def run_batch(conn):
+            key_filter = f"{key_column} > :last_key" if last_key is not None else "1 = 1"
+            keys = [
+                row[0]
+                for row in conn.execute(
+                    text(f"SELECT {key_column} FROM {table} WHERE {key_filter}{where_sql} "
+                         f"ORDER BY {key_column} LIMIT :limit"),
+                    {"last_key": last_key, "limit": batch_size},
+                )
+            ]
+            if not keys:
+                return None, 0
+            result = conn.execute(
+                text(f"UPDATE {table} SET {set_sql} WHERE {key_column} >= :first AND {key_column} <= :last"
+                     f"{where_sql}"),
+                {"first": keys[0], "last": keys[-1]},
+            )
+            return keys[-1], result.rowcount or 0
+
+        while True:
+            batch_last_key, updated = self.run_in_transaction(run_batch)
+            if batch_last_key is None:
+                break
+            last_key = batch_last_key
+            total += updated
+            logger.info("🔁 Бэкфилл %s: обновлено %s строк (до %s=%s)", table, total, key_column, last_key)
+            if pause > 0:
+                time.sleep(pause)
+        return total
+
+
+def discover_migrations() -> list[tuple[str, str, object]]:
+    """Список (версия, имя, модуль) по возрастанию версии"""
+    found = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        version, name = match.groups()
+        module = importlib.import_module(f"migrations.{filename[:-3]}")
+        found.append((version, name, module))
+    versions = [v for v, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Повторяющиеся номера миграций: {versions}")
+    return found
+
+
+def _ensure_version_table(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version VARCHAR(16) PRIMARY KEY, "
+            "name VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMP WITH TIME ZONE NOT NULL)"
+        ))
+
+
+def applied_versions(engine) -> set[str]:
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _record(conn, version: str, name: str) -> None:
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": version, "name": name, "applied_at": datetime.now(timezone.utc)},
+    )
+
+
+@contextmanager
+def _migration_lock(engine):
+    """Сериализует запуск миграций между процессами (pg_advisory_lock)"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        logger.info("⏳ Ожидание advisory lock миграций…")
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+
+def upgrade() -> list[str]:
+    """Применяет все неприменённые миграции. Возвращает список примененных версий"""
+    engine = get_engine(DB_ROLE_BULK)
+    migrations = discover_migrations()
+    applied_now = []
+    with _migration_lock(engine):
+        done = applied_versions(engine)
+        for version, name, module in migrations:
+            if version in done:
+                continue
+            description = getattr(module, "description", name)
+            logger.info("🛠️ Миграция %s_%s: %s", version, name, description)
+            started = time.monotonic()
+            try:
+                if getattr(module, "transactional", True):
+                    with engine.begin() as conn:
+                        ctx = MigrationContext(engine, conn)
+                        ctx._set_lock_timeout(conn)
+                        module.upgrade(ctx)
+                        _record(conn, version, name)
+                else:
+                    module.upgrade(MigrationContext(engine))
+                    with engine.begin() as conn:
+                        _record(conn, version, name)
+            except Exception as e:
+                raise MigrationError(f"Миграция {version}_{name} не применена: {e}") from e
+            logger.info("✅ Миграция %s_%s применена за %.1f сек", version, name, time.monotonic() - started)
+            applied_now.append(version)
+    if not applied_now:
+        logger.info("✅ Схема БД актуальна")
+    return applied_now
+
+
+def status() -> list[tuple[str, str, bool]]:
+    """(версия, имя, применена ли)"""
+    engine = get_engine(DB_ROLE_BULK)
+    done = applied_versions(engine)
+    return [(version, name, version in done) for version, name, _ in discover_migrations()]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        upgrade()
+    elif command == "status":
+        for version, name, is_applied in status():
+            print(f"{'✅' if is_applied else '⏳'} {version}_{name}")
+    else:
+        print("Использование: python migrate.py [upgrade|status]")
+        sys.exit(2)
@@ -0,0 +1,51 @@
+"""
+Базовая схема: users и outbox в том виде, в каком их создавал init_db() через create_all.
+
+Определения таблиц заморожены здесь, а не берутся из models.py: последующие изменения
+моделей оформляются новыми миграциями. На существующей БД таблицы не пересоздаются.
+"""
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table, Text
+
+description = "Таблицы users и outbox"
+
+
+def upgrade(ctx):
+    metadata = MetaData()
+    Table(
+        "users",
+        metadata,
+        Column("user_id", BigInteger, primary_key=True),
+        Column("username", String(255), nullable=True),
+        Column("chat_id", BigInteger, nullable=True),
+        Column("status", String(20)),
+        Column("emergency_contact_username", String(255), nullable=True),
+        Column("emergency_contact_user_id", BigInteger, nullable=True),
+        Column("left_home_time", DateTime(timezone=True), nullable=True),
+        Column("warnings_sent", Integer),
+        Column("timer_seconds", Integer),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+    )
+    outbox = Table(
+        "outbox",
+        metadata,
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+        Column("idempotency_key", String(128), nullable=False, unique=True),
+        Column("chat_id", BigInteger, nullable=False),
+        Column("text", Text, nullable=False),
+        Column("priority", Integer, nullable=False),
+        Column("attempts", Integer, nullable=False),
+        Column("available_at", DateTime(timezone=True), nullable=False),
+        Column("locked_until", DateTime(timezone=True), nullable=True),
+        Column("sent_at", DateTime(timezone=True), nullable=True),
+        Column("last_error", String(500), nullable=True),
+        Column("created_at", DateTime(timezone=True)),
+    )
+    Index(
+        "ix_outbox_pending",
+        outbox.c.priority.desc(),
+        outbox.c.available_at,
+        postgresql_where=outbox.c.sent_at.is_(None),
+        sqlite_where=outbox.c.sent_at.is_(None),
+    )
+    ctx.run_in_transaction(lambda conn: metadata.create_all(conn, checkfirst=True))
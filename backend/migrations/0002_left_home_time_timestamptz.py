@@ -0,0 +1,60 @@
+"""
+Перевод users.left_home_time в timestamptz без длительной блокировки таблицы.
+
+В старых БД колонка могла быть создана как timestamp without time zone — из-за этого
+приложение получало naive datetime и исправляло его при каждом чтении
+(fix_user_left_home_time). ALTER COLUMN TYPE переписал бы всю таблицу под
+ACCESS EXCLUSIVE, поэтому:
+1. добавляем колонку left_home_time_tz и триггер, который синхронизирует ее при записи;
+2. заполняем ее батчами (naive значения трактуются как UTC);
+3. в короткой транзакции с lock_timeout меняем колонки местами и удаляем триггер.
+Шаги идемпотентны: прерванную миграцию можно запустить повторно.
+"""
+from sqlalchemy import text
+
+description = "users.left_home_time → timestamptz (батчевый бэкфилл)"
+transactional = False
+
+
+def upgrade(ctx):
+    if not ctx.is_postgres:
+        return
+    current_type = ctx.column_type("users", "left_home_time")
+    has_tz_column = ctx.column_type("users", "left_home_time_tz") is not None
+    if current_type == "timestamp with time zone" and not has_tz_column:
+        return
+
+    if not has_tz_column:
+        ctx.execute("ALTER TABLE users ADD COLUMN left_home_time_tz TIMESTAMP WITH TIME ZONE")
+    ctx.execute("""
+        CREATE OR REPLACE FUNCTION users_sync_left_home_time_tz() RETURNS trigger AS $$
+        BEGIN
+            NEW.left_home_time_tz := NEW.left_home_time AT TIME ZONE 'UTC';
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    ctx.execute("DROP TRIGGER IF EXISTS users_sync_left_home_time_tz ON users")
+    ctx.execute("""
+        CREATE TRIGGER users_sync_left_home_time_tz
+        BEFORE INSERT OR UPDATE OF left_home_time ON users
+        FOR EACH ROW EXECUTE FUNCTION users_sync_left_home_time_tz()
+    """)
+
+    ctx.backfill(
+        "users",
+        "user_id",
+        "left_home_time_tz = left_home_time AT TIME ZONE 'UTC'",
+        where="left_home_time IS NOT NULL AND left_home_time_tz IS NULL",
+    )
+
+    def swap(conn):
+        conn.execute(text("LOCK TABLE users IN ACCESS EXCLUSIVE MODE"))
+        # Строки, измененные после бэкфилла, уже синхронизированы триггером
+        conn.execute(text("DROP TRIGGER users_sync_left_home_time_tz ON users"))
+        conn.execute(text("ALTER TABLE users RENAME COLUMN left_home_time TO left_home_time_naive"))
+        conn.execute(text("ALTER TABLE users RENAME COLUMN left_home_time_tz TO left_home_time"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN left_home_time_naive"))
+        conn.execute(text("DROP FUNCTION users_sync_left_home_time_tz()"))
+
+    ctx.run_in_transaction(swap)
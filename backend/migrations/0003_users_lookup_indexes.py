@@ -0,0 +1,23 @@
+"""
+Индексы users для горячих запросов, строятся CONCURRENTLY без блокировки записи:
+- сверка планировщика выбирает пользователей «не дома»;
+- /start и /contact ищут пользователей по username и emergency_contact_username.
+"""
+description = "Индексы users: не дома, username, emergency_contact_username"
+transactional = False
+
+
+def upgrade(ctx):
+    ctx.create_index_concurrently(
+        "ix_users_away_left_home_time",
+        "users",
+        "left_home_time",
+        where="status = 'не дома'",
+    )
+    ctx.create_index_concurrently("ix_users_username", "users", "username")
+    ctx.create_index_concurrently(
+        "ix_users_emergency_contact_username",
+        "users",
+        "emergency_contact_username",
+        where="emergency_contact_user_id IS NULL",
+    )
@@ -0,0 +1,100 @@
+"""
+Журнал статусов status_events и агрегаты user_stats.
+
+На Postgres status_events секционирована по месяцам (RANGE по occurred_at):
+старые месяцы удаляются DROP/DETACH секции без VACUUM всей таблицы, а запросы
+за период читают только нужные секции. Журнал пишется в порядке времени, поэтому
+для occurred_at достаточно BRIN-индекса — он на порядки меньше B-tree.
+DEFAULT-секция принимает строки, если секция месяца еще не создана.
+Новые таблицы пустые, миграция транзакционная.
+
+Как и остальные миграции, не зависит от кода приложения: DDL секций скопирован сюда,
+дальнейшие секции создает обслуживание журнала (events.ensure_partitions).
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table
+
+description = "Таблицы status_events (секции по месяцам, BRIN) и user_stats"
+
+PARTITIONS_AHEAD = 2  # Секции текущего месяца и стольких следующих
+
+
+def _user_stats_table(metadata):
+    return Table(
+        "user_stats",
+        metadata,
+        Column("user_id", BigInteger, primary_key=True),
+        Column("outings_count", Integer, nullable=False),
+        Column("outings_total_seconds", BigInteger, nullable=False),
+        Column("outings_max_seconds", Integer, nullable=False),
+        Column("duration_histogram", JSON, nullable=False),
+        Column("outings_escalated", Integer, nullable=False),
+        Column("reminders_triggered", Integer, nullable=False),
+        Column("emergencies_triggered", Integer, nullable=False),
+        Column("last_event_at", DateTime(timezone=True), nullable=True),
+        Column("updated_at", DateTime(timezone=True), nullable=True),
+    )
+
+
+def _month_start(year: int, month: int) -> datetime:
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def _create_monthly_partitions(conn) -> None:
+    now = datetime.now(timezone.utc)
+    for offset in range(PARTITIONS_AHEAD + 1):
+        start = _month_start(now.year, now.month + offset)
+        end = _month_start(now.year, now.month + offset + 1)
+        conn.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS status_events_p{start:%Y%m} PARTITION OF status_events "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+
+def _create_partitioned_events(conn):
+    conn.exec_driver_sql("CREATE SEQUENCE IF NOT EXISTS status_events_id_seq")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS status_events (
+            id BIGINT NOT NULL DEFAULT nextval('status_events_id_seq'),
+            user_id BIGINT NOT NULL,
+            event_type VARCHAR(32) NOT NULL,
+            occurred_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            outing_started_at TIMESTAMP WITH TIME ZONE,
+            duration_seconds INTEGER,
+            warnings_sent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, occurred_at)
+        ) PARTITION BY RANGE (occurred_at)
+    """)
+    conn.exec_driver_sql("ALTER SEQUENCE status_events_id_seq OWNED BY status_events.id")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_status_events_occurred_at_brin ON status_events USING brin (occurred_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_status_events_user_occurred_at ON status_events (user_id, occurred_at)"
+    )
+    conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS status_events_default PARTITION OF status_events DEFAULT")
+    _create_monthly_partitions(conn)
+
+
+def upgrade(ctx):
+    metadata = MetaData()
+    _user_stats_table(metadata)
+    if ctx.is_postgres:
+        ctx.run_in_transaction(_create_partitioned_events)
+    else:
+        events = Table(
+            "status_events",
+            metadata,
+            Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+            Column("user_id", BigInteger, nullable=False),
+            Column("event_type", String(32), nullable=False),
+            Column("occurred_at", DateTime(timezone=True), nullable=False),
+            Column("outing_started_at", DateTime(timezone=True), nullable=True),
+            Column("duration_seconds", Integer, nullable=True),
+            Column("warnings_sent", Integer, nullable=False),
+        )
+        Index("ix_status_events_user_occurred_at", events.c.user_id, events.c.occurred_at)
+    ctx.run_in_transaction(lambda conn: metadata.create_all(conn, checkfirst=True))
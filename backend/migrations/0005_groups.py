@@ -0,0 +1,34 @@
+"""
+Группы и участники: groups и group_memberships.
+
+Первичный ключ group_memberships (group_id, user_id) обслуживает выборку участников
+группы в join с users; индекс по user_id — поиск групп пользователя при переходе.
+Новые таблицы пустые, миграция транзакционная.
+"""
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table
+
+description = "Таблицы groups и group_memberships"
+
+
+def upgrade(ctx):
+    metadata = MetaData()
+    Table(
+        "groups",
+        metadata,
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+        Column("name", String(64), nullable=False),
+        Column("invite_code", String(32), nullable=False, unique=True),
+        Column("owner_user_id", BigInteger, nullable=False),
+        Column("status_version", BigInteger, nullable=False),
+        Column("created_at", DateTime(timezone=True)),
+    )
+    memberships = Table(
+        "group_memberships",
+        metadata,
+        Column("group_id", BigInteger, primary_key=True),
+        Column("user_id", BigInteger, primary_key=True),
+        Column("role", String(16), nullable=False),
+        Column("joined_at", DateTime(timezone=True)),
+    )
+    Index("ix_group_memberships_user_id", memberships.c.user_id)
+    ctx.run_in_transaction(lambda conn: metadata.create_all(conn, checkfirst=True))
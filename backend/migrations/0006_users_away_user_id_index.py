@@ -0,0 +1,17 @@
+"""
+Индекс для постраничной сверки планировщика: пользователи «не дома» по возрастанию user_id.
+
+Сверка читает их keyset-страницами (user_id > последний из предыдущей страницы) —
+частичный индекс отдает каждую страницу без просмотра пользователей «дома».
+"""
+description = "Индекс users: не дома по user_id (keyset-сверка планировщика)"
+transactional = False
+
+
+def upgrade(ctx):
+    ctx.create_index_concurrently(
+        "ix_users_away_user_id",
+        "users",
+        "user_id",
+        where="status = 'не дома'",
+    )
@@ -0,0 +1,13 @@
+"""
+Терминальное состояние outbox: failed_at.
+
+Строка с failed_at больше не забирается дрейнером — это сообщения, которые Telegram
+отклонил окончательно (чат удален, бот заблокирован), и сообщения, исчерпавшие попытки.
+Колонка nullable без значения по умолчанию: на Postgres ADD COLUMN меняет только каталог
+и не переписывает таблицу, поэтому миграция транзакционная (под lock_timeout).
+"""
+description = "outbox.failed_at — окончательно недоставленные сообщения"
+
+
+def upgrade(ctx):
+    ctx.execute("ALTER TABLE outbox ADD COLUMN failed_at TIMESTAMP WITH TIME ZONE")
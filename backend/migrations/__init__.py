@@ -0,0 +1 @@
+"""Версионные миграции схемы (см. migrate.py)."""
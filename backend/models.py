@@ -1,12 +1,42 @@
 from datetime import datetime, timezone
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
-import os
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime, Boolean, Index, JSON
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
+from contextlib import contextmanager
+from threading import Lock
+import logging
+
+from config import (
+    DB_ROLE_BULK,
+    DB_ROLE_REQUEST,
+    DB_ROLE_SCHEDULER,
+    DEFAULT_TIMER_SECONDS,
+    PRE_PING_ALWAYS,
+    get_database_url,
+    get_db_pool_settings,
+)
+from db_metrics import instrument_engine, pools_snapshot
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
 
+class NaiveUTCDateTime(TypeDecorator):
+    """Колонка TIMESTAMP WITHOUT TIME ZONE, в которую пишутся aware-datetime в UTC.
+
+    psycopg2 и SQLite молча отбрасывают зону, asyncpg (asgi.py) такое значение отклоняет —
+    приводим к UTC и убираем tzinfo сами; хранимые значения не меняются.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -19,8 +49,20 @@ class User(Base):
     left_home_time = Column(DateTime(timezone=True), nullable=True)
     warnings_sent = Column(Integer, default=0)
     timer_seconds = Column(Integer, default=3600)  # Таймер в секундах (по умолчанию 1 час)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(NaiveUTCDateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(NaiveUTCDateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    # Индексы создаются миграциями 0003 и 0006 (CONCURRENTLY); здесь — для полноты метаданных
+    __table_args__ = (
+        Index("ix_users_away_left_home_time", left_home_time, postgresql_where=status == "не дома"),
+        Index("ix_users_away_user_id", user_id, postgresql_where=status == "не дома"),
+        Index("ix_users_username", username),
+        Index(
+            "ix_users_emergency_contact_username",
+            emergency_contact_username,
+            postgresql_where=emergency_contact_user_id.is_(None),
+        ),
+    )
 
     def to_dict(self):
         return {
@@ -36,29 +78,271 @@ class User(Base):
         }
 
 
-# Настройка подключения к БД
-DATABASE_URL = os.environ.get("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError("Переменная окружения DATABASE_URL не установлена")
+class OutboxMessage(Base):
+    """Исходящее сообщение Telegram (transactional outbox).
+
+    Строка пишется в той же транзакции, что и изменение состояния пользователя,
+    и доставляется отдельным дрейнером (см. outbox.py).
+    """
+    __tablename__ = "outbox"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    idempotency_key = Column(String(128), nullable=False, unique=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)  # Больше — важнее (экстренные уведомления)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    failed_at = Column(DateTime(timezone=True), nullable=True)  # Окончательно не доставлено, не повторяется
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # Дрейнер выбирает только недоставленные строки
+        Index(
+            "ix_outbox_pending",
+            priority.desc(),
+            available_at,
+            postgresql_where=sent_at.is_(None),
+            sqlite_where=sent_at.is_(None),
+        ),
+    )
+
+
+class StatusEvent(Base):
+    """Событие журнала статусов (только добавление, строки не изменяются).
+
+    На Postgres таблица секционирована по месяцам по occurred_at и имеет BRIN-индекс
+    (миграция 0004); первичный ключ там — (id, occurred_at).
+    """
+    __tablename__ = "status_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)
+    event_type = Column(String(32), nullable=False)  # См. events.EVENT_TYPES
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    outing_started_at = Column(DateTime(timezone=True), nullable=True)  # left_home_time выхода, к которому относится событие
+    duration_seconds = Column(Integer, nullable=True)  # Длительность выхода (для returned_home)
+    warnings_sent = Column(Integer, nullable=False, default=0)  # Этап эскалации на момент события
+
+    __table_args__ = (
+        Index("ix_status_events_user_occurred_at", user_id, occurred_at),
+    )
+
+
+class UserStats(Base):
+    """Агрегаты по пользователю, обновляются инкрементально вместе с записью в status_events"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(BigInteger, primary_key=True)
+    outings_count = Column(Integer, nullable=False, default=0)  # Завершенные выходы (вернулся домой)
+    outings_total_seconds = Column(BigInteger, nullable=False, default=0)
+    outings_max_seconds = Column(Integer, nullable=False, default=0)
+    duration_histogram = Column(JSON, nullable=False, default=list)  # Счетчики по events.DURATION_BUCKETS
+    outings_escalated = Column(Integer, nullable=False, default=0)  # Выходы, по которым было хотя бы одно напоминание
+    reminders_triggered = Column(Integer, nullable=False, default=0)
+    emergencies_triggered = Column(Integer, nullable=False, default=0)
+    last_event_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class Group(Base):
+    """Группа (семья/домохозяйство): участники видят статусы друг друга"""
+    __tablename__ = "groups"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    name = Column(String(64), nullable=False)
+    invite_code = Column(String(32), nullable=False, unique=True)
+    owner_user_id = Column(BigInteger, nullable=False)
+    # Увеличивается при каждом переходе любого участника — ключ кеша статуса группы (см. groups.py)
+    status_version = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class GroupMembership(Base):
+    """Участие пользователя в группе"""
+    __tablename__ = "group_memberships"
+
+    group_id = Column(BigInteger, primary_key=True)  # Первичный ключ (group_id, user_id) обслуживает выборку участников
+    user_id = Column(BigInteger, primary_key=True)
+    role = Column(String(16), nullable=False, default="member")  # "owner" или "member"
+    joined_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
-# Для PostgreSQL на Render может потребоваться замена postgres:// на postgresql://
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    __table_args__ = (
+        # Группы пользователя: инвалидация кеша при переходе и список «мои группы»
+        Index("ix_group_memberships_user_id", user_id),
+    )
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+
+# Настройка подключения к БД.
+# Engine создается при первом обращении: импорт models не читает DATABASE_URL и не трогает драйвер БД.
+# У каждой роли (request / scheduler / bulk) свой engine и пул, чтобы таймеры и массовые задачи
+# не забирали соединения у HTTP-запросов.
+SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False))
+SchedulerSession = scoped_session(sessionmaker(autocommit=False, autoflush=False))
+BulkSession = scoped_session(sessionmaker(autocommit=False, autoflush=False))
+_SESSIONS = {
+    DB_ROLE_REQUEST: SessionLocal,
+    DB_ROLE_SCHEDULER: SchedulerSession,
+    DB_ROLE_BULK: BulkSession,
+}
+_engines = {}
+_engine_lock = Lock()
+
+
+def _create_engine_for_role(role: str):
+    url = get_database_url()
+    settings = get_db_pool_settings(role)
+    kwargs = {"pool_pre_ping": settings["pre_ping"] == PRE_PING_ALWAYS}
+    if url.startswith("sqlite"):
+        # Локальная разработка: у SQLite свой пул, серверные параметры не применимы
+        engine = create_engine(url, **kwargs)
+        instrument_engine(engine, role, 0, settings["saturation_warn_ratio"])
+        return engine
+    connect_args = {"application_name": settings["application_name"]}
+    if settings["statement_timeout_ms"] > 0:
+        connect_args["options"] = f"-c statement_timeout={settings['statement_timeout_ms']}"
+    engine = create_engine(
+        url,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        pool_recycle=settings["pool_recycle"],
+        pool_use_lifo=True,  # Лишние соединения простаивают и закрываются по pool_recycle
+        connect_args=connect_args,
+        **kwargs,
+    )
+    instrument_engine(
+        engine,
+        role,
+        settings["pool_size"] + settings["max_overflow"],
+        settings["saturation_warn_ratio"],
+    )
+    logger.info("🗄️ Пул БД %s: pool_size=%s, max_overflow=%s, pre_ping=%s, statement_timeout=%s мс",
+                role, settings["pool_size"], settings["max_overflow"], settings["pre_ping"],
+                settings["statement_timeout_ms"])
+    return engine
+
+
+def get_engine(role: str = DB_ROLE_REQUEST):
+    """Возвращает engine роли, создавая его при первом вызове"""
+    engine = _engines.get(role)
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(role)
+            if engine is None:
+                engine = _create_engine_for_role(role)
+                _SESSIONS[role].configure(bind=engine)
+                _engines[role] = engine
+    return engine
+
+
+def db_pools_snapshot() -> dict:
+    """Телеметрия созданных пулов (для /debug)"""
+    return pools_snapshot(dict(_engines))
+
+
+def __getattr__(name):
+    # Обратная совместимость: from models import engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def init_db():
-    """Создает все таблицы в БД"""
-    Base.metadata.create_all(bind=engine)
+    """Применяет миграции схемы (см. migrate.py)"""
+    from migrate import upgrade
+
+    upgrade()
+
+
+@contextmanager
+def get_db_session(role: str = DB_ROLE_REQUEST):
+    """Контекстный менеджер для работы с БД"""
+    get_engine(role)
+    session = _SESSIONS[role]()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
 
 
 def get_db():
     """Получить сессию БД"""
+    get_engine()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
+
+def ensure_utc_aware(dt):
+    """Преобразует datetime в UTC-aware формат"""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def fix_user_left_home_time(user):
+    """Исправляет left_home_time пользователя, если оно timezone-naive"""
+    if user and user.left_home_time and user.left_home_time.tzinfo is None:
+        logger.warning("⚠️ Исправление timezone-naive left_home_time для user_id=%s", user.user_id)
+        user.left_home_time = user.left_home_time.replace(tzinfo=timezone.utc)
+        return True
+    return False
+
+
+def get_or_create_user(db, user_id: int) -> User:
+    """Пользователь по id; отсутствующий создается со статусом «дома» (в текущей транзакции)"""
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        user = User(
+            user_id=user_id,
+            status="дома",
+            warnings_sent=0,
+            timer_seconds=DEFAULT_TIMER_SECONDS,  # По умолчанию 1 час
+        )
+        db.add(user)
+        db.flush()
+    return user
+
+
+def get_user(user_id: int):
+    """Получить пользователя из БД и вернуть словарь с данными"""
+    with get_db_session() as db:
+        user = get_or_create_user(db, user_id)
+        # Возвращаем словарь, чтобы избежать detached instance
+        return {
+            "user_id": user.user_id,
+            "status": user.status,
+            "username": user.username,
+            "chat_id": user.chat_id,
+            "emergency_contact_username": user.emergency_contact_username,
+            "emergency_contact_user_id": user.emergency_contact_user_id,
+            "timer_seconds": user.timer_seconds,
+            "warnings_sent": user.warnings_sent,
+        }
+
+
+def update_user(user_id: int, **kwargs):
+    """Обновить данные пользователя"""
+    with get_db_session() as db:
+        user = db.query(User).filter(User.user_id == user_id).first()
+        if not user:
+            user = User(user_id=user_id, **kwargs)
+            db.add(user)
+        else:
+            for key, value in kwargs.items():
+                setattr(user, key, value)
+            user.updated_at = datetime.now(timezone.utc)
+        db.commit()
+        return user
@@ -0,0 +1,434 @@
+"""
+Transactional outbox для исходящих сообщений Telegram.
+
+Сообщение пишется в таблицу outbox в той же транзакции, что и изменение
+состояния пользователя (например, warnings_sent). Дрейнер отправляет строки
+двумя независимыми полосами — экстренной (priority >= PRIORITY_EMERGENCY) и
+обычной: у каждой свой цикл, свой claim и свои слоты отправки, поэтому медленные
+напоминания не задерживают экстренные уведомления. Полоса забирает ровно столько
+строк, сколько у нее свободных слотов, и отмечает каждую сразу после отправки:
+захваченная строка не ждет в очереди, и OUTBOX_CLAIM_TTL должен покрывать только
+одну отправку (с ожиданием bulkhead и бюджетом экстренных повторов — около 25 сек).
+Гарантия — at-least-once: при падении между отправкой и отметкой строка
+будет отправлена повторно после истечения блокировки.
+
+Жизненный цикл строки: ожидает → sent_at (доставлено) или failed_at (отклонено
+окончательно — PermanentSendError — либо исчерпаны попытки). Отправка, которую клиент
+не начал (DeferredSendError: открыт circuit breaker, заполнен bulkhead), попытку не
+расходует — строка откладывается до указанного срока, и сбой Bot API любой длительности
+не приводит к failed_at. Строки в конечном
+состоянии удаляются через OUTBOX_RETENTION_DAYS дней (prune_outbox).
+
+run_outbox_worker — потоки полос с ThreadPoolExecutor для отправок (app.py, worker.py),
+run_outbox_worker_async — задачи цикла событий ASGI-рантайма (asgi.py).
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Event, Thread
+from typing import Awaitable, Callable
+
+from sqlalchemy import and_, delete, or_, select
+
+from config import DB_ROLE_BULK, DB_ROLE_SCHEDULER
+from models import OutboxMessage, get_db_session
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_NORMAL = 0
+PRIORITY_EMERGENCY = 10
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_CLAIM_TTL = int(os.environ.get("OUTBOX_CLAIM_TTL", "60"))  # Секунд, на которые строка «занята» дрейнером
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "10"))
+# Экстренные повторяются дольше: при паузе до OUTBOX_MAX_BACKOFF это около четырех часов
+OUTBOX_MAX_EMERGENCY_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_EMERGENCY_ATTEMPTS", "50"))
+OUTBOX_MAX_BACKOFF = 300
+OUTBOX_RETENTION_DAYS = float(os.environ.get("OUTBOX_RETENTION_DAYS", "7"))
+OUTBOX_PRUNE_INTERVAL = float(os.environ.get("OUTBOX_PRUNE_INTERVAL", "3600"))  # Секунд между очистками
+OUTBOX_PRUNE_BATCH = 5000
+# Слоты отправки полос; по умолчанию равны bulkhead telegram_client (TELEGRAM_MAX_CONCURRENCY,
+# TELEGRAM_EMERGENCY_CONCURRENCY) — лишние слоты только ждали бы свободный bulkhead
+OUTBOX_SEND_CONCURRENCY = int(os.environ.get("OUTBOX_SEND_CONCURRENCY", "4"))
+OUTBOX_EMERGENCY_CONCURRENCY = int(os.environ.get("OUTBOX_EMERGENCY_CONCURRENCY", "2"))
+
+# send_fn(chat_id, text, emergency) -> bool
+SendFn = Callable[[int, str, bool], bool]
+# Асинхронный вариант для run_outbox_worker_async: await send_fn(chat_id, text, emergency) -> bool
+AsyncSendFn = Callable[[int, str, bool], Awaitable[bool]]
+
+
+class PermanentSendError(Exception):
+    """send_fn: получатель отклонил сообщение окончательно, повтор бессмыслен"""
+
+
+class DeferredSendError(Exception):
+    """send_fn: отправка не начиналась (breaker, bulkhead) — повторить через delay секунд, не считая попытку"""
+
+    def __init__(self, message: str, delay: float = 0.0):
+        super().__init__(message)
+        self.delay = delay
+
+
+# Будильники полос: {emergency: Event}
+_wake = {False: Event(), True: Event()}
+# Будильники асинхронного дрейнера: (цикл событий, [asyncio.Event полос]), если он запущен
+_async_wake: tuple | None = None
+
+
+def enqueue_message(db, chat_id: int, text: str, idempotency_key: str, priority: int = PRIORITY_NORMAL) -> bool:
+    """Добавляет сообщение в outbox в текущей транзакции.
+
+    Возвращает False, если сообщение с таким idempotency_key уже поставлено в очередь.
+    """
+    exists = db.query(OutboxMessage.id).filter(OutboxMessage.idempotency_key == idempotency_key).first()
+    if exists:
+        logger.info("⏭️ Сообщение уже в outbox: key=%s", idempotency_key)
+        return False
+    db.add(
+        OutboxMessage(
+            idempotency_key=idempotency_key,
+            chat_id=chat_id,
+            text=text,
+            priority=priority,
+            attempts=0,
+            available_at=datetime.now(timezone.utc),
+        )
+    )
+    return True
+
+
+def notify_outbox() -> None:
+    """Будит дрейнер после коммита новых сообщений"""
+    for event in _wake.values():
+        event.set()
+    if _async_wake is not None:
+        loop, events = _async_wake
+        for event in events:
+            loop.call_soon_threadsafe(event.set)
+
+
+def _backoff_seconds(attempts: int) -> int:
+    return min(OUTBOX_MAX_BACKOFF, 2 ** max(0, attempts - 1))
+
+
+def _max_attempts(priority: int) -> int:
+    return OUTBOX_MAX_EMERGENCY_ATTEMPTS if priority >= PRIORITY_EMERGENCY else OUTBOX_MAX_ATTEMPTS
+
+
+def claim_rows(db, limit: int = OUTBOX_BATCH_SIZE, emergency: bool | None = None) -> list[dict]:
+    """Забирает пачку готовых к отправке сообщений и блокирует их на OUTBOX_CLAIM_TTL секунд (в транзакции db)
+
+    emergency: True — только экстренные, False — только обычные, None — все.
+    """
+    now = datetime.now(timezone.utc)
+    query = db.query(OutboxMessage)
+    if emergency is not None:
+        query = query.filter(
+            OutboxMessage.priority >= PRIORITY_EMERGENCY if emergency else OutboxMessage.priority < PRIORITY_EMERGENCY
+        )
+    rows = (
+        query
+        .filter(
+            OutboxMessage.sent_at.is_(None),
+            OutboxMessage.failed_at.is_(None),
+            OutboxMessage.available_at <= now,
+            or_(OutboxMessage.locked_until.is_(None), OutboxMessage.locked_until < now),
+            or_(
+                OutboxMessage.attempts < OUTBOX_MAX_ATTEMPTS,
+                and_(
+                    OutboxMessage.priority >= PRIORITY_EMERGENCY,
+                    OutboxMessage.attempts < OUTBOX_MAX_EMERGENCY_ATTEMPTS,
+                ),
+            ),
+        )
+        .order_by(OutboxMessage.priority.desc(), OutboxMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    locked_until = now + timedelta(seconds=OUTBOX_CLAIM_TTL)
+    claimed = []
+    for row in rows:
+        row.locked_until = locked_until
+        row.attempts = (row.attempts or 0) + 1
+        claimed.append(
+            {
+                "id": row.id,
+                "idempotency_key": row.idempotency_key,
+                "chat_id": row.chat_id,
+                "text": row.text,
+                "priority": row.priority,
+                "attempts": row.attempts,
+            }
+        )
+    return claimed
+
+
+def finalize_rows(db, delivered: list[int], failed: list[dict]) -> None:
+    """Помечает доставленные и откладывает неудачные сообщения (в транзакции db).
+
+    Неудачное сообщение с item["permanent"] или исчерпавшее попытки получает failed_at.
+    Сообщение с item["deferred"] (секунды) откладывается без расхода попытки,
+    взятой при захвате, но не раньше следующего опроса.
+    """
+    if not delivered and not failed:
+        return
+    now = datetime.now(timezone.utc)
+    if delivered:
+        db.query(OutboxMessage).filter(OutboxMessage.id.in_(delivered)).update(
+            {
+                OutboxMessage.sent_at: now,
+                OutboxMessage.locked_until: None,
+                OutboxMessage.last_error: None,
+            },
+            synchronize_session=False,
+        )
+    if failed:
+        mappings = []
+        for item in failed:
+            mapping = {
+                "id": item["id"],
+                "locked_until": None,
+                "last_error": (item.get("error") or "send failed")[:500],
+            }
+            if "deferred" in item:
+                mapping["attempts"] = item["attempts"] - 1
+                delay = max(OUTBOX_POLL_INTERVAL, item["deferred"])
+                mapping["available_at"] = now + timedelta(seconds=delay)
+            elif item.get("permanent") or item["attempts"] >= _max_attempts(item["priority"]):
+                mapping["failed_at"] = now
+                logger.error("🚫 Сообщение не доставлено окончательно: key=%s, попыток=%s, error=%s",
+                             item["idempotency_key"], item["attempts"], mapping["last_error"])
+            else:
+                mapping["available_at"] = now + timedelta(seconds=_backoff_seconds(item["attempts"]))
+            mappings.append(mapping)
+        db.bulk_update_mappings(OutboxMessage, mappings)
+
+
+def prune_rows(db, older_than: datetime, limit: int = OUTBOX_PRUNE_BATCH) -> int:
+    """Удаляет до limit строк, доставленных или отклоненных раньше older_than. Возвращает их число"""
+    ids = select(OutboxMessage.id).where(
+        or_(OutboxMessage.sent_at < older_than, OutboxMessage.failed_at < older_than)
+    ).limit(limit)
+    result = db.execute(
+        delete(OutboxMessage).where(OutboxMessage.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+
+def prune_outbox(retention_days: float = OUTBOX_RETENTION_DAYS) -> int:
+    """Удаляет строки в конечном состоянии старше retention_days дней короткими транзакциями"""
+    older_than = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        with get_db_session(DB_ROLE_BULK) as db:
+            deleted = prune_rows(db, older_than)
+        total += deleted
+        if deleted < OUTBOX_PRUNE_BATCH:
+            break
+    if total:
+        logger.info("🧹 Outbox: удалено %s строк старше %s дн.", total, retention_days)
+    return total
+
+
+def claim_batch(limit: int = OUTBOX_BATCH_SIZE, emergency: bool | None = None) -> list[dict]:
+    """claim_rows в отдельной транзакции"""
+    with get_db_session(DB_ROLE_SCHEDULER) as db:
+        return claim_rows(db, limit, emergency)
+
+
+def finalize_batch(delivered: list[int], failed: list[dict]) -> None:
+    """Одной транзакцией помечает доставленные и откладывает неудачные сообщения"""
+    if not delivered and not failed:
+        return
+    with get_db_session(DB_ROLE_SCHEDULER) as db:
+        finalize_rows(db, delivered, failed)
+
+
+def _lane_name(emergency: bool) -> str:
+    return "emergency" if emergency else "regular"
+
+
+def _lane_concurrency(emergency: bool) -> int:
+    return OUTBOX_EMERGENCY_CONCURRENCY if emergency else OUTBOX_SEND_CONCURRENCY
+
+
+def _split_results(finished: list[tuple[dict, bool]]) -> tuple[list[int], list[dict]]:
+    """(id доставленных, неудачные) по результатам отправки"""
+    delivered = [item["id"] for item, ok in finished if ok]
+    failed = [item for item, ok in finished if not ok]
+    for item in failed:
+        if not item.get("permanent") and "deferred" not in item:
+            logger.warning("🔁 Сообщение будет отправлено повторно: key=%s, попытка=%s",
+                           item["idempotency_key"], item["attempts"])
+    logger.debug("📬 Outbox: доставлено=%s, отложено=%s", len(delivered), len(failed))
+    return delivered, failed
+
+
+def _send_item(send_fn: SendFn, item: dict) -> bool:
+    try:
+        return bool(send_fn(item["chat_id"], item["text"], item["priority"] >= PRIORITY_EMERGENCY))
+    except PermanentSendError as e:
+        item["error"] = str(e)
+        item["permanent"] = True
+        return False
+    except DeferredSendError as e:
+        item["error"] = str(e)
+        item["deferred"] = e.delay
+        return False
+    except Exception as e:
+        logger.exception("❌ Ошибка отправки из outbox: key=%s, error=%s", item["idempotency_key"], e)
+        item["error"] = str(e)
+        return False
+
+
+def _finalize_futures(in_flight: dict[Future, dict], done) -> None:
+    finalize_batch(*_split_results([(in_flight.pop(future), future.result()) for future in done]))
+
+
+def run_outbox_lane(send_fn: SendFn, emergency: bool, stop_event: Event) -> None:
+    """Цикл одной полосы: держит в работе до _lane_concurrency сообщений и отмечает каждое по готовности"""
+    lane = _lane_name(emergency)
+    concurrency = _lane_concurrency(emergency)
+    wake = _wake[emergency]
+    in_flight: dict[Future, dict] = {}
+    next_prune = time.monotonic()
+    logger.info("📮 Outbox-полоса %s запущена (слотов=%s, interval=%s сек)", lane, concurrency, OUTBOX_POLL_INTERVAL)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"OutboxSend-{lane}") as executor:
+        while not stop_event.is_set():
+            try:
+                # Сброс до claim: notify_outbox() после него разбудит следующее ожидание
+                wake.clear()
+                free = concurrency - len(in_flight)
+                for item in claim_batch(free, emergency) if free else []:
+                    in_flight[executor.submit(_send_item, send_fn, item)] = item
+                if not emergency and time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + OUTBOX_PRUNE_INTERVAL
+                    prune_outbox()
+                if not in_flight:
+                    wake.wait(OUTBOX_POLL_INTERVAL)
+                    continue
+                done, _ = wait(in_flight, timeout=OUTBOX_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                _finalize_futures(in_flight, done)
+            except Exception as e:
+                logger.exception("❌ Ошибка outbox-полосы %s: %s", lane, e)
+                stop_event.wait(OUTBOX_POLL_INTERVAL)
+        if in_flight:
+            # Отправленное до остановки должно быть отмечено, иначе уйдет повторно
+            _finalize_futures(in_flight, wait(in_flight).done)
+
+
+def run_outbox_worker(send_fn: SendFn, stop_event: Event | None = None) -> None:
+    """Дрейнер: экстренная полоса в отдельном потоке, обычная — в текущем"""
+    stop_event = stop_event or Event()
+    emergency = Thread(target=run_outbox_lane, args=(send_fn, True, stop_event), daemon=True,
+                       name="OutboxEmergencyThread")
+    emergency.start()
+    run_outbox_lane(send_fn, False, stop_event)
+    emergency.join()
+
+
+def start_outbox_worker(send_fn: SendFn, stop_event: Event | None = None) -> Thread:
+    """Запускает дрейнер в фоновом потоке"""
+    thread = Thread(target=run_outbox_worker, args=(send_fn, stop_event), daemon=True, name="OutboxThread")
+    thread.start()
+    return thread
+
+
+async def _send_item_async(send_fn: AsyncSendFn, item: dict) -> bool:
+    try:
+        return bool(await send_fn(item["chat_id"], item["text"], item["priority"] >= PRIORITY_EMERGENCY))
+    except PermanentSendError as e:
+        item["error"] = str(e)
+        item["permanent"] = True
+        return False
+    except DeferredSendError as e:
+        item["error"] = str(e)
+        item["deferred"] = e.delay
+        return False
+    except Exception as e:
+        logger.exception("❌ Ошибка отправки из outbox: key=%s, error=%s", item["idempotency_key"], e)
+        item["error"] = str(e)
+        return False
+
+
+async def _prune_outbox_async(retention_days: float = OUTBOX_RETENTION_DAYS) -> int:
+    """prune_outbox через асинхронный драйвер"""
+    import async_db
+
+    older_than = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    total = 0
+    while True:
+        deleted = await async_db.run_sync(prune_rows, older_than, role=DB_ROLE_BULK)
+        total += deleted
+        if deleted < OUTBOX_PRUNE_BATCH:
+            break
+    if total:
+        logger.info("🧹 Outbox: удалено %s строк старше %s дн.", total, retention_days)
+    return total
+
+
+async def _run_outbox_lane_async(send_fn: AsyncSendFn, emergency: bool, stop: asyncio.Event,
+                                 wake: asyncio.Event) -> None:
+    """run_outbox_lane для цикла событий: отправки — задачи, а не потоки ThreadPoolExecutor"""
+    import async_db  # Лениво: потоковому рантайму асинхронные драйверы не нужны
+
+    lane = _lane_name(emergency)
+    concurrency = _lane_concurrency(emergency)
+    in_flight: dict[asyncio.Task, dict] = {}
+    next_prune = time.monotonic()
+    logger.info("📮 Асинхронная outbox-полоса %s запущена (слотов=%s, interval=%s сек)",
+                lane, concurrency, OUTBOX_POLL_INTERVAL)
+    try:
+        while True:
+            try:
+                wake.clear()
+                free = concurrency - len(in_flight)
+                batch = await async_db.run_sync(claim_rows, free, emergency, role=DB_ROLE_SCHEDULER) if free else []
+                for item in batch:
+                    in_flight[asyncio.ensure_future(_send_item_async(send_fn, item))] = item
+                if not emergency and time.monotonic() >= next_prune and not stop.is_set():
+                    next_prune = time.monotonic() + OUTBOX_PRUNE_INTERVAL
+                    await _prune_outbox_async()
+                if not in_flight:
+                    if stop.is_set():
+                        return
+                    waiters = {asyncio.ensure_future(stop.wait()), asyncio.ensure_future(wake.wait())}
+                    await asyncio.wait(waiters, timeout=OUTBOX_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                    for waiter in waiters:
+                        waiter.cancel()
+                    continue
+                done, _ = await asyncio.wait(in_flight, timeout=OUTBOX_POLL_INTERVAL,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                delivered, failed = _split_results([(in_flight.pop(task), task.result()) for task in done])
+                # Финализация не прерывается отменой задачи при остановке: отправленное должно быть отмечено
+                await asyncio.shield(async_db.run_sync(finalize_rows, delivered, failed, role=DB_ROLE_SCHEDULER))
+            except Exception as e:
+                logger.exception("❌ Ошибка outbox-полосы %s: %s", lane, e)
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+    finally:
+        # Строки незавершенных отправок будут отправлены повторно после OUTBOX_CLAIM_TTL
+        for task in in_flight:
+            task.cancel()
+
+
+async def run_outbox_worker_async(send_fn: AsyncSendFn, stop: asyncio.Event) -> None:
+    """Дрейнер в цикле событий (asgi.py): экстренная и обычная полосы — отдельные задачи.
+
+    После stop.set() не ждет новых сообщений: отправляет уже готовые и выходит,
+    когда очередь пуста (вызывающий ограничивает это время таймаутом).
+    """
+    global _async_wake
+    wakes = {emergency: asyncio.Event() for emergency in (True, False)}
+    _async_wake = (asyncio.get_running_loop(), list(wakes.values()))
+    try:
+        await asyncio.gather(*(
+            _run_outbox_lane_async(send_fn, emergency, stop, wake) for emergency, wake in wakes.items()
+        ))
+    finally:
+        _async_wake = None
@@ -0,0 +1,216 @@
+"""
+Профилирование отдельного HTTP-запроса по заголовку X-Debug-Profile.
+
+Если значение заголовка совпадает с DEBUG_SECRET, на время этого запроса:
+- фоновый поток снимает стек потока-обработчика через sys._current_frames()
+  каждые PROFILE_SAMPLE_INTERVAL секунд (сэмплирующий профайлер);
+- слушатели событий SQLAlchemy считают запросы к БД и их время — только из потока
+  этого запроса.
+Профиль сохраняется в памяти процесса (последние PROFILE_STORE_SIZE) и доступен по id
+из заголовка ответа X-Profile-Id: GET /debug/profiles/<id> — JSON со сводкой SQL,
+?format=collapsed — стеки в формате collapsed (flamegraph.pl, speedscope).
+
+Хуки регистрируются, только если задан DEBUG_SECRET; обычный запрос тратит
+на профилирование одну проверку заголовка.
+"""
+import os
+import sys
+import hmac
+import time
+import uuid
+import logging
+from collections import Counter, OrderedDict
+from threading import Event, Lock, Thread, get_ident
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Debug-Profile"
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.001"))
+PROFILE_STORE_SIZE = int(os.environ.get("PROFILE_STORE_SIZE", "50"))
+PROFILE_MAX_DEPTH = 128
+PROFILE_TOP_STATEMENTS = 10
+
+_profiles: OrderedDict = OrderedDict()
+_profiles_lock = Lock()
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+def _fold(frame) -> str:
+    """Стек от корня к листу через ';' — строка формата collapsed"""
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class _Sampler(Thread):
+    """Снимает стек одного потока с фиксированным интервалом"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True, name="ProfileSampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+class _SqlRecorder:
+    """Счетчики SQL из событий Engine, отфильтрованные по потоку запроса"""
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.count = 0
+        self.total_seconds = 0.0
+        self.statements: dict[str, list] = {}  # SQL -> [количество, суммарное время]
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if get_ident() == self.thread_id:
+            conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if get_ident() != self.thread_id:
+            return
+        starts = conn.info.get("profile_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        self.count += 1
+        self.total_seconds += elapsed
+        entry = self.statements.setdefault(" ".join(statement.split()), [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def attach(self) -> None:
+        # Слушатели на классе Engine действуют на все engine (пулы request/scheduler/bulk)
+        event.listen(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def detach(self) -> None:
+        event.remove(Engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def summary(self) -> dict:
+        top = sorted(self.statements.items(), key=lambda kv: kv[1][1], reverse=True)[:PROFILE_TOP_STATEMENTS]
+        return {
+            "queries": self.count,
+            "total_ms": round(self.total_seconds * 1000, 3),
+            "statements": [
+                {"sql": sql, "count": count, "total_ms": round(seconds * 1000, 3)}
+                for sql, (count, seconds) in top
+            ],
+        }
+
+
+def _store(profile: dict) -> None:
+    with _profiles_lock:
+        _profiles[profile["id"]] = profile
+        while len(_profiles) > PROFILE_STORE_SIZE:
+            _profiles.popitem(last=False)
+
+
+def get_profile(profile_id: str) -> dict | None:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> list[dict]:
+    """Краткий список сохраненных профилей, новые первыми"""
+    with _profiles_lock:
+        profiles = list(_profiles.values())
+    return [
+        {key: profile[key] for key in ("id", "method", "path", "status", "duration_ms", "samples")}
+        | {"queries": profile["sql"]["queries"]}
+        for profile in reversed(profiles)
+    ]
+
+
+def collapsed_stacks(profile: dict) -> str:
+    """Профиль в формате collapsed: «кадр;кадр;кадр количество» на строку"""
+    return "\n".join(f"{stack} {count}" for stack, count in profile["stacks"].items()) + "\n"
+
+
+def _start_profile() -> None:
+    secret = os.environ.get("DEBUG_SECRET", "").strip()
+    supplied = request.headers.get(PROFILE_HEADER)
+    if not supplied or not secret or not hmac.compare_digest(supplied.strip().encode(), secret.encode()):
+        return
+    thread_id = get_ident()
+    recorder = _SqlRecorder(thread_id)
+    recorder.attach()
+    sampler = _Sampler(thread_id, PROFILE_SAMPLE_INTERVAL)
+    sampler.start()
+    g.request_profile = (uuid.uuid4().hex[:16], time.perf_counter(), sampler, recorder)
+
+
+def _finish_profile(status: int | None) -> dict | None:
+    active = g.pop("request_profile", None)
+    if active is None:
+        return None
+    profile_id, started, sampler, recorder = active
+    duration = time.perf_counter() - started
+    stacks = sampler.stop()
+    recorder.detach()
+    profile = {
+        "id": profile_id,
+        "method": request.method,
+        "path": request.path,
+        "status": status,
+        "duration_ms": round(duration * 1000, 3),
+        "sample_interval_ms": PROFILE_SAMPLE_INTERVAL * 1000,
+        "samples": sum(stacks.values()),
+        "sql": recorder.summary(),
+        "stacks": dict(stacks),
+    }
+    _store(profile)
+    logger.info("🔬 Профиль %s: %s %s — %.1f мс, SQL: %s запросов / %.1f мс",
+                profile_id, request.method, request.path, profile["duration_ms"],
+                profile["sql"]["queries"], profile["sql"]["total_ms"])
+    return profile
+
+
+def _after_request(response):
+    profile = _finish_profile(response.status_code)
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile["id"]
+        response.headers["Server-Timing"] = (
+            f"db;desc=\"{profile['sql']['queries']} queries\";dur={profile['sql']['total_ms']}, "
+            f"total;dur={profile['duration_ms']}"
+        )
+    return response
+
+
+def _teardown_request(error) -> None:
+    # Необработанное исключение: after_request не вызывался, профиль все равно сохраняем
+    if "request_profile" in g:
+        _finish_profile(500)
+
+
+def install_request_profiler(app) -> bool:
+    """Регистрирует хуки профилирования, если задан DEBUG_SECRET"""
+    if not os.environ.get("DEBUG_SECRET", "").strip():
+        return False
+    app.before_request(_start_profile)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    return True
@@ -0,0 +1,233 @@
+"""
+Rate limiting на token bucket.
+
+Лимиты задаются строками как у Flask-Limiter ("45 per minute"), ключ запроса
+вычисляет key_func (в app.py — проверенный Telegram user id, для
+неаутентифицированных запросов — IP).
+
+Хранилища:
+- memory:// — ведро в памяти процесса без блокировок: состояние ведра — неизменяемый
+  кортеж, который целиком заменяется в dict (атомарно под GIL). При гонке двух
+  потоков на одном ключе возможен пропуск одного лишнего запроса — для лимитов
+  это допустимо и дешевле блокировки на каждый запрос.
+- redis://... — общее ведро для нескольких воркеров (нужен пакет redis),
+  обновляется атомарно Lua-скриптом.
+"""
+import time
+import logging
+from functools import wraps
+from typing import Callable
+
+from flask import Flask, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+def parse_limit(spec: str) -> tuple[int, int]:
+    """'45 per minute' -> (45, 60)"""
+    parts = spec.strip().lower().split()
+    if len(parts) != 3 or parts[1] != "per":
+        raise ValueError(f"Некорректный лимит: {spec!r}")
+    amount = int(parts[0])
+    period = _PERIODS.get(parts[2].rstrip("s"))
+    if amount <= 0 or period is None:
+        raise ValueError(f"Некорректный лимит: {spec!r}")
+    return amount, period
+
+
+class MemoryTokenBuckets:
+    """Token bucket в памяти процесса"""
+
+    SWEEP_EVERY = 10000  # Раз в столько вызовов удаляем полностью восстановившиеся ведра
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}  # key -> (токены, время обновления)
+        self._calls = 0
+        self._max_period = 0
+
+    def hit(self, key: str, capacity: int, period: int) -> float:
+        """Списывает токен. Возвращает 0, если запрос разрешен, иначе секунды до появления токена"""
+        now = time.monotonic()
+        rate = capacity / period
+        state = self._buckets.get(key)
+        if state is None:
+            tokens = float(capacity)
+        else:
+            tokens, updated = state
+            tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            retry_after = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            retry_after = (1 - tokens) / rate
+        self._calls += 1
+        if period > self._max_period:
+            self._max_period = period
+        if self._calls >= self.SWEEP_EVERY:
+            self._calls = 0
+            self._sweep(now)
+        return retry_after
+
+    def _sweep(self, now: float) -> None:
+        # За max_period любое ведро восстанавливается полностью и неотличимо от нового
+        stale = [k for k, (_, updated) in list(self._buckets.items()) if now - updated > self._max_period]
+        for k in stale:
+            self._buckets.pop(k, None)
+
+
+_REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(state[1])
+local updated = tonumber(state[2])
+if tokens == nil then
+  tokens = capacity
+else
+  tokens = math.min(capacity, tokens + (now - updated) * rate)
+end
+local retry_after = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+redis.call('EXPIRE', KEYS[1], ttl)
+return tostring(retry_after)
+"""
+
+
+class RedisTokenBuckets:
+    """Token bucket в Redis, общий для всех воркеров"""
+
+    def __init__(self, uri: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Для RATE_LIMIT_STORAGE_URI=redis://... установите пакет redis") from e
+        self._client = redis.Redis.from_url(uri)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+
+    def hit(self, key: str, capacity: int, period: int) -> float:
+        try:
+            result = self._script(keys=[f"rl:{key}"], args=[capacity, capacity / period, time.time(), period])
+            return float(result)
+        except Exception as e:
+            # Недоступность Redis не должна ронять API — пропускаем запрос
+            logger.warning("⚠️ Rate limit storage недоступен: %s", e)
+            return 0.0
+
+
+def make_storage(uri: str):
+    """Хранилище ведер по RATE_LIMIT_STORAGE_URI"""
+    if uri.startswith("memory://"):
+        return MemoryTokenBuckets()
+    if uri.startswith(("redis://", "rediss://")):
+        return RedisTokenBuckets(uri)
+    raise ValueError(f"Неподдерживаемое хранилище rate limit: {uri!r}")
+
+
+def check_limits(storage, scope: str, key: str, limits: list[tuple[int, int]]) -> float:
+    """Списывает токены по всем лимитам. 0 — запрос разрешен, иначе секунды до появления токена"""
+    for capacity, period in limits:
+        retry_after = storage.hit(f"{scope}:{capacity}/{period}:{key}", capacity, period)
+        if retry_after > 0:
+            logger.warning("🚦 Rate limit: key=%s, scope=%s, лимит=%s/%s сек", key, scope, capacity, period)
+            return retry_after
+    return 0.0
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, int(retry_after + 0.999)))
+
+
+class BaseRateLimiter:
+    """Общая часть лимитера Flask (RateLimiter) и ASGI (asgi.AsyncRateLimiter).
+
+    Эндпоинты без limit() получают default_limits (как в Flask-Limiter), кроме exempt().
+    """
+
+    def __init__(self, *, default_limits: list[str] | None = None, storage_uri: str = "memory://"):
+        self.default_limits = [parse_limit(s) for s in (default_limits or [])]
+        self.storage = make_storage(storage_uri)
+        self._limited_views: set[str] = set()
+
+    def exempt(self, fn):
+        """Декоратор: эндпоинт без default_limits"""
+        self._limited_views.add(fn.__name__)
+        return fn
+
+    def _register(self, fn, spec: str) -> tuple[str, list[tuple[int, int]]]:
+        """(scope, лимиты) эндпоинта с явным limit(spec)"""
+        self._limited_views.add(fn.__name__)
+        return fn.__name__, [parse_limit(spec)]
+
+    def _default_scope(self, endpoint: str | None) -> str | None:
+        """scope лимитов по умолчанию или None, если они к эндпоинту не применяются"""
+        if not self.default_limits or endpoint is None or endpoint in self._limited_views:
+            return None
+        return f"default:{endpoint}"
+
+
+class RateLimiter(BaseRateLimiter):
+    """Декоратор лимитов для Flask-эндпоинтов"""
+
+    def __init__(
+        self,
+        key_func: Callable[[], str],
+        app: Flask | None = None,
+        *,
+        default_limits: list[str] | None = None,
+        storage_uri: str = "memory://",
+    ):
+        super().__init__(default_limits=default_limits, storage_uri=storage_uri)
+        self.key_func = key_func
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.before_request(self._check_default_limits)
+
+    def _check_default_limits(self):
+        scope = self._default_scope(request.endpoint)
+        if scope is None or request.method == "OPTIONS":
+            return None
+        return self._check(scope, self.default_limits)
+
+    def _check(self, scope: str, limits: list[tuple[int, int]]):
+        retry_after = check_limits(self.storage, scope, self.key_func(), limits)
+        if retry_after > 0:
+            resp = jsonify({"error": "rate_limited"})
+            resp.status_code = 429
+            resp.headers["Retry-After"] = retry_after_header(retry_after)
+            return resp
+        return None
+
+    def limit(self, spec: str):
+        """Декоратор: @limiter.limit("45 per minute")"""
+
+        def decorator(fn):
+            scope, limits = self._register(fn, spec)
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if request.method != "OPTIONS":
+                    rejected = self._check(scope, limits)
+                    if rejected is not None:
+                        return rejected
+                return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,743 @@
+"""
+Планировщик напоминаний и экстренных уведомлений.
+
+Цепочка для пользователя «не дома»: rem1 → rem2 → emerg. Каждый этап — threading.Timer,
+который в одной транзакции продвигает warnings_sent, пишет сообщения в outbox
+и событие в журнал status_events.
+
+Источник истины — таблица users: reconcile_pending() восстанавливает таймеры по
+left_home_time/warnings_sent. Это позволяет планировщику работать в отдельном
+процессе (worker.py), не получая событий от HTTP API напрямую.
+
+Теплый перезапуск: ожидающие этапы периодически сохраняются в снимок на диске
+(scheduler_snapshot.py). При старте этапы из снимка ставятся сразу, а сверка с users
+идет keyset-страницами по user_id — напоминания, срок которых наступает в первые
+секунды после деплоя, не ждут окончания полной сверки.
+
+Таймер — поток ОС, поэтому сверка и снимок запускают только этапы со сроком
+в пределах SCHEDULER_THREAD_HORIZON; остальные запустит одна из следующих сверок.
+Число потоков ограничено пользователями, чей этап наступает в этом окне, а не всеми
+пользователями «не дома».
+
+AsyncScheduler — тот же планировщик для ASGI-рантайма (asgi.py): этапы хранятся
+в куче и запускаются одной задачей цикла событий, без потока на каждый таймер.
+"""
+import os
+import time
+import heapq
+import bisect
+import asyncio
+import logging
+import itertools
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread, Timer
+
+from config import DB_ROLE_SCHEDULER, DEFAULT_TIMER_SECONDS, EMERGENCY_DELAY, REMINDER_2_DELAY
+from events import EVENT_EMERGENCY, EVENT_REMINDER_1, EVENT_REMINDER_2, record_event
+from groups import bump_member_groups
+from models import User, ensure_utc_aware, get_db_session
+from outbox import PRIORITY_EMERGENCY, enqueue_message, notify_outbox
+from scheduler_snapshot import (
+    SCHEDULER_SNAPSHOT_INTERVAL,
+    SnapshotEntry,
+    read_snapshot,
+    snapshot_enabled,
+    warn_if_ephemeral,
+    write_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_RECONCILE_INTERVAL = float(os.environ.get("SCHEDULER_RECONCILE_INTERVAL", "5"))
+# Пользователей «не дома» на страницу сверки (одна короткая транзакция на страницу)
+SCHEDULER_RECONCILE_BATCH = int(os.environ.get("SCHEDULER_RECONCILE_BATCH", "1000"))
+# Потоковый планировщик запускает threading.Timer только для этапов со сроком в пределах
+# стольких секунд; окно должно быть заметно больше SCHEDULER_RECONCILE_INTERVAL
+SCHEDULER_THREAD_HORIZON = float(os.environ.get("SCHEDULER_THREAD_HORIZON", "300"))
+# Одновременно выполняемых этапов в AsyncScheduler: не больше соединений пула scheduler
+SCHEDULER_ASYNC_CONCURRENCY = int(os.environ.get("SCHEDULER_ASYNC_CONCURRENCY", "4"))
+
+STAGES = ("rem1", "rem2", "emerg")
+# Этап -> (следующий этап, задержка после текущего)
+NEXT_STAGE = {"rem1": ("rem2", REMINDER_2_DELAY), "rem2": ("emerg", EMERGENCY_DELAY)}
+
+# Ключи: f"{user_id}:rem1", f"{user_id}:rem2", f"{user_id}:emerg"
+jobs = {}
+_jobs_lock = Lock()
+_jobs_version = 0  # Растет при каждом изменении jobs: снимок пишется, только если он изменился
+_running = Event()
+# Последний холодный старт планировщика в этом процессе (для /debug)
+cold_start: dict = {}
+
+
+def is_running() -> bool:
+    """Запущен ли планировщик в этом процессе"""
+    return _running.is_set()
+
+
+def outing_stamp(user) -> int:
+    """Метка текущего выхода из дома (unix-время left_home_time)"""
+    left_time = ensure_utc_aware(user.left_home_time)
+    return int(left_time.timestamp()) if left_time else 0
+
+
+def _outing_key(user) -> str:
+    """Ключ текущего выхода из дома — основа idempotency_key сообщений outbox"""
+    return f"{user.user_id}:{outing_stamp(user)}"
+
+
+def stage_due_at(user, stage: str) -> datetime | None:
+    """Момент срабатывания этапа по данным из БД"""
+    left_time = ensure_utc_aware(user.left_home_time)
+    if left_time is None:
+        return None
+    due = left_time + timedelta(seconds=user.timer_seconds or DEFAULT_TIMER_SECONDS)
+    if stage in ("rem2", "emerg"):
+        due += timedelta(seconds=REMINDER_2_DELAY)
+    if stage == "emerg":
+        due += timedelta(seconds=EMERGENCY_DELAY)
+    return due
+
+
+def _start_job(user_id: int, stage: str, delay: float, outing: int) -> None:
+    global _jobs_version
+    timer = Timer(max(0.0, delay), _run_job, args=(user_id, stage, outing))
+    timer.daemon = True
+    timer.scheduled_at = time.monotonic()
+    timer.due_at = time.time() + max(0.0, delay)
+    with _jobs_lock:
+        previous = jobs.get(f"{user_id}:{stage}")
+        jobs[f"{user_id}:{stage}"] = timer
+        _jobs_version += 1
+    if previous is not None:
+        previous.cancel()
+    timer.start()
+
+
+def _forget_job(user_id: int, stage: str) -> None:
+    global _jobs_version
+    with _jobs_lock:
+        if jobs.pop(f"{user_id}:{stage}", None) is not None:
+            _jobs_version += 1
+
+
+def _load_away_user(db, user_id: int, stage: str, stage_number: int, outing: int | None):
+    """Загружает пользователя под блокировкой строки; None, если этап уже пройден или пользователь дома"""
+    user = db.query(User).filter(User.user_id == user_id).with_for_update().first()
+    if not user or user.status != "не дома":
+        logger.info("⏭️ Пропуск %s: пользователь уже дома или не найден (user_id=%s)", stage, user_id)
+        return None
+    if outing is not None and outing_stamp(user) != outing:
+        logger.info("⏭️ Пропуск %s: таймер от предыдущего выхода (user_id=%s)", stage, user_id)
+        return None
+    if (user.warnings_sent or 0) >= stage_number:
+        logger.info("⏭️ Пропуск %s: этап уже выполнен (user_id=%s, warnings_sent=%s)", stage, user_id, user.warnings_sent)
+        return None
+    return user
+
+
+def _reminder1(db, user) -> None:
+    """Первое напоминание пользователю"""
+    # Сообщение и warnings_sent фиксируются одной транзакцией
+    enqueue_message(
+        db,
+        user.user_id,
+        "🤗 Ты в порядке? Отметься, что ты дома. Сдвинь слайдер в положение \"ДОМА\".",
+        f"{_outing_key(user)}:rem1",
+    )
+    user.warnings_sent = 1
+    record_event(db, user.user_id, EVENT_REMINDER_1, outing_started_at=user.left_home_time, warnings_sent=1)
+    bump_member_groups(db, user.user_id)
+
+
+def _reminder2(db, user) -> None:
+    """Второе напоминание пользователю"""
+    enqueue_message(
+        db,
+        user.user_id,
+        "🤗 Напоминание! Если ты уже дома — отметься. Сдвинь слайдер в положение \"ДОМА\".",
+        f"{_outing_key(user)}:rem2",
+    )
+    user.warnings_sent = 2
+    record_event(db, user.user_id, EVENT_REMINDER_2, outing_started_at=user.left_home_time, warnings_sent=2)
+    bump_member_groups(db, user.user_id)
+
+
+def _emergency(db, user) -> None:
+    """Экстренное уведомление контакту"""
+    user_id = user.user_id
+    key = _outing_key(user)
+
+    emergency_contact_user_id = user.emergency_contact_user_id
+    emergency_contact_username = user.emergency_contact_username
+
+    if not emergency_contact_user_id and emergency_contact_username:
+        logger.info("🔍 Поиск экстренного контакта по username: %s", emergency_contact_username)
+        contact_user = db.query(User).filter(
+            User.username == emergency_contact_username,
+            User.chat_id.isnot(None)
+        ).first()
+        if contact_user:
+            emergency_contact_user_id = contact_user.chat_id
+            user.emergency_contact_user_id = emergency_contact_user_id
+            logger.info("✅ Найден экстренный контакт: emergency_contact_username=%s, contact_user.user_id=%s, contact_user.chat_id=%s",
+                      emergency_contact_username, contact_user.user_id, emergency_contact_user_id)
+        else:
+            logger.warning("⚠️ Экстренный контакт не найден в БД: emergency_contact_username=%s", emergency_contact_username)
+
+    user.warnings_sent = 3
+    record_event(db, user_id, EVENT_EMERGENCY, outing_started_at=user.left_home_time, warnings_sent=3)
+    bump_member_groups(db, user_id)
+
+    if not emergency_contact_user_id:
+        logger.error("❌ Не удалось найти экстренный контакт для user_id=%s, emergency_contact_username=%s",
+                    user_id, emergency_contact_username)
+        enqueue_message(
+            db,
+            user_id,
+            "⚠️ Экстренный контакт ещё не активировал бота или не указан.",
+            f"{key}:emerg:no_contact",
+            priority=PRIORITY_EMERGENCY,
+        )
+    else:
+        # Имя для отображения: предпочитаем username, иначе id
+        display_name = user.username or f"id {user_id}"
+        logger.info("📤 Постановка экстренного уведомления в outbox: emergency_contact_username=%s, emergency_contact_user_id=%s, пользователь=%s",
+                   emergency_contact_username, emergency_contact_user_id, display_name)
+        enqueue_message(
+            db,
+            emergency_contact_user_id,
+            f"🚨 Твой друг {display_name} не выходит на связь. Проверь, всё ли с ним в порядке. Его питомец дома совсем один!",
+            f"{key}:emerg:contact",
+            priority=PRIORITY_EMERGENCY,
+        )
+        enqueue_message(
+            db,
+            user_id,
+            f"🚨 Экстренный контакт {emergency_contact_username} уведомлён! Если ты в порядке — отметься. Сдвинь слайдер в положение \"ДОМА\".",
+            f"{key}:emerg:confirm",
+            priority=PRIORITY_EMERGENCY,
+        )
+
+
+_STAGE_ACTIONS = {
+    "rem1": _reminder1,
+    "rem2": _reminder2,
+    "emerg": _emergency,
+}
+
+
+def execute_stage(db, user_id: int, stage: str, outing: int | None = None) -> int | None:
+    """Выполняет этап в транзакции db (вызывающий коммитит и будит outbox).
+
+    Возвращает метку выхода для планирования следующего этапа или None, если этап пропущен.
+    """
+    user = _load_away_user(db, user_id, stage, STAGES.index(stage) + 1, outing)
+    if not user:
+        return None
+    outing = outing_stamp(user)
+    _STAGE_ACTIONS[stage](db, user)
+    return outing
+
+
+def _run_job(user_id: int, stage: str, outing: int | None = None) -> None:
+    """Срабатывание threading.Timer: этап в своей транзакции и таймер следующего этапа"""
+    logger.info("🔔 Этап %s сработал для user_id=%s", stage, user_id)
+    _forget_job(user_id, stage)
+    with get_db_session(DB_ROLE_SCHEDULER) as db:
+        outing = execute_stage(db, user_id, stage, outing)
+    if outing is None:
+        return
+    notify_outbox()
+    if stage in NEXT_STAGE:
+        next_stage, delay = NEXT_STAGE[stage]
+        _start_job(user_id, next_stage, delay, outing)
+        logger.info("⏰ Запущен таймер этапа %s (user_id=%s, delay=%s сек)", next_stage, user_id, delay)
+
+
+def cancel_all_jobs_for_user(user_id: int) -> None:
+    """Отменяет все активные таймеры для пользователя"""
+    global _jobs_version
+    cancelled = 0
+    for stage in STAGES:
+        k = f"{user_id}:{stage}"
+        with _jobs_lock:
+            job = jobs.pop(k, None)
+            if job is not None:
+                _jobs_version += 1
+        if job:
+            try:
+                job.cancel()
+                cancelled += 1
+            except Exception as e:
+                logger.warning("⚠️ Ошибка при отмене таймера %s: %s", k, e)
+    if cancelled > 0:
+        logger.info("⏹️ Отменено таймеров для user_id=%s: %s", user_id, cancelled)
+
+
+def schedule_sequence_for_user(user_id: int, timer_seconds: int, outing: int | None = None) -> None:
+    """Планирует цепочку таймеров для пользователя"""
+    logger.info("⏰ Планирование таймеров для user_id=%s: timer_seconds=%s", user_id, timer_seconds)
+    # Первый таймер на указанное время
+    _start_job(user_id, "rem1", timer_seconds, outing)
+    logger.info("✅ Запущен первый таймер для user_id=%s (через %s сек)", user_id, timer_seconds)
+
+
+def load_pending_batch(db, after_user_id: int | None, limit: int):
+    """Keyset-страница пользователей «не дома» по возрастанию user_id (индекс ix_users_away_user_id).
+
+    Возвращает (user_id -> (следующий этап, момент срабатывания, метка выхода),
+    последний user_id страницы, True — страница последняя).
+    """
+    # Только нужные колонки: без сборки ORM-объектов страница обрабатывается в разы быстрее
+    query = db.query(User.user_id, User.left_home_time, User.timer_seconds, User.warnings_sent).filter(
+        User.status == "не дома", User.left_home_time.isnot(None)
+    )
+    if after_user_id is not None:
+        query = query.filter(User.user_id > after_user_id)
+    users = query.order_by(User.user_id).limit(limit).all()
+    pending = {}
+    for user in users:
+        stage_number = user.warnings_sent or 0
+        if stage_number >= len(STAGES):
+            continue
+        stage = STAGES[stage_number]
+        pending[user.user_id] = (stage, stage_due_at(user, stage), outing_stamp(user))
+    last_user_id = users[-1].user_id if users else after_user_id
+    return pending, last_user_id, len(users) < limit
+
+
+def _users_in_range(sorted_user_ids: list[int], after: int | None, upper: int | None) -> list[int]:
+    """user_id из отсортированного списка в полуинтервале (after, upper]; None — без границы"""
+    lo = 0 if after is None else bisect.bisect_right(sorted_user_ids, after)
+    hi = len(sorted_user_ids) if upper is None else bisect.bisect_right(sorted_user_ids, upper)
+    return sorted_user_ids[lo:hi]
+
+
+def reconcile_pending(batch_size: int = SCHEDULER_RECONCILE_BATCH) -> int:
+    """Сверяет таймеры процесса с таблицей users.
+
+    Для каждого пользователя «не дома» запускает таймер следующего этапа, если его нет
+    (только со сроком в пределах SCHEDULER_THREAD_HORIZON) или он относится
+    к предыдущему выходу; таймеры пользователей, вернувшихся домой,
+    отменяются. users читается страницами по batch_size, каждая страница применяется
+    сразу. Возвращает количество запущенных таймеров.
+    """
+    started, away = _reconcile(batch_size)
+    if started:
+        logger.info("🔄 Сверка планировщика: запущено таймеров=%s, пользователей не дома=%s", started, away)
+    return started
+
+
+def _reconcile(batch_size: int) -> tuple[int, int]:
+    """(запущено таймеров, пользователей «не дома»)"""
+    with _jobs_lock:
+        scheduled = sorted({int(k.split(":", 1)[0]) for k in jobs})
+    started = away = 0
+    after = None
+    while True:
+        now = datetime.now(timezone.utc)
+        batch_started = time.monotonic()
+        with get_db_session(DB_ROLE_SCHEDULER) as db:
+            pending, last_user_id, exhausted = load_pending_batch(db, after, batch_size)
+        away += len(pending)
+
+        for user_id, (stage, due_at, outing) in pending.items():
+            with _jobs_lock:
+                job = jobs.get(f"{user_id}:{stage}")
+            if job is not None and job.args[2] == outing:
+                continue
+            delay = (due_at - now).total_seconds()
+            if job is None and delay > SCHEDULER_THREAD_HORIZON:
+                continue
+            _start_job(user_id, stage, delay, outing)
+            started += 1
+
+        # Пользователи диапазона страницы, которых нет среди «не дома»; таймеры,
+        # запущенные после чтения страницы, сверим на следующем проходе
+        for user_id in _users_in_range(scheduled, after, None if exhausted else last_user_id):
+            if user_id in pending:
+                continue
+            with _jobs_lock:
+                stale = any(
+                    job.scheduled_at < batch_started
+                    for job in (jobs.get(f"{user_id}:{stage}") for stage in STAGES)
+                    if job is not None
+                )
+            if stale:
+                cancel_all_jobs_for_user(user_id)
+
+        if exhausted:
+            break
+        after = last_user_id
+    return started, away
+
+
+def snapshot_entries() -> list[SnapshotEntry]:
+    """Ожидающие таймеры процесса в формате снимка"""
+    with _jobs_lock:
+        return [
+            (job.args[0], STAGES.index(job.args[1]), job.due_at, job.args[2])
+            for job in jobs.values()
+        ]
+
+
+def restore_snapshot() -> int:
+    """Запускает таймеры из снимка, которых еще нет в процессе. Возвращает их количество.
+
+    Только этапы со сроком в пределах SCHEDULER_THREAD_HORIZON: каждый таймер — поток,
+    а более поздние этапы запустит сверка с users.
+    """
+    restored = 0
+    now = time.time()
+    for user_id, stage_index, due, outing in sorted(read_snapshot(), key=lambda entry: entry[2]):
+        if due - now > SCHEDULER_THREAD_HORIZON:
+            break
+        stage = STAGES[stage_index]
+        with _jobs_lock:
+            if f"{user_id}:{stage}" in jobs:
+                continue
+        _start_job(user_id, stage, due - now, outing)
+        restored += 1
+    return restored
+
+
+_snapshot_writer: Thread | None = None
+
+
+def run_snapshot_writer(stop_event: Event) -> None:
+    """Пишет снимок раз в SCHEDULER_SNAPSHOT_INTERVAL, если таймеры изменились, и при остановке"""
+    written_version = None
+    while True:
+        stopping = stop_event.wait(SCHEDULER_SNAPSHOT_INTERVAL)
+        with _jobs_lock:
+            version = _jobs_version
+        if version != written_version:
+            try:
+                write_snapshot(snapshot_entries())
+                written_version = version
+            except OSError as e:
+                logger.warning("⚠️ Не удалось записать снимок планировщика: %s", e)
+        if stopping:
+            return
+
+
+def _record_cold_start(restored: int, pending_users: int, restore_seconds: float, reconcile_seconds: float) -> None:
+    cold_start.clear()
+    cold_start.update(
+        pending_users=pending_users,
+        restored_from_snapshot=restored,
+        snapshot_restore_seconds=round(restore_seconds, 4),
+        full_reconcile_seconds=round(reconcile_seconds, 4),
+    )
+    logger.info("🚀 Холодный старт планировщика: пользователей не дома=%s, этапов из снимка=%s за %.3f сек, "
+                "сверка с БД за %.3f сек", pending_users, restored, restore_seconds, reconcile_seconds)
+
+
+def warm_start() -> None:
+    """Старт планировщика: этапы из снимка, затем постраничная сверка с users"""
+    if snapshot_enabled():
+        warn_if_ephemeral()
+    started = time.monotonic()
+    restored = restore_snapshot() if snapshot_enabled() else 0
+    restored_at = time.monotonic()
+    _, away = _reconcile(SCHEDULER_RECONCILE_BATCH)
+    _record_cold_start(restored, away, restored_at - started, time.monotonic() - started)
+
+
+def run_scheduler(stop_event: Event | None = None) -> None:
+    """Периодическая сверка таймеров с БД"""
+    global _snapshot_writer
+    stop_event = stop_event or Event()
+    logger.info("🗓️ Планировщик запущен (сверка каждые %s сек)", SCHEDULER_RECONCILE_INTERVAL)
+    try:
+        warm_start()
+    except Exception as e:
+        # Этапы из снимка уже запущены; сверку повторит следующий проход
+        logger.exception("❌ Ошибка сверки планировщика при старте: %s", e)
+    if snapshot_enabled():
+        # Только после загрузки: иначе пустой процесс перезапишет снимок предыдущего
+        _snapshot_writer = Thread(target=run_snapshot_writer, args=(stop_event,), daemon=True,
+                                  name="SchedulerSnapshotThread")
+        _snapshot_writer.start()
+    while not stop_event.wait(SCHEDULER_RECONCILE_INTERVAL):
+        try:
+            reconcile_pending()
+        except Exception as e:
+            logger.exception("❌ Ошибка сверки планировщика: %s", e)
+
+
+def start_scheduler(stop_event: Event | None = None) -> Thread:
+    """Запускает сверку планировщика в фоновом потоке"""
+    _running.set()
+    thread = Thread(target=run_scheduler, args=(stop_event,), daemon=True, name="SchedulerThread")
+    thread.start()
+    return thread
+
+
+def stop_scheduler(stop_event: Event, timeout: float = 10) -> None:
+    """Останавливает сверку и дожидается финального снимка.
+
+    Потоки планировщика — daemon: без ожидания процесс завершится раньше,
+    чем run_snapshot_writer запишет последнее состояние таймеров.
+    """
+    stop_event.set()
+    writer = _snapshot_writer
+    if writer is None:
+        return
+    writer.join(timeout)
+    if writer.is_alive():
+        logger.warning("⚠️ Финальный снимок планировщика не записан за %s сек", timeout)
+    else:
+        logger.info("💾 Снимок планировщика записан при остановке")
+
+
+class AsyncScheduler:
+    """Планировщик ASGI-рантайма (asgi.py): все этапы — записи одной кучи в цикле событий.
+
+    Вместо потока threading.Timer на каждый ожидающий этап — куча (срок, seq, user_id, stage)
+    и одна задача, которая спит до ближайшего срока. Отмененные и перепланированные записи
+    остаются в куче и пропускаются при извлечении. Этапы выполняются тем же execute_stage
+    в отдельных задачах, не больше concurrency одновременно (по числу соединений пула
+    scheduler); сверка с БД — как у reconcile_pending, раз в SCHEDULER_RECONCILE_INTERVAL.
+    Снимок пишется так же, как у потокового планировщика; в него попадают и выполняемые
+    этапы — прерванный остановкой этап следующий процесс запустит сразу.
+    """
+
+    def __init__(self, concurrency: int = SCHEDULER_ASYNC_CONCURRENCY):
+        self._heap: list[tuple[float, int, int, str]] = []
+        # (user_id, stage) -> (срок, seq, метка выхода, time.monotonic() планирования)
+        self._entries: dict[tuple[int, str], tuple[float, int, int | None, float]] = {}
+        # Выполняемые этапы: (user_id, stage) -> (срок, метка выхода)
+        self._firing: dict[tuple[int, str], tuple[float, int | None]] = {}
+        self._version = 0  # Растет при каждом изменении этапов, см. _snapshot_loop
+        self._written_version: int | None = None
+        self._snapshot_active = False
+        self._seq = itertools.count()
+        self._concurrency = concurrency
+        self._slots: asyncio.Semaphore | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._loops: list[asyncio.Task] = []
+        self._stage_tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def jobs_keys(self) -> list[str]:
+        """Ключи в формате scheduler.jobs (для /debug)"""
+        return [f"{user_id}:{stage}" for user_id, stage in self._entries]
+
+    def schedule(self, user_id: int, stage: str, delay: float, outing: int | None) -> None:
+        """Ставит этап через delay секунд, заменяя ранее запланированный тот же этап"""
+        due = time.time() + max(0.0, delay)
+        seq = next(self._seq)
+        self._entries[(user_id, stage)] = (due, seq, outing, time.monotonic())
+        self._version += 1
+        heapq.heappush(self._heap, (due, seq, user_id, stage))
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            # Много отмененных записей — пересобираем кучу из актуальных
+            self._heap = [(due, seq, user_id, stage) for (user_id, stage), (due, seq, _, _) in self._entries.items()]
+            heapq.heapify(self._heap)
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def schedule_sequence_for_user(self, user_id: int, timer_seconds: int, outing: int | None = None) -> None:
+        """Аналог schedule_sequence_for_user: цепочка начинается с rem1"""
+        self.cancel_all_jobs_for_user(user_id)
+        self.schedule(user_id, "rem1", timer_seconds, outing)
+        logger.info("✅ Запланирован первый этап для user_id=%s (через %s сек)", user_id, timer_seconds)
+
+    def cancel_all_jobs_for_user(self, user_id: int) -> None:
+        cancelled = sum(1 for stage in STAGES if self._entries.pop((user_id, stage), None) is not None)
+        if cancelled:
+            self._version += 1
+            logger.info("⏹️ Отменено этапов для user_id=%s: %s", user_id, cancelled)
+
+    async def reconcile(self, batch_size: int = SCHEDULER_RECONCILE_BATCH) -> int:
+        """Сверка с таблицей users, как reconcile_pending. Возвращает количество запланированных этапов"""
+        started, away = await self._reconcile(batch_size)
+        if started:
+            logger.info("🔄 Сверка планировщика: запланировано этапов=%s, пользователей не дома=%s", started, away)
+        return started
+
+    async def _reconcile(self, batch_size: int) -> tuple[int, int]:
+        import async_db  # Лениво: потоковому рантайму асинхронные драйверы не нужны
+
+        scheduled = sorted({user_id for user_id, _ in self._entries})
+        started = away = 0
+        after = None
+        while True:
+            # Между страницами цикл событий свободен: этапы из снимка срабатывают во время сверки
+            batch_started = time.monotonic()
+            pending, last_user_id, exhausted = await async_db.run_sync(
+                load_pending_batch, after, batch_size, role=DB_ROLE_SCHEDULER
+            )
+            now = time.time()
+            away += len(pending)
+            for user_id, (stage, due_at, outing) in pending.items():
+                entry = self._entries.get((user_id, stage))
+                if (entry is not None and entry[2] == outing) or (user_id, stage) in self._firing:
+                    continue
+                self.schedule(user_id, stage, due_at.timestamp() - now, outing)
+                started += 1
+            # Этапы, запланированные после чтения страницы, сверим на следующем проходе
+            for user_id in _users_in_range(scheduled, after, None if exhausted else last_user_id):
+                if user_id in pending:
+                    continue
+                if any(
+                    entry[3] < batch_started
+                    for entry in (self._entries.get((user_id, stage)) for stage in STAGES)
+                    if entry is not None
+                ):
+                    self.cancel_all_jobs_for_user(user_id)
+            if exhausted:
+                return started, away
+            after = last_user_id
+
+    def snapshot_entries(self) -> list[SnapshotEntry]:
+        entries = [
+            (user_id, STAGES.index(stage), due, outing)
+            for (user_id, stage), (due, _, outing, _) in self._entries.items()
+        ]
+        entries += [
+            (user_id, STAGES.index(stage), due, outing)
+            for (user_id, stage), (due, outing) in self._firing.items()
+        ]
+        return entries
+
+    def restore_snapshot(self) -> int:
+        """Ставит этапы из снимка, которых еще нет. Возвращает их количество
+
+        Записи добавляются в кучу пачкой и упорядочиваются одним heapify — быстрее,
+        чем schedule() на каждую: этапы со сроком в первые секунды не ждут загрузки.
+        """
+        restored = 0
+        scheduled_at = time.monotonic()
+        for user_id, stage_index, due, outing in read_snapshot():
+            key = (user_id, STAGES[stage_index])
+            if key in self._entries:
+                continue
+            seq = next(self._seq)
+            self._entries[key] = (due, seq, outing, scheduled_at)
+            self._heap.append((due, seq, user_id, key[1]))
+            restored += 1
+        if restored:
+            heapq.heapify(self._heap)
+            self._version += 1
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return restored
+
+    async def _write_snapshot(self) -> None:
+        version = self._version
+        try:
+            # fsync блокирует — в потоке, чтобы не останавливать цикл событий
+            await asyncio.to_thread(write_snapshot, self.snapshot_entries())
+            self._written_version = version
+        except OSError as e:
+            logger.warning("⚠️ Не удалось записать снимок планировщика: %s", e)
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SCHEDULER_SNAPSHOT_INTERVAL)
+            if self._version != self._written_version:
+                await self._write_snapshot()
+
+    async def _fire(self, user_id: int, stage: str, outing: int | None) -> None:
+        import async_db
+
+        try:
+            async with self._slots:
+                logger.info("🔔 Этап %s сработал для user_id=%s", stage, user_id)
+                outing = await async_db.run_sync(execute_stage, user_id, stage, outing, role=DB_ROLE_SCHEDULER)
+        except asyncio.CancelledError:
+            # Остановка процесса: этап остается в _firing и попадает в последний снимок
+            raise
+        except Exception as e:
+            # Этап не выполнен — его перезапустит ближайшая сверка с БД
+            logger.exception("❌ Ошибка этапа %s для user_id=%s: %s", stage, user_id, e)
+            outing = None
+        self._firing.pop((user_id, stage), None)
+        self._version += 1
+        if outing is None:
+            return
+        notify_outbox()
+        if stage in NEXT_STAGE:
+            next_stage, delay = NEXT_STAGE[stage]
+            self.schedule(user_id, next_stage, delay, outing)
+
+    async def _timer_loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, user_id, stage = heapq.heappop(self._heap)
+                entry = self._entries.get((user_id, stage))
+                if entry is None or entry[1] != seq:
+                    continue  # Отменен или перепланирован
+                del self._entries[(user_id, stage)]
+                self._firing[(user_id, stage)] = (entry[0], entry[2])
+                task = asyncio.create_task(self._fire(user_id, stage, entry[2]), name=f"stage:{user_id}:{stage}")
+                self._stage_tasks.add(task)
+                task.add_done_callback(self._stage_tasks.discard)
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _warm_start(self) -> None:
+        if snapshot_enabled():
+            warn_if_ephemeral()
+        started = time.monotonic()
+        restored = self.restore_snapshot() if snapshot_enabled() else 0
+        restored_at = time.monotonic()
+        try:
+            _, away = await self._reconcile(SCHEDULER_RECONCILE_BATCH)
+            _record_cold_start(restored, away, restored_at - started, time.monotonic() - started)
+        except Exception as e:
+            # Этапы из снимка уже в куче; сверку повторит следующий проход
+            logger.exception("❌ Ошибка сверки планировщика при старте: %s", e)
+        if snapshot_enabled():
+            # Только после загрузки: иначе пустой процесс перезапишет снимок предыдущего
+            self._snapshot_active = True
+            self._loops.append(asyncio.create_task(self._snapshot_loop(), name="scheduler-snapshot"))
+
+    async def _reconcile_loop(self) -> None:
+        logger.info("🗓️ Асинхронный планировщик запущен (сверка каждые %s сек)", SCHEDULER_RECONCILE_INTERVAL)
+        await self._warm_start()
+        while True:
+            await asyncio.sleep(SCHEDULER_RECONCILE_INTERVAL)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.exception("❌ Ошибка сверки планировщика: %s", e)
+
+    def start(self) -> None:
+        """Запускает задачи планировщика в текущем цикле событий"""
+        self._slots = asyncio.Semaphore(self._concurrency)
+        self._wakeup = asyncio.Event()
+        self._loops = [
+            asyncio.create_task(self._timer_loop(), name="scheduler-timers"),
+            asyncio.create_task(self._reconcile_loop(), name="scheduler-reconcile"),
+        ]
+
+    async def stop(self, timeout: float) -> None:
+        """Перестает запускать этапы и ждет уже начатые не дольше timeout секунд.
+
+        Незавершенные этапы отменяются (транзакция откатывается), остаются в последнем
+        снимке и будут выполнены следующим процессом сразу после старта.
+        """
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        if self._stage_tasks:
+            _, not_done = await asyncio.wait(set(self._stage_tasks), timeout=timeout)
+            for task in not_done:
+                task.cancel()
+            if not_done:
+                logger.warning("⏱️ Не дождались этапов при остановке: %s", len(not_done))
+                await asyncio.gather(*not_done, return_exceptions=True)
+        if self._snapshot_active:
+            await self._write_snapshot()
+        logger.info("⏹️ Асинхронный планировщик остановлен")
@@ -0,0 +1,134 @@
+"""
+Снимок ожидающих этапов планировщика на локальном диске.
+
+После перезапуска процесса таймеры в памяти пропадают, а полная сверка с users
+для большого числа пользователей «не дома» занимает секунды. Снимок позволяет
+сразу после старта поставить этапы, которые вот-вот сработают, а сверка с БД
+идет следом постранично (scheduler.reconcile_pending).
+
+Формат — заголовок и записи фиксированного размера (little-endian):
+    заголовок: magic 8s, версия u32, число записей u32, время записи f64, crc32 записей u32
+    запись:    user_id i64, срок (unix-время) f64, метка выхода i64 (-1 — без метки), этап u8
+Файл пишется через mmap в уникальный временный файл рядом, затем fsync и os.replace —
+после сбоя на диске остается либо прежний снимок, либо новый целиком.
+Поврежденный или устаревший снимок игнорируется: источник истины — таблица users,
+а этап, поставленный по снимку, перед выполнением перепроверяется под блокировкой строки.
+
+По умолчанию снимок лежит во временном каталоге: этого хватает для перезапуска процесса,
+но не контейнера. В контейнере SCHEDULER_SNAPSHOT_PATH должен указывать на постоянный
+том (например, /data/scheduler.snap), иначе после деплоя снимка нет и этапы ждут сверки.
+Последний снимок пишется при остановке (SIGTERM): scheduler.stop_scheduler в потоковом
+рантайме, AsyncScheduler.stop в ASGI.
+"""
+import os
+import mmap
+import time
+import zlib
+import struct
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Пустое значение отключает снимок
+SCHEDULER_SNAPSHOT_PATH = os.environ.get(
+    "SCHEDULER_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "homealone-scheduler.snap")
+).strip()
+SCHEDULER_SNAPSHOT_INTERVAL = float(os.environ.get("SCHEDULER_SNAPSHOT_INTERVAL", "2"))
+# Снимок старше этого (сек) при старте не загружается
+SCHEDULER_SNAPSHOT_MAX_AGE = float(os.environ.get("SCHEDULER_SNAPSHOT_MAX_AGE", "86400"))
+
+MAGIC = b"HASCHED\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sIIdI")
+ENTRY = struct.Struct("<qdqB")
+NO_OUTING = -1
+
+# (user_id, индекс этапа в scheduler.STAGES, срок unix-время, метка выхода или None)
+SnapshotEntry = tuple[int, int, float, int | None]
+
+
+def snapshot_enabled() -> bool:
+    return bool(SCHEDULER_SNAPSHOT_PATH)
+
+
+def warn_if_ephemeral(path: str = SCHEDULER_SNAPSHOT_PATH) -> None:
+    """Предупреждает, если снимок во временном каталоге и не переживет перезапуск контейнера"""
+    tmp_dir = os.path.realpath(tempfile.gettempdir())
+    if os.path.realpath(path).startswith(tmp_dir + os.sep):
+        logger.warning("⚠️ Снимок планировщика во временном каталоге (%s): он не переживет перезапуск "
+                       "контейнера — задайте SCHEDULER_SNAPSHOT_PATH на постоянном томе", path)
+
+
+def _fsync_dir(path: str) -> None:
+    # Без fsync каталога os.replace может не пережить сбой питания
+    fd = os.open(path or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_snapshot(entries: list[SnapshotEntry], path: str = SCHEDULER_SNAPSHOT_PATH) -> int:
+    """Атомарно записывает снимок. Возвращает размер файла в байтах"""
+    size = HEADER.size + ENTRY.size * len(entries)
+    directory, name = os.path.split(path)
+    # Уникальное имя: процессы с общим путем (воркеры uvicorn, app.py и worker.py) не должны
+    # переименовать на место снимка недописанный временный файл друг друга
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory or ".")
+    try:
+        try:
+            os.ftruncate(fd, size)
+            with mmap.mmap(fd, size) as buf:
+                offset = HEADER.size
+                for user_id, stage_index, due, outing in entries:
+                    ENTRY.pack_into(buf, offset, user_id, due, NO_OUTING if outing is None else outing, stage_index)
+                    offset += ENTRY.size
+                crc = zlib.crc32(buf[HEADER.size:])
+                HEADER.pack_into(buf, 0, MAGIC, VERSION, len(entries), time.time(), crc)
+                buf.flush()
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(os.path.dirname(path))
+    return size
+
+
+def read_snapshot(path: str = SCHEDULER_SNAPSHOT_PATH,
+                  max_age: float = SCHEDULER_SNAPSHOT_MAX_AGE) -> list[SnapshotEntry]:
+    """Записи снимка; пустой список, если снимка нет, он поврежден или устарел"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return []
+    try:
+        size = os.fstat(fd).st_size
+        if size < HEADER.size:
+            logger.warning("⚠️ Снимок планировщика %s поврежден: %s байт", path, size)
+            return []
+        with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as buf:
+            magic, version, count, written_at, crc = HEADER.unpack_from(buf, 0)
+            if magic != MAGIC or version != VERSION or size != HEADER.size + ENTRY.size * count:
+                logger.warning("⚠️ Снимок планировщика %s в неизвестном формате — пропускаем", path)
+                return []
+            body = buf[HEADER.size:]
+    finally:
+        os.close(fd)
+    if zlib.crc32(body) != crc:
+        logger.warning("⚠️ Снимок планировщика %s поврежден (crc32) — пропускаем", path)
+        return []
+    age = time.time() - written_at
+    if age > max_age:
+        logger.info("ℹ️ Снимок планировщика устарел (%.0f сек) — пропускаем", age)
+        return []
+    return [
+        (user_id, stage_index, due, None if outing == NO_OUTING else outing)
+        for user_id, due, outing, stage_index in ENTRY.iter_unpack(body)
+    ]
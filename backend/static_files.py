@@ -0,0 +1,204 @@
+"""
+Раздача собранного мини‑аппа (каталог STATIC_DIST_DIR, готовит build_static.py).
+
+- Файлы с хешем содержимого в имени (static/js/main.1a2b3c4d.js, шрифты *.woff2/*.woff)
+  кешируются навсегда: Cache-Control: public, max-age=31536000, immutable.
+  index.html и прочие файлы без хеша — no-cache с ETag (ответ 304 при повторном открытии).
+- Заранее сжатые варианты .br/.gz выбираются по Accept-Encoding, сжатия на лету нет.
+- Файл отдается через send_file: под gunicorn это wsgi.file_wrapper с sendfile(2)
+  без копирования в пространство пользователя; STATIC_X_SENDFILE=1 передает отдачу
+  фронтовому серверу заголовком X-Sendfile.
+
+Индекс файлов строится один раз при регистрации (без stat на каждый запрос);
+после пересборки раздачи процесс нужно перезапустить.
+"""
+import os
+import re
+import hashlib
+import logging
+import mimetypes
+from dataclasses import dataclass, field
+
+from flask import abort, request, send_file
+
+from config import env_flag
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIST_DIR = os.environ.get(
+    "STATIC_DIST_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static_dist")
+)
+# Должен совпадать с PUBLIC_URL сборки фронтенда; корень "/" занят health-check
+MINIAPP_URL_PREFIX = "/" + (os.environ.get("MINIAPP_URL_PREFIX", "").strip().strip("/") or "app")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Хеш содержимого в имени: main.1a2b3c4d.js, main.1a2b3c4d.chunk.css, SFProText-Medium.0f1e2d3c.woff2
+_HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.")
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# Элемент If-None-Match: "*" или entity-tag, возможно слабый (W/"...")
+_ENTITY_TAG_RE = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+@dataclass(frozen=True)
+class StaticAsset:
+    path: str
+    mimetype: str
+    etag: str
+    immutable: bool
+    variants: dict = field(default_factory=dict)  # Content-Encoding -> путь к сжатому файлу
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def build_index(root: str) -> dict[str, StaticAsset]:
+    """Относительный путь (через /) -> StaticAsset"""
+    index = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith((".br", ".gz")):
+                continue
+            path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(path, root).replace(os.sep, "/")
+            variants = {
+                encoding: path + suffix
+                for encoding, suffix in _ENCODINGS
+                if os.path.isfile(path + suffix)
+            }
+            index[relative] = StaticAsset(
+                path=path,
+                mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+                etag=_file_digest(path),
+                immutable=bool(_HASHED_NAME_RE.search(filename)),
+                variants=variants,
+            )
+    return index
+
+
+def _accepted_encodings(header: str) -> dict[str, float]:
+    """Кодировки из Accept-Encoding с весом q > 0.
+
+    "*" задает вес всех кодировок, не названных явно; явный q=0 (в том числе
+    через "*;q=0") запрещает кодировку. Элемент с некорректным q пропускается.
+    """
+    weights = {}
+    for part in header.split(","):
+        token, *params = (item.strip() for item in part.split(";"))
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = -1.0
+        if 0 <= q <= 1:
+            weights[token.lower()] = q
+    wildcard = weights.pop("*", 0.0)
+    return {
+        encoding: weights.get(encoding, wildcard)
+        for encoding, _ in _ENCODINGS
+        if weights.get(encoding, wildcard) > 0
+    }
+
+
+def select_variant(asset: StaticAsset, accept_encoding: str) -> tuple[str, str | None]:
+    """(путь к файлу, Content-Encoding) по заголовку Accept-Encoding.
+
+    Из доступных вариантов берется кодировка с наибольшим q, при равенстве — br раньше gzip.
+    """
+    accepted = _accepted_encodings(accept_encoding) if asset.variants else {}
+    candidates = [encoding for encoding, _ in _ENCODINGS if encoding in accepted and encoding in asset.variants]
+    if candidates:
+        encoding = max(candidates, key=lambda candidate: accepted[candidate])
+        return asset.variants[encoding], encoding
+    return asset.path, None
+
+
+def asset_etag(asset: StaticAsset, encoding: str | None) -> str:
+    return f"{asset.etag}-{encoding}" if encoding else asset.etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Совпадает ли ETag ответа с заголовком If-None-Match.
+
+    Список тегов через запятую сравнивается целиком по каждому тегу, слабым сравнением
+    (W/"x" и "x" равны, RFC 9110, 13.1.2); "*" совпадает с любым ETag.
+    """
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag == "*" or tag.removeprefix("W/") == opaque
+        for tag in _ENTITY_TAG_RE.findall(if_none_match or "")
+    )
+
+
+def asset_headers(asset: StaticAsset, encoding: str | None) -> dict:
+    """Content-Encoding, Vary и Cache-Control ответа"""
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if asset.variants:
+        headers["Vary"] = "Accept-Encoding"
+    return headers
+
+
+def resolve_asset(index: dict[str, StaticAsset], filename: str) -> StaticAsset | None:
+    """Файл раздачи по пути; пути без расширения — маршруты SPA, для них index.html"""
+    asset = index.get(filename)
+    if asset is None and "." not in filename.rsplit("/", 1)[-1]:
+        asset = index["index.html"]
+    return asset
+
+
+def load_miniapp_index() -> dict[str, StaticAsset] | None:
+    """Индекс STATIC_DIST_DIR или None, если раздача не собрана"""
+    if not os.path.isfile(os.path.join(STATIC_DIST_DIR, "index.html")):
+        logger.info("ℹ️ Сборка мини‑аппа не найдена (%s) — раздача статики отключена", STATIC_DIST_DIR)
+        return None
+    return build_index(STATIC_DIST_DIR)
+
+
+def _serve(asset: StaticAsset):
+    path, encoding = select_variant(asset, request.headers.get("Accept-Encoding", ""))
+    response = send_file(
+        path,
+        mimetype=asset.mimetype,
+        etag=asset_etag(asset, encoding),
+        conditional=True,
+        max_age=None,
+    )
+    # send_file подставляет имя файла на диске (например, main.js.br) — для inline-ресурса оно не нужно
+    response.headers.pop("Content-Disposition", None)
+    response.headers.update(asset_headers(asset, encoding))
+    return response
+
+
+def register_miniapp(app, limiter=None) -> bool:
+    """Регистрирует маршруты MINIAPP_URL_PREFIX/…, если раздача собрана"""
+    index = load_miniapp_index()
+    if index is None:
+        return False
+    app.config["USE_X_SENDFILE"] = env_flag("STATIC_X_SENDFILE")
+
+    def miniapp_static(filename: str = "index.html"):
+        asset = resolve_asset(index, filename)
+        if asset is None:
+            abort(404)
+        return _serve(asset)
+
+    if limiter is not None:
+        # Статика не расходует лимит API: при первом открытии это несколько запросов подряд
+        miniapp_static = limiter.exempt(miniapp_static)
+    app.add_url_rule(f"{MINIAPP_URL_PREFIX}/", "miniapp_static", miniapp_static)
+    app.add_url_rule(f"{MINIAPP_URL_PREFIX}/<path:filename>", "miniapp_static", miniapp_static)
+    logger.info("📦 Мини‑апп раздается из %s по %s/ (%s файлов)", STATIC_DIST_DIR, MINIAPP_URL_PREFIX, len(index))
+    return True
@@ -0,0 +1,405 @@
+"""
+Клиент Telegram Bot API для исходящих сообщений.
+
+- Общий httpx.Client с keep-alive вместо нового соединения на каждый вызов.
+- Circuit breaker: считает долю ошибок и медленных вызовов в скользящем окне;
+  в открытом состоянии вызовы не выполняются: outbox.DeferredSendError откладывает
+  строку outbox до закрытия breaker, не расходуя попытку.
+- Bulkhead: отдельные лимиты параллелизма для обычных и экстренных сообщений,
+  чтобы напоминания не занимали слоты экстренных уведомлений; не получившее слот
+  сообщение тоже откладывается через DeferredSendError.
+- Экстренные уведомления повторяются внутри бюджета времени (deadline budget);
+  на 429 пауза берется из parameters.retry_after, а окончательный отказ
+  (400/403: чат не найден, бот заблокирован) не повторяется и поднимает
+  outbox.PermanentSendError — строка outbox сразу получает failed_at.
+
+AsyncTelegramClient — то же для цикла событий ASGI-рантайма (asgi.py).
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from threading import BoundedSemaphore, Lock
+from typing import NamedTuple
+
+import httpx
+
+from config import get_bot_token
+from outbox import DeferredSendError, PermanentSendError
+
+logger = logging.getLogger(__name__)
+
+# Другой адрес — для локального Bot API сервера или заглушки в бенчмарках
+TELEGRAM_API_BASE = os.environ.get("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+TELEGRAM_CONNECT_TIMEOUT = float(os.environ.get("TELEGRAM_CONNECT_TIMEOUT", "3"))
+TELEGRAM_READ_TIMEOUT = float(os.environ.get("TELEGRAM_READ_TIMEOUT", "5"))
+TELEGRAM_MAX_CONCURRENCY = int(os.environ.get("TELEGRAM_MAX_CONCURRENCY", "4"))
+TELEGRAM_EMERGENCY_CONCURRENCY = int(os.environ.get("TELEGRAM_EMERGENCY_CONCURRENCY", "2"))
+TELEGRAM_EMERGENCY_DEADLINE = float(os.environ.get("TELEGRAM_EMERGENCY_DEADLINE", "15"))
+TELEGRAM_BULKHEAD_WAIT = float(os.environ.get("TELEGRAM_BULKHEAD_WAIT", "5"))  # Сколько ждать свободный слот
+
+BREAKER_WINDOW = int(os.environ.get("TELEGRAM_BREAKER_WINDOW", "20"))  # Последних вызовов в окне
+BREAKER_MIN_CALLS = int(os.environ.get("TELEGRAM_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATIO = float(os.environ.get("TELEGRAM_BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("TELEGRAM_BREAKER_SLOW_CALL_SECONDS", "3"))
+BREAKER_SLOW_CALL_RATIO = float(os.environ.get("TELEGRAM_BREAKER_SLOW_CALL_RATIO", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("TELEGRAM_BREAKER_OPEN_SECONDS", "30"))
+
+SEND_DELIVERED = "delivered"
+SEND_RETRY = "retry"  # Временная ошибка: можно повторить сразу (после паузы)
+SEND_DEFER = "defer"  # Повтор сейчас не поможет (например, 401), outbox повторит позже
+SEND_PERMANENT = "permanent"  # Telegram отклонил сообщение окончательно
+SEND_BLOCKED = "blocked"  # Вызов не выполнялся: breaker открыт, retry_after — до его полуоткрытия
+# Ошибки, которые относятся к самому сообщению или чату, а не к боту или Telegram
+PERMANENT_STATUS_CODES = {400, 403}
+
+
+class SendOutcome(NamedTuple):
+    status: str
+    retry_after: float = 0.0  # Пауза, которую попросил Telegram (429), или до полуоткрытия breaker
+    error: str = ""
+
+
+class CircuitBreaker:
+    """Circuit breaker по доле ошибок и медленных вызовов.
+
+    closed → open: в окне не меньше min_calls вызовов и доля ошибок или медленных
+    вызовов превысила порог. open → half_open: через open_seconds. В half_open
+    пропускается один пробный вызов; успех закрывает breaker, ошибка снова открывает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_ratio: float = BREAKER_FAILURE_RATIO,
+        slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+        slow_call_ratio: float = BREAKER_SLOW_CALL_RATIO,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_ratio = slow_call_ratio
+        self.open_seconds = open_seconds
+        self._calls: deque[tuple[bool, bool]] = deque(maxlen=window)  # (ошибка, медленный)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов прямо сейчас"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def will_allow_before(self, deadline: float) -> bool:
+        """Может ли breaker пропустить вызов до момента deadline (time.monotonic())"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return True
+            return self._opened_at + self.open_seconds < deadline
+
+    def retry_in(self) -> float:
+        """Секунд до перехода open → half_open (0, если breaker не открыт)"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def record(self, success: bool, duration: float) -> None:
+        """Учитывает результат вызова"""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if success and not slow:
+                    self._state = self.CLOSED
+                    self._calls.clear()
+                    logger.info("🟢 Circuit breaker %s закрыт", self.name)
+                else:
+                    self._trip()
+                return
+            self._calls.append((not success, slow))
+            if self._state == self.CLOSED and len(self._calls) >= self.min_calls:
+                total = len(self._calls)
+                failures = sum(1 for failed, _ in self._calls if failed)
+                slow_calls = sum(1 for _, is_slow in self._calls if is_slow)
+                if failures / total >= self.failure_ratio or slow_calls / total >= self.slow_call_ratio:
+                    self._trip()
+
+    def _trip(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        logger.warning("🔴 Circuit breaker %s открыт на %s сек", self.name, self.open_seconds)
+
+
+class Bulkhead:
+    """Ограничение числа одновременных вызовов; если слот не освободился за timeout, вызов отклоняется"""
+
+    def __init__(self, name: str, max_concurrent: int):
+        self.name = name
+        self._semaphore = BoundedSemaphore(max_concurrent)
+
+    @contextmanager
+    def slot(self, timeout: float = 0):
+        acquired = self._semaphore.acquire(timeout=timeout) if timeout > 0 else self._semaphore.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._semaphore.release()
+
+
+class TelegramClient:
+    """Отправка сообщений через Bot API с breaker, bulkhead и бюджетом повторов"""
+
+    def __init__(self, bot_token: str):
+        self._url = f"{TELEGRAM_API_BASE}/bot{bot_token}/sendMessage"
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(TELEGRAM_READ_TIMEOUT, connect=TELEGRAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=TELEGRAM_MAX_CONCURRENCY + TELEGRAM_EMERGENCY_CONCURRENCY),
+        )
+        self.breaker = CircuitBreaker("telegram")
+        self._regular = Bulkhead("regular", TELEGRAM_MAX_CONCURRENCY)
+        self._emergency = Bulkhead("emergency", TELEGRAM_EMERGENCY_CONCURRENCY)
+
+    def send_message(self, chat_id: int, text: str, *, emergency: bool = False) -> bool:
+        """Отправляет сообщение. False — сообщение нужно оставить в очереди для повтора.
+
+        PermanentSendError — Telegram отклонил сообщение окончательно,
+        DeferredSendError — отправка не начиналась (breaker открыт, bulkhead заполнен).
+        """
+        bulkhead = self._emergency if emergency else self._regular
+        with bulkhead.slot(TELEGRAM_BULKHEAD_WAIT) as acquired:
+            if not acquired:
+                logger.warning("🚧 Bulkhead %s заполнен, сообщение отложено: chat_id=%s", bulkhead.name, chat_id)
+                raise DeferredSendError(f"bulkhead {bulkhead.name} full")
+            if not emergency:
+                outcome = self._attempt(chat_id, text, TELEGRAM_READ_TIMEOUT)
+            else:
+                outcome = self._send_with_deadline(chat_id, text, TELEGRAM_EMERGENCY_DEADLINE)
+        return _delivered(outcome)
+
+    def _send_with_deadline(self, chat_id: int, text: str, budget: float) -> SendOutcome:
+        """Повторяет отправку после временных ошибок, пока не исчерпан бюджет времени"""
+        deadline = time.monotonic() + budget
+        backoff = 0.5
+        while True:
+            outcome = self._attempt(chat_id, text, min(TELEGRAM_READ_TIMEOUT, deadline - time.monotonic()))
+            pause = _retry_pause(outcome, backoff, deadline, chat_id, self.breaker)
+            if pause is None:
+                return outcome
+            time.sleep(pause)
+            backoff *= 2
+
+    def _attempt(self, chat_id: int, text: str, timeout: float) -> SendOutcome:
+        if not self.breaker.allow():
+            logger.warning("⛔ Circuit breaker открыт, сообщение отложено: chat_id=%s", chat_id)
+            return SendOutcome(SEND_BLOCKED, self.breaker.retry_in(), "circuit breaker open")
+        started = time.monotonic()
+        try:
+            resp = self._http.post(self._url, json=_payload(chat_id, text),
+                                   timeout=httpx.Timeout(timeout, connect=TELEGRAM_CONNECT_TIMEOUT))
+            outcome, healthy = _response_outcome(resp, chat_id, text)
+        except Exception as e:
+            outcome, healthy = _log_send_error(e, chat_id), False
+        self.breaker.record(healthy, time.monotonic() - started)
+        return outcome
+
+
+def _payload(chat_id: int, text: str) -> dict:
+    # Явно указываем disable_notification=False для включения уведомлений со звуком
+    return {"chat_id": chat_id, "text": text, "disable_notification": False}
+
+
+def _response_outcome(resp: httpx.Response, chat_id: int, text: str) -> tuple[SendOutcome, bool]:
+    """(результат, исправен ли Telegram — для breaker)"""
+    status = resp.status_code
+    if status < 400:
+        logger.info("✅ Сообщение отправлено: chat_id=%s, text=%s", chat_id, text[:50])
+        return SendOutcome(SEND_DELIVERED), True
+    logger.error("❌ HTTP API sendMessage FAILED: chat_id=%s, status=%s, response=%s",
+                 chat_id, status, resp.text[:200])
+    try:
+        body = resp.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    error = f"{status}: {body.get('description') or resp.text[:200]}"
+    if status == 429:
+        retry_after = (body.get("parameters") or {}).get("retry_after") or resp.headers.get("Retry-After") or 0
+        try:
+            retry_after = max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            retry_after = 0.0
+        return SendOutcome(SEND_RETRY, retry_after, error), False
+    if status >= 500:
+        return SendOutcome(SEND_RETRY, error=error), False
+    # Ошибки клиента (например, бот заблокирован) не говорят о деградации Telegram
+    if status in PERMANENT_STATUS_CODES:
+        return SendOutcome(SEND_PERMANENT, error=error), True
+    return SendOutcome(SEND_DEFER, error=error), True
+
+
+def _log_send_error(error: Exception, chat_id: int) -> SendOutcome:
+    if isinstance(error, httpx.TimeoutException):
+        logger.error("⏱️ Timeout при отправке сообщения: chat_id=%s", chat_id)
+    else:
+        logger.error("❌ HTTP API отправка не удалась: chat_id=%s, error=%s", chat_id, error, exc_info=error)
+    return SendOutcome(SEND_RETRY, error=str(error) or type(error).__name__)
+
+
+def _retry_pause(outcome: SendOutcome, backoff: float, deadline: float, chat_id: int,
+                 breaker: CircuitBreaker) -> float | None:
+    """Пауза перед следующей попыткой в пределах бюджета; None — прекратить попытки"""
+    if outcome.status not in (SEND_RETRY, SEND_BLOCKED) or not breaker.will_allow_before(deadline):
+        return None
+    pause = outcome.retry_after or backoff
+    if time.monotonic() + pause >= deadline:
+        logger.error("⏱️ Исчерпан бюджет экстренной отправки: chat_id=%s, пауза=%.1f сек", chat_id, pause)
+        return None
+    return pause
+
+
+def _delivered(outcome: SendOutcome) -> bool:
+    """Результат для outbox: True/False, PermanentSendError или DeferredSendError"""
+    if outcome.status == SEND_PERMANENT:
+        raise PermanentSendError(outcome.error)
+    if outcome.status == SEND_BLOCKED:
+        raise DeferredSendError(outcome.error, outcome.retry_after)
+    return outcome.status == SEND_DELIVERED
+
+
+class AsyncBulkhead:
+    """Bulkhead для цикла событий: asyncio.Semaphore вместо потокового семафора"""
+
+    def __init__(self, name: str, max_concurrent: int):
+        self.name = name
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self, timeout: float = 0):
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+                acquired = True
+            except asyncio.TimeoutError:
+                acquired = False
+        else:
+            acquired = not self._semaphore.locked()
+            if acquired:
+                await self._semaphore.acquire()
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._semaphore.release()
+
+
+class AsyncTelegramClient:
+    """TelegramClient для ASGI-рантайма (asgi.py): httpx.AsyncClient, те же breaker, bulkhead и бюджет"""
+
+    def __init__(self, bot_token: str):
+        self._url = f"{TELEGRAM_API_BASE}/bot{bot_token}/sendMessage"
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(TELEGRAM_READ_TIMEOUT, connect=TELEGRAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=TELEGRAM_MAX_CONCURRENCY + TELEGRAM_EMERGENCY_CONCURRENCY),
+        )
+        # Breaker общий с потоковой реализацией: его блокировка не удерживается через await
+        self.breaker = CircuitBreaker("telegram")
+        self._regular = AsyncBulkhead("regular", TELEGRAM_MAX_CONCURRENCY)
+        self._emergency = AsyncBulkhead("emergency", TELEGRAM_EMERGENCY_CONCURRENCY)
+
+    async def send_message(self, chat_id: int, text: str, emergency: bool = False) -> bool:
+        """Отправляет сообщение. Сигнатура совместима с outbox.AsyncSendFn"""
+        bulkhead = self._emergency if emergency else self._regular
+        async with bulkhead.slot(TELEGRAM_BULKHEAD_WAIT) as acquired:
+            if not acquired:
+                logger.warning("🚧 Bulkhead %s заполнен, сообщение отложено: chat_id=%s", bulkhead.name, chat_id)
+                raise DeferredSendError(f"bulkhead {bulkhead.name} full")
+            if not emergency:
+                outcome = await self._attempt(chat_id, text, TELEGRAM_READ_TIMEOUT)
+            else:
+                outcome = await self._send_with_deadline(chat_id, text, TELEGRAM_EMERGENCY_DEADLINE)
+        return _delivered(outcome)
+
+    async def _send_with_deadline(self, chat_id: int, text: str, budget: float) -> SendOutcome:
+        deadline = time.monotonic() + budget
+        backoff = 0.5
+        while True:
+            outcome = await self._attempt(chat_id, text, min(TELEGRAM_READ_TIMEOUT, deadline - time.monotonic()))
+            pause = _retry_pause(outcome, backoff, deadline, chat_id, self.breaker)
+            if pause is None:
+                return outcome
+            await asyncio.sleep(pause)
+            backoff *= 2
+
+    async def _attempt(self, chat_id: int, text: str, timeout: float) -> SendOutcome:
+        if not self.breaker.allow():
+            logger.warning("⛔ Circuit breaker открыт, сообщение отложено: chat_id=%s", chat_id)
+            return SendOutcome(SEND_BLOCKED, self.breaker.retry_in(), "circuit breaker open")
+        started = time.monotonic()
+        try:
+            resp = await self._http.post(self._url, json=_payload(chat_id, text),
+                                         timeout=httpx.Timeout(timeout, connect=TELEGRAM_CONNECT_TIMEOUT))
+            outcome, healthy = _response_outcome(resp, chat_id, text)
+        except Exception as e:
+            outcome, healthy = _log_send_error(e, chat_id), False
+        self.breaker.record(healthy, time.monotonic() - started)
+        return outcome
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_client: TelegramClient | None = None
+_client_lock = Lock()
+
+
+def get_client() -> TelegramClient:
+    """Общий клиент процесса; создается при первой отправке"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient(get_bot_token())
+    return _client
+
+
+def peek_client() -> TelegramClient | None:
+    """Клиент, если он уже создан в этом процессе (для /debug)"""
+    return _client
+
+
+def send_message(chat_id: int, text: str, emergency: bool = False) -> bool:
+    """Отправляет сообщение через общий клиент. Сигнатура совместима с outbox.SendFn"""
+    return get_client().send_message(chat_id, text, emergency=emergency)
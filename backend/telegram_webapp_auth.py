@@ -6,12 +6,15 @@ import hashlib
 import hmac
 import json
 import logging
+import os
 import time
-from typing import Any
+from typing import Any, Mapping
 from urllib.parse import unquote
 
 logger = logging.getLogger(__name__)
 
+INIT_DATA_HEADER = "X-Telegram-Init-Data"
+
 
 def _parse_init_data_pairs(init_data: str) -> dict[str, str]:
     """
@@ -96,3 +99,58 @@ def telegram_user_id_from_init_data(init_data: str, bot_token: str) -> int | Non
         return int(uid)
     except (TypeError, ValueError):
         return None
+
+
+def init_data_candidates(headers: Mapping, query_init_data: str | None, body: Any) -> list[str]:
+    """
+    Все непустые варианты initData из запроса. Длинные строки идут первыми:
+    иногда заголовок обрезают прокси, а query/body содержат полный payload.
+    headers — регистронезависимые заголовки (Flask или Starlette), body — разобранный JSON или None.
+    """
+    seen: set[str] = set()
+    chunks: list[str] = []
+
+    def add(s: str | None) -> None:
+        t = (s or "").strip()
+        if not t or t in seen:
+            return
+        seen.add(t)
+        chunks.append(t)
+
+    add(headers.get(INIT_DATA_HEADER))
+    add(headers.get("X-Telegram-Web-App-Init-Data"))
+    auth = (headers.get("Authorization") or "").strip()
+    if auth[:4].lower() == "tma " and len(auth) > 4:
+        add(auth[4:])
+    add(query_init_data)
+    if isinstance(body, dict):
+        b = body.get("init_data")
+        if isinstance(b, str):
+            add(b)
+    chunks.sort(key=len, reverse=True)
+    return chunks
+
+
+def legacy_user_id(body: Any, query_user_id: str | None) -> int | None:
+    """
+    Как в исходном приложении: user_id из JSON или query.
+    Включается только если TELEGRAM_WEBAPP_ALLOW_LEGACY_USER_ID=1 (по умолчанию да —
+    иначе пустой/битый initData в части клиентов Telegram ломает мини‑апп).
+    Для жёсткой проверки подписи выставьте TELEGRAM_WEBAPP_ALLOW_LEGACY_USER_ID=0 на Render.
+    """
+    allow = os.environ.get("TELEGRAM_WEBAPP_ALLOW_LEGACY_USER_ID", "1").strip().lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    if not allow:
+        return None
+    candidate = body.get("user_id") if isinstance(body, dict) else None
+    if candidate is None:
+        candidate = query_user_id
+    if candidate is None:
+        return None
+    try:
+        return int(candidate)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,40 @@
+"""
+Общие фикстуры тестов backend.
+
+Запуск из каталога backend:
+    python -m pytest -q
+
+Тесты работают с SQLite во временном каталоге: engine models создается при первом
+обращении, поэтому DATABASE_URL задается до импорта модулей приложения.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+_workdir = tempfile.mkdtemp(prefix="homealone_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_workdir}/test.db"
+os.environ.setdefault("BOT_TOKEN", "0:tests")
+os.environ.setdefault("SCHEDULER_SNAPSHOT_PATH", os.path.join(_workdir, "scheduler.snap"))
+
+
+@pytest.fixture(scope="session")
+def schema():
+    """Схема БД после всех миграций"""
+    from models import init_db
+
+    init_db()
+
+
+@pytest.fixture
+def db(schema):
+    """Сессия с пустой таблицей outbox; коммит — по выходу из теста"""
+    from models import OutboxMessage, get_db_session
+
+    with get_db_session() as session:
+        session.query(OutboxMessage).delete()
+    with get_db_session() as session:
+        yield session
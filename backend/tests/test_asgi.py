@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("starlette")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+import asgi  # noqa: E402
+from rate_limit import MemoryTokenBuckets  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Свежие ведра на каждый тест; lifespan (планировщик, бот) без with не запускается
+    monkeypatch.setattr(asgi.limiter, "storage", MemoryTokenBuckets())
+    monkeypatch.setattr(asgi.limiter, "default_limits", [(3, 3600)])
+    return TestClient(asgi.create_app())
+
+
+def test_unlisted_route_gets_default_limit(client):
+    codes = [client.get("/").status_code for _ in range(4)]
+    assert codes == [200, 200, 200, 429]
+    response = client.get("/")
+    assert response.json() == {"error": "rate_limited"}
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_default_limit_scopes():
+    assert asgi.limiter._default_scope("root") == "default:root"
+    assert asgi.limiter._default_scope("telegram_webhook") == "default:telegram_webhook"
+    # Явный limit() не суммируется с лимитом по умолчанию, статика — exempt
+    assert asgi.limiter._default_scope("http_debug") is None
+    assert asgi.limiter._default_scope("miniapp_static") is None or asgi.load_miniapp_index() is None
+
+
+@pytest.mark.parametrize(
+    "body, expected",
+    [
+        (b"", 400),
+        (b"{not json", 400),
+        (b"\xff\xfe", 400),
+        (b"[1, 2]", 400),
+        (b'{"update_id": 1}', 200),
+    ],
+)
+def test_webhook_rejects_malformed_body(client, body, expected):
+    pytest.importorskip("telegram")
+    queued = []
+
+    class UpdateQueue:
+        async def put(self, update):
+            queued.append(update)
+
+    client.app.state.runtime = SimpleNamespace(bot=SimpleNamespace(update_queue=UpdateQueue(), bot=None))
+    response = client.post(asgi.TELEGRAM_WEBHOOK_PATH, content=body,
+                           headers={"X-Telegram-Bot-Api-Secret-Token": asgi._webhook_secret()})
+    assert response.status_code == expected
+    assert len(queued) == (1 if expected == 200 else 0)
@@ -0,0 +1,50 @@
+import sys
+
+import pytest
+
+pytest.importorskip("fontTools")
+
+import build_static  # noqa: E402
+
+
+def _write_font(path):
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    pen = TTGlyphPen(None)
+    pen.moveTo((0, 0))
+    pen.lineTo((0, 500))
+    pen.lineTo((500, 0))
+    pen.closePath()
+    glyph = pen.glyph()
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder([".notdef", "A"])
+    builder.setupCharacterMap({ord("A"): "A"})
+    builder.setupGlyf({".notdef": glyph, "A": glyph})
+    builder.setupHorizontalMetrics({".notdef": (500, 0), "A": (500, 0)})
+    builder.setupHorizontalHeader()
+    builder.setupNameTable({"familyName": "Test", "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.save(str(path))
+
+
+@pytest.mark.parametrize("has_brotli, flavor", [(True, "woff2"), (False, "woff")])
+def test_optimize_fonts_falls_back_to_woff_without_brotli(tmp_path, monkeypatch, has_brotli, flavor):
+    if has_brotli:
+        pytest.importorskip("brotli")
+    else:
+        # None в sys.modules — import поднимает ImportError, как при отсутствии пакета
+        monkeypatch.setitem(sys.modules, "brotli", None)
+        monkeypatch.setitem(sys.modules, "brotlicffi", None)
+    (tmp_path / "static" / "media").mkdir(parents=True)
+    _write_font(tmp_path / "static" / "media" / "Test.ttf")
+    css = tmp_path / "static" / "main.css"
+    css.write_text("@font-face{src:url(./media/Test.ttf) format('truetype')}", encoding="utf-8")
+
+    replaced = build_static.optimize_fonts(str(tmp_path))
+
+    [font_path] = replaced.values()
+    assert font_path.endswith(f".{flavor}")
+    assert not (tmp_path / "static" / "media" / "Test.ttf").exists()
+    assert f"format('{flavor}')" in css.read_text(encoding="utf-8")
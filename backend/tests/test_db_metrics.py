@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from db_metrics import instrument_engine
+
+
+def _engine():
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=2, max_overflow=0)
+    return engine, instrument_engine(engine, "test", capacity=2, warn_ratio=0.5)
+
+
+def test_checkout_and_checkin_are_counted():
+    engine, metrics = _engine()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert metrics.snapshot()["checked_out"] == 1
+    snapshot = metrics.snapshot()
+    assert snapshot["checked_out"] == 0
+    assert snapshot["checkouts"] == 1
+    assert snapshot["saturation_events"] == 1
+    assert snapshot["held_ms_avg"] is not None
+
+
+def test_invalidated_connection_is_released():
+    engine, metrics = _engine()
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.invalidate()
+    snapshot = metrics.snapshot()
+    assert snapshot["checked_out"] == 0
+    assert snapshot["invalidations"] == 3
+
+
+def test_detached_connection_is_released():
+    engine, metrics = _engine()
+    conn = engine.connect()
+    conn.connection.detach()
+    conn.close()
+    assert metrics.snapshot()["checked_out"] == 0
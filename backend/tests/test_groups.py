@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import select
+
+import groups
+from groups import GroupError, create_group, group_status, join_group, leave_group, list_user_groups
+from models import Group, GroupMembership, StatusEvent, User, UserStats
+from users import STATUS_AWAY, STATUS_HOME, set_status
+
+OWNER_ID = 5101
+MEMBER_ID = 5102
+USER_IDS = (OWNER_ID, MEMBER_ID)
+
+
+@pytest.fixture
+def group_db(db):
+    group_ids = select(GroupMembership.group_id).where(GroupMembership.user_id.in_(USER_IDS))
+    db.query(Group).filter(Group.id.in_(group_ids)).delete(synchronize_session=False)
+    db.query(GroupMembership).filter(GroupMembership.user_id.in_(USER_IDS)).delete()
+    for model in (StatusEvent, UserStats, User):
+        db.query(model).filter(model.user_id.in_(USER_IDS)).delete()
+    for user_id in USER_IDS:
+        db.add(User(user_id=user_id, chat_id=user_id, username=f"user{user_id}", status=STATUS_HOME,
+                    emergency_contact_username="@friend"))
+    db.flush()
+    groups._status_cache.clear()
+    yield db
+    groups._status_cache.clear()
+
+
+def _version(db, group_id):
+    return db.execute(select(Group.status_version).where(Group.id == group_id)).scalar_one()
+
+
+def _member_ids(db, group_id):
+    return [m["user_id"] for m in group_status(db, group_id, OWNER_ID)["members"]]
+
+
+def test_join_adds_member_once_and_bumps_version(group_db):
+    group = create_group(group_db, OWNER_ID, "Семья")
+    group_db.flush()
+    assert _version(group_db, group["group_id"]) == 0
+
+    joined = join_group(group_db, MEMBER_ID, group["invite_code"])
+    group_db.flush()
+    assert joined["members_count"] == 2
+    assert _version(group_db, group["group_id"]) == 1
+    # Повторное вступление ничего не меняет
+    assert join_group(group_db, MEMBER_ID, group["invite_code"])["members_count"] == 2
+    group_db.flush()
+    assert _version(group_db, group["group_id"]) == 1
+
+    assert _member_ids(group_db, group["group_id"]) == [OWNER_ID, MEMBER_ID]
+    assert [g["group_id"] for g in list_user_groups(group_db, MEMBER_ID)] == [group["group_id"]]
+
+
+def test_join_rejects_unknown_code_and_full_group(group_db, monkeypatch):
+    with pytest.raises(GroupError) as exc:
+        join_group(group_db, MEMBER_ID, "no-such-code")
+    assert (exc.value.code, exc.value.status) == ("group_not_found", 404)
+
+    monkeypatch.setattr(groups, "GROUP_MAX_MEMBERS", 1)
+    group = create_group(group_db, OWNER_ID, "Семья")
+    group_db.flush()
+    with pytest.raises(GroupError) as exc:
+        join_group(group_db, MEMBER_ID, group["invite_code"])
+    assert (exc.value.code, exc.value.status) == ("group_full", 409)
+
+
+def test_leave_removes_member_and_bumps_version(group_db):
+    group = create_group(group_db, OWNER_ID, "Семья")
+    group_db.flush()
+    join_group(group_db, MEMBER_ID, group["invite_code"])
+    group_db.flush()
+
+    leave_group(group_db, MEMBER_ID, group["group_id"])
+    group_db.flush()
+
+    assert _version(group_db, group["group_id"]) == 2
+    assert _member_ids(group_db, group["group_id"]) == [OWNER_ID]
+    assert list_user_groups(group_db, MEMBER_ID) == []
+    with pytest.raises(GroupError) as exc:
+        leave_group(group_db, MEMBER_ID, group["group_id"])
+    assert exc.value.status == 404
+
+
+def test_owner_leaving_hands_group_over_and_last_member_deletes_it(group_db):
+    group = create_group(group_db, OWNER_ID, "Семья")
+    group_db.flush()
+    join_group(group_db, MEMBER_ID, group["invite_code"])
+    group_db.flush()
+
+    leave_group(group_db, OWNER_ID, group["group_id"])
+    group_db.flush()
+    assert group_db.get(Group, group["group_id"]).owner_user_id == MEMBER_ID
+    assert group_db.get(GroupMembership, (group["group_id"], MEMBER_ID)).role == groups.ROLE_OWNER
+
+    leave_group(group_db, MEMBER_ID, group["group_id"])
+    group_db.flush()
+    assert group_db.get(Group, group["group_id"]) is None
+
+
+def test_member_status_change_bumps_version_and_invalidates_cache(group_db):
+    group = create_group(group_db, OWNER_ID, "Семья")
+    group_db.flush()
+    join_group(group_db, MEMBER_ID, group["invite_code"])
+    group_db.flush()
+    version = _version(group_db, group["group_id"])
+
+    statuses = {m["user_id"]: m["status"] for m in group_status(group_db, group["group_id"], OWNER_ID)["members"]}
+    assert statuses[MEMBER_ID] == STATUS_HOME
+
+    # Запись мимо set_status не увеличивает версию — ответ берется из кеша
+    group_db.query(User).filter(User.user_id == MEMBER_ID).update({"status": STATUS_AWAY})
+    group_db.flush()
+    statuses = {m["user_id"]: m["status"] for m in group_status(group_db, group["group_id"], OWNER_ID)["members"]}
+    assert statuses[MEMBER_ID] == STATUS_HOME
+
+    set_status(group_db, MEMBER_ID, STATUS_AWAY)
+    group_db.flush()
+    assert _version(group_db, group["group_id"]) == version + 1
+    members = group_status(group_db, group["group_id"], OWNER_ID)["members"]
+    member = next(m for m in members if m["user_id"] == MEMBER_ID)
+    assert member["status"] == STATUS_AWAY
+    assert member["stage"] == "waiting"
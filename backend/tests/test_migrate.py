@@ -0,0 +1,155 @@
+import sys
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import migrate
+import migrations
+from migrate import MigrationContext, MigrationError
+from models import get_engine
+
+
+class PgError(Exception):
+    def __init__(self, pgcode):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def _operational_error(pgcode):
+    return OperationalError("CREATE INDEX CONCURRENTLY ...", {}, PgError(pgcode))
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    pauses = []
+    monkeypatch.setattr(migrate.time, "sleep", pauses.append)
+    return pauses
+
+
+def test_lock_timeout_is_retried_with_backoff(schema, no_sleep):
+    ctx = MigrationContext(get_engine())
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _operational_error("55P03")
+        return "done"
+
+    assert ctx._retry_on_lock_timeout(attempt) == "done"
+    assert len(calls) == 3
+    assert no_sleep == [1.0, 2.0]
+
+
+def test_lock_timeout_gives_up_after_retries(schema, no_sleep, monkeypatch):
+    monkeypatch.setattr(migrate, "MIGRATION_LOCK_RETRIES", 3)
+    ctx = MigrationContext(get_engine())
+
+    def attempt():
+        raise _operational_error("55P03")
+
+    with pytest.raises(OperationalError):
+        ctx._retry_on_lock_timeout(attempt)
+    assert len(no_sleep) == 2
+
+
+def test_other_errors_are_not_retried(schema, no_sleep):
+    ctx = MigrationContext(get_engine())
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise _operational_error("40P01")
+
+    with pytest.raises(OperationalError):
+        ctx._retry_on_lock_timeout(attempt)
+    assert calls == [1]
+    assert no_sleep == []
+
+
+# Версии нарочно записываются в каталог не по порядку создания файлов
+FAKE_MIGRATIONS = {
+    "9002_second": 'def upgrade(ctx):\n    ctx.execute("INSERT INTO migrate_test_log (version) VALUES (\'9002\')")\n',
+    "9010_third": (
+        "transactional = False\n\n\n"
+        'def upgrade(ctx):\n    ctx.execute("INSERT INTO migrate_test_log (version) VALUES (\'9010\')")\n'
+    ),
+    "9001_first": (
+        "def upgrade(ctx):\n"
+        '    ctx.execute("CREATE TABLE migrate_test_log (id INTEGER PRIMARY KEY, version VARCHAR(16))")\n'
+        '    ctx.execute("INSERT INTO migrate_test_log (version) VALUES (\'9001\')")\n'
+    ),
+}
+
+
+@pytest.fixture
+def fake_migrations(schema, tmp_path, monkeypatch):
+    for name, source in FAKE_MIGRATIONS.items():
+        (tmp_path / f"{name}.py").write_text(source, encoding="utf-8")
+    (tmp_path / "README.md").write_text("не миграция", encoding="utf-8")
+    monkeypatch.setattr(migrate, "MIGRATIONS_DIR", str(tmp_path))
+    monkeypatch.setattr(migrations, "__path__", [str(tmp_path)])
+    yield
+    for name in FAKE_MIGRATIONS:
+        sys.modules.pop(f"migrations.{name}", None)
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM schema_migrations WHERE version LIKE '90%'"))
+        conn.execute(text("DROP TABLE IF EXISTS migrate_test_log"))
+
+
+def test_real_migrations_are_applied_by_init_db(schema):
+    assert migrate.upgrade() == []
+    versions = [version for version, _, applied in migrate.status() if applied]
+    assert versions == sorted(versions) and len(versions) >= 7
+
+
+def test_upgrade_applies_migrations_in_version_order_once(fake_migrations):
+    assert migrate.upgrade() == ["9001", "9002", "9010"]
+    with get_engine().connect() as conn:
+        log = conn.execute(text("SELECT version FROM migrate_test_log ORDER BY id")).scalars().all()
+    assert log == ["9001", "9002", "9010"]
+    assert {"9001", "9002", "9010"} <= migrate.applied_versions(get_engine())
+
+    assert migrate.upgrade() == []
+    with get_engine().connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM migrate_test_log")).scalar() == 3
+
+
+@pytest.fixture
+def backfill_table(schema):
+    with get_engine().begin() as conn:
+        conn.execute(text("CREATE TABLE backfill_test (id INTEGER PRIMARY KEY, value INTEGER, flag INTEGER)"))
+        # Ключи с пропусками: keyset-пагинация не должна зависеть от их плотности
+        for key in range(1, 60, 2):
+            conn.execute(text("INSERT INTO backfill_test (id, value) VALUES (:id, :id)"), {"id": key})
+    yield
+    with get_engine().begin() as conn:
+        conn.execute(text("DROP TABLE backfill_test"))
+
+
+def test_backfill_processes_every_row_in_batches(backfill_table, monkeypatch):
+    ctx = MigrationContext(get_engine())
+    batches = []
+    run_in_transaction = ctx.run_in_transaction
+    monkeypatch.setattr(ctx, "run_in_transaction", lambda fn: batches.append(1) or run_in_transaction(fn))
+
+    assert ctx.backfill("backfill_test", "id", "flag = value * 10", batch_size=7, pause=0) == 30
+
+    # 30 строк по 7 — пять батчей и пустой запрос, завершающий обход
+    assert len(batches) == 6
+    with get_engine().connect() as conn:
+        rows = conn.execute(text("SELECT value, flag FROM backfill_test")).all()
+    assert len(rows) == 30
+    assert all(flag == value * 10 for value, flag in rows)
+
+
+def test_backfill_respects_where_and_requires_non_transactional(backfill_table):
+    ctx = MigrationContext(get_engine())
+    assert ctx.backfill("backfill_test", "id", "flag = 1", where="value > 40", batch_size=4, pause=0) == 10
+    with get_engine().connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM backfill_test WHERE flag = 1")).scalar() == 10
+
+    with get_engine().connect() as conn:
+        with pytest.raises(MigrationError):
+            MigrationContext(get_engine(), conn).backfill("backfill_test", "id", "flag = 2")
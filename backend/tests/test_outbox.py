@@ -0,0 +1,153 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import outbox
+from models import OutboxMessage
+
+
+def _enqueue(db, key, priority=outbox.PRIORITY_NORMAL, chat_id=1):
+    outbox.enqueue_message(db, chat_id, f"text {key}", key, priority)
+    db.flush()
+
+
+def _row(db, key) -> OutboxMessage:
+    db.expire_all()
+    return db.query(OutboxMessage).filter(OutboxMessage.idempotency_key == key).one()
+
+
+def test_claim_orders_emergency_first_and_locks(db):
+    _enqueue(db, "normal")
+    _enqueue(db, "emergency", outbox.PRIORITY_EMERGENCY)
+
+    claimed = outbox.claim_rows(db, 10)
+
+    assert [item["idempotency_key"] for item in claimed] == ["emergency", "normal"]
+    assert all(item["attempts"] == 1 for item in claimed)
+    db.flush()
+    assert outbox.claim_rows(db, 10) == []  # Заблокированы на OUTBOX_CLAIM_TTL
+
+
+def test_enqueue_is_idempotent(db):
+    _enqueue(db, "once")
+    assert outbox.enqueue_message(db, 1, "again", "once") is False
+
+
+def test_finalize_marks_delivered_and_backs_off_failed(db):
+    _enqueue(db, "ok")
+    _enqueue(db, "retry")
+    ok, retry = outbox.claim_rows(db, 10)
+    retry["error"] = "timeout"
+
+    outbox.finalize_rows(db, [ok["id"]], [retry])
+
+    assert _row(db, "ok").sent_at is not None
+    row = _row(db, "retry")
+    assert row.sent_at is None and row.failed_at is None
+    assert row.locked_until is None
+    assert row.last_error == "timeout"
+    assert row.available_at.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+    assert outbox.claim_rows(db, 10) == []  # Ждет окончания паузы
+
+
+def test_permanent_failure_is_terminal(db):
+    _enqueue(db, "blocked", outbox.PRIORITY_EMERGENCY)
+    (item,) = outbox.claim_rows(db, 10)
+    item.update(error="403 Forbidden: bot was blocked by the user", permanent=True)
+
+    outbox.finalize_rows(db, [], [item])
+
+    row = _row(db, "blocked")
+    assert row.failed_at is not None
+    db.query(OutboxMessage).update({OutboxMessage.available_at: datetime.now(timezone.utc) - timedelta(hours=1)})
+    assert outbox.claim_rows(db, 10) == []
+
+
+def test_attempts_cap_applies_to_emergency(db, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_EMERGENCY_ATTEMPTS", 2)
+    _enqueue(db, "poison", outbox.PRIORITY_EMERGENCY)
+    for attempt in (1, 2):
+        (item,) = outbox.claim_rows(db, 10)
+        assert item["attempts"] == attempt
+        outbox.finalize_rows(db, [], [item])
+        db.query(OutboxMessage).update({OutboxMessage.available_at: datetime.now(timezone.utc) - timedelta(hours=1)})
+
+    assert _row(db, "poison").failed_at is not None
+    assert outbox.claim_rows(db, 10) == []
+
+
+def test_deferred_send_does_not_use_an_attempt(db, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    _enqueue(db, "outage")
+    # Отправка не начиналась (breaker открыт) — сколько бы раз это ни повторилось
+    for _ in range(5):
+        (item,) = outbox.claim_rows(db, 10)
+        assert item["attempts"] == 1
+        assert outbox._send_item(_raise(outbox.DeferredSendError("circuit breaker open", 20)), item) is False
+        outbox.finalize_rows(db, [], [item])
+        row = _row(db, "outage")
+        assert row.attempts == 0 and row.failed_at is None
+        assert row.last_error == "circuit breaker open"
+        delay = row.available_at.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)
+        assert timedelta(seconds=15) < delay <= timedelta(seconds=20)
+        db.query(OutboxMessage).update({OutboxMessage.available_at: datetime.now(timezone.utc) - timedelta(hours=1)})
+
+
+def _raise(error):
+    def send(chat_id, text, emergency):
+        raise error
+
+    return send
+
+
+def test_prune_removes_only_old_terminal_rows(db):
+    for key in ("old_sent", "old_failed", "fresh_sent", "pending"):
+        _enqueue(db, key)
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    db.query(OutboxMessage).filter(OutboxMessage.idempotency_key == "old_sent").update({OutboxMessage.sent_at: old})
+    db.query(OutboxMessage).filter(OutboxMessage.idempotency_key == "old_failed").update({OutboxMessage.failed_at: old})
+    db.query(OutboxMessage).filter(OutboxMessage.idempotency_key == "fresh_sent").update(
+        {OutboxMessage.sent_at: datetime.now(timezone.utc)}
+    )
+
+    deleted = outbox.prune_rows(db, datetime.now(timezone.utc) - timedelta(days=7))
+
+    assert deleted == 2
+    db.expire_all()
+    assert {row.idempotency_key for row in db.query(OutboxMessage)} == {"fresh_sent", "pending"}
+
+
+def test_emergency_lane_is_not_blocked_by_slow_regular_sends(db, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_POLL_INTERVAL", 0.05)
+    for n in range(outbox.OUTBOX_SEND_CONCURRENCY + 2):
+        _enqueue(db, f"slow{n}", chat_id=100 + n)
+    db.commit()
+    release = threading.Event()
+    delivered = []
+
+    def send(chat_id, text, emergency):
+        if not emergency:
+            release.wait(10)
+        delivered.append(chat_id)
+        return True
+
+    stop = threading.Event()
+    worker = outbox.start_outbox_worker(send, stop)
+    try:
+        time.sleep(0.2)  # Все слоты обычной полосы заняты
+        _enqueue(db, "sos", outbox.PRIORITY_EMERGENCY, chat_id=1)
+        db.commit()
+        outbox.notify_outbox()
+        deadline = time.monotonic() + 5
+        while _row(db, "sos").sent_at is None and time.monotonic() < deadline:
+            db.rollback()  # Новый снимок SQLite на следующей итерации
+            time.sleep(0.01)
+        assert delivered == [1]
+        assert _row(db, "sos").sent_at is not None
+    finally:
+        release.set()
+        stop.set()
+        worker.join(5)
+    assert not worker.is_alive()
+    # Отправки, начатые до остановки, отмечены
+    assert _row(db, "slow0").sent_at is not None
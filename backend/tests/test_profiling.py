@@ -0,0 +1,63 @@
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+import profiling
+from models import get_engine
+from profiling import PROFILE_HEADER, get_profile, install_request_profiler
+
+SECRET = "s3cret"
+
+
+def _app():
+    app = Flask(__name__)
+
+    @app.route("/query")
+    def query():
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1")).scalar()
+            conn.execute(text("SELECT 2")).scalar()
+        return "ok"
+
+    return app
+
+
+@pytest.fixture
+def profiled_app(schema, monkeypatch):
+    monkeypatch.setenv("DEBUG_SECRET", SECRET)
+    monkeypatch.setattr(profiling, "_profiles", profiling.OrderedDict())
+    app = _app()
+    assert install_request_profiler(app)
+    return app
+
+
+def test_hooks_are_not_registered_without_secret(monkeypatch):
+    monkeypatch.delenv("DEBUG_SECRET", raising=False)
+    app = _app()
+
+    assert install_request_profiler(app) is False
+    assert not app.before_request_funcs
+    assert not app.after_request_funcs
+    assert not app.teardown_request_funcs
+
+
+@pytest.mark.parametrize("headers", [{}, {PROFILE_HEADER: "wrong"}])
+def test_request_without_secret_is_not_profiled(profiled_app, headers):
+    response = profiled_app.test_client().get("/query", headers=headers)
+
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert "Server-Timing" not in response.headers
+    assert profiling.list_profiles() == []
+
+
+def test_request_with_secret_reports_sql_counters(profiled_app):
+    response = profiled_app.test_client().get("/query", headers={PROFILE_HEADER: SECRET})
+
+    assert response.status_code == 200
+    profile = get_profile(response.headers["X-Profile-Id"])
+    assert profile["path"] == "/query"
+    assert profile["status"] == 200
+    assert profile["sql"]["queries"] == 2
+    assert {s["sql"]: s["count"] for s in profile["sql"]["statements"]} == {"SELECT 1": 1, "SELECT 2": 1}
+    assert 'db;desc="2 queries"' in response.headers["Server-Timing"]
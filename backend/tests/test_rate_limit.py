@@ -0,0 +1,126 @@
+import pytest
+from flask import Flask
+
+import rate_limit
+from rate_limit import MemoryTokenBuckets, RateLimiter, check_limits, parse_limit, retry_after_header
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        ("45 per minute", (45, 60)),
+        ("90 per minutes", (90, 60)),
+        (" 3 PER Hour ", (3, 3600)),
+        ("1 per second", (1, 1)),
+        ("10 per day", (10, 86400)),
+    ],
+)
+def test_parse_limit(spec, expected):
+    assert parse_limit(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["", "45/minute", "45 per fortnight", "0 per minute", "-1 per minute", "x per minute"])
+def test_parse_limit_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_limit(spec)
+
+
+def test_bucket_allows_capacity_then_rejects(clock):
+    buckets = MemoryTokenBuckets()
+    assert [buckets.hit("k", 3, 60) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Пополнение 3 токена за 60 сек — один токен через 20 сек
+    assert buckets.hit("k", 3, 60) == pytest.approx(20.0)
+    # Отклоненный запрос токен не списывает
+    assert buckets.hit("k", 3, 60) == pytest.approx(20.0)
+
+
+def test_bucket_refills_gradually_up_to_capacity(clock):
+    buckets = MemoryTokenBuckets()
+    for _ in range(3):
+        buckets.hit("k", 3, 60)
+    clock.now += 10
+    assert buckets.hit("k", 3, 60) == pytest.approx(10.0)
+    clock.now += 10
+    assert buckets.hit("k", 3, 60) == 0.0
+    assert buckets.hit("k", 3, 60) > 0
+    # За долгий простой ведро копит не больше capacity токенов
+    clock.now += 3600
+    assert [buckets.hit("k", 3, 60) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.hit("k", 3, 60) > 0
+
+
+def test_buckets_are_independent_per_key(clock):
+    buckets = MemoryTokenBuckets()
+    assert buckets.hit("a", 1, 60) == 0.0
+    assert buckets.hit("a", 1, 60) > 0
+    assert buckets.hit("b", 1, 60) == 0.0
+
+
+def test_sweep_drops_only_fully_refilled_buckets(clock, monkeypatch):
+    monkeypatch.setattr(MemoryTokenBuckets, "SWEEP_EVERY", 3)
+    buckets = MemoryTokenBuckets()
+    buckets.hit("old", 5, 60)
+    clock.now += 61
+    buckets.hit("fresh", 5, 60)
+    buckets.hit("fresh", 5, 60)  # Третий вызов запускает очистку
+    assert set(buckets._buckets) == {"fresh"}
+
+
+def test_check_limits_stops_at_first_exhausted_limit(clock):
+    buckets = MemoryTokenBuckets()
+    limits = [(2, 60), (100, 3600)]
+    assert check_limits(buckets, "status", "user1", limits) == 0.0
+    assert check_limits(buckets, "status", "user1", limits) == 0.0
+    assert check_limits(buckets, "status", "user1", limits) == pytest.approx(30.0)
+    # Токен часового лимита за отклоненный запрос не списан
+    assert buckets._buckets["status:100/3600:user1"][0] == pytest.approx(98.0)
+    assert check_limits(buckets, "other", "user1", limits) == 0.0
+
+
+@pytest.mark.parametrize("retry_after, expected", [(0.01, "1"), (1.0, "1"), (1.2, "2"), (20.0, "20"), (0, "1")])
+def test_retry_after_header_rounds_up_to_whole_seconds(retry_after, expected):
+    assert retry_after_header(retry_after) == expected
+
+
+def test_flask_limiter_returns_429_with_retry_after(clock):
+    app = Flask(__name__)
+    limiter = RateLimiter(lambda: "user1", app, default_limits=["2 per minute"])
+
+    @app.route("/limited")
+    @limiter.limit("1 per minute")
+    def limited():
+        return "ok"
+
+    @app.route("/default")
+    def default():
+        return "ok"
+
+    @app.route("/free")
+    @limiter.exempt
+    def free():
+        return "ok"
+
+    client = app.test_client()
+    assert client.get("/limited").status_code == 200
+    response = client.get("/limited")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    assert response.get_json() == {"error": "rate_limited"}
+
+    assert [client.get("/default").status_code for _ in range(3)] == [200, 200, 429]
+    assert all(client.get("/free").status_code == 200 for _ in range(5))
@@ -0,0 +1,55 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import scheduler
+from models import User
+from scheduler_snapshot import write_snapshot
+
+USER_IDS = (901, 902, 903)
+
+
+@pytest.fixture
+def no_jobs():
+    yield
+    for user_id in USER_IDS:
+        scheduler.cancel_all_jobs_for_user(user_id)
+
+
+def _job_keys():
+    return {key for key in scheduler.jobs if int(key.split(":")[0]) in USER_IDS}
+
+
+def test_restore_arms_only_stages_within_horizon(no_jobs):
+    now = time.time()
+    write_snapshot([
+        (901, 0, now + 60, 1),
+        (902, 0, now + scheduler.SCHEDULER_THREAD_HORIZON + 60, 1),
+        (903, 1, now + 30, 1),
+    ])
+
+    assert scheduler.restore_snapshot() == 2
+    assert _job_keys() == {"901:rem1", "903:rem2"}
+
+
+def test_reconcile_defers_distant_stages_to_a_later_pass(db, no_jobs, monkeypatch):
+    db.query(User).filter(User.user_id.in_(USER_IDS)).delete()
+    left = datetime.now(timezone.utc)
+    for user_id, timer_seconds in ((901, 60), (902, 3600)):
+        db.add(User(user_id=user_id, chat_id=user_id, status="не дома", left_home_time=left,
+                    timer_seconds=timer_seconds, warnings_sent=0, emergency_contact_username="@friend"))
+    db.commit()
+
+    scheduler.reconcile_pending()
+    assert _job_keys() == {"901:rem1"}
+
+    # Срок 902 вошел в окно — его таймер запускает следующая сверка
+    monkeypatch.setattr(scheduler, "SCHEDULER_THREAD_HORIZON", 3600 + 60)
+    scheduler.reconcile_pending()
+    assert _job_keys() == {"901:rem1", "902:rem1"}
+    job = scheduler.jobs["902:rem1"]
+    assert job.due_at == pytest.approx((left + timedelta(seconds=3600)).timestamp(), abs=1)
+
+    db.query(User).filter(User.user_id.in_(USER_IDS)).delete()
+    db.commit()
@@ -0,0 +1,97 @@
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+import scheduler_snapshot
+from scheduler_snapshot import HEADER, read_snapshot, write_snapshot
+
+ENTRIES = [
+    (1, 0, 1_700_000_060.5, 1_700_000_000),
+    (2, 2, 1_700_000_900.0, None),
+    (2**40, 1, 1_700_000_300.25, 1_699_999_000),
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "scheduler.snap")
+
+
+def test_round_trip(path):
+    size = write_snapshot(ENTRIES, path)
+
+    assert os.path.getsize(path) == size
+    assert read_snapshot(path) == ENTRIES
+    assert os.listdir(os.path.dirname(path)) == ["scheduler.snap"]
+
+
+def test_concurrent_writers_never_publish_a_partial_file(path):
+    # Процессы с общим SCHEDULER_SNAPSHOT_PATH пишут каждый в свой временный файл
+    snapshots = [ENTRIES * 2000, ENTRIES[:1] * 3000]
+    errors = []
+
+    def writer(entries):
+        try:
+            for _ in range(20):
+                write_snapshot(entries, path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(entries,)) for entries in snapshots]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        assert read_snapshot(path) in ([], *snapshots)
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert read_snapshot(path) in snapshots
+    assert os.listdir(os.path.dirname(path)) == ["scheduler.snap"]
+
+
+def test_empty_snapshot_round_trip(path):
+    write_snapshot([], path)
+    assert read_snapshot(path) == []
+
+
+def test_missing_file(path):
+    assert read_snapshot(path) == []
+
+
+def test_rewrite_replaces_previous(path):
+    write_snapshot(ENTRIES, path)
+    write_snapshot(ENTRIES[:1], path)
+    assert read_snapshot(path) == ENTRIES[:1]
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        pytest.param(lambda data: data[: HEADER.size - 1], id="truncated-header"),
+        pytest.param(lambda data: data[:-1], id="truncated-entries"),
+        pytest.param(lambda data: b"GARBAGE!" + data[8:], id="bad-magic"),
+        pytest.param(lambda data: data[:-2] + bytes([data[-2] ^ 0xFF]) + data[-1:], id="bad-crc"),
+        pytest.param(lambda data: data[:8] + struct.pack("<I", 99) + data[12:], id="unknown-version"),
+    ],
+)
+def test_corrupted_snapshot_is_ignored(path, corrupt):
+    write_snapshot(ENTRIES, path)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(corrupt(data))
+
+    assert read_snapshot(path) == []
+
+
+def test_expired_snapshot_is_ignored(path, monkeypatch):
+    write_snapshot(ENTRIES, path)
+    assert read_snapshot(path, max_age=60) == ENTRIES
+
+    written = time.time()
+    monkeypatch.setattr(scheduler_snapshot.time, "time", lambda: written + 61)
+    assert read_snapshot(path, max_age=60) == []
@@ -0,0 +1,51 @@
+import pytest
+
+from static_files import StaticAsset, etag_matches, select_variant
+
+ETAG = '"abc123-br"'
+ASSET = StaticAsset(
+    path="main.js", mimetype="text/javascript", etag="abc123", immutable=True,
+    variants={"br": "main.js.br", "gzip": "main.js.gz"},
+)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ('"abc123-br"', True),
+        ('"other", "abc123-br"', True),
+        ('W/"abc123-br"', True),
+        ("*", True),
+        ('"abc123"', False),  # Тег другого варианта не совпадает по подстроке
+        ('"abc123-brotli"', False),
+        ('"x-abc123-br-y"', False),
+        ("", False),
+        ("abc123-br", False),  # Без кавычек — не entity-tag
+    ],
+)
+def test_etag_matches(header, expected):
+    assert etag_matches(header, ETAG) is expected
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0, gzip", "gzip"),
+        ("br; q=0.000, gzip", "gzip"),
+        ("br;q=0.5, gzip;q=1", "gzip"),  # Клиент предпочитает gzip
+        ("br;q=0.8, gzip;q=0.8", "br"),
+        ("*", "br"),
+        ("*;q=0.5, br;q=0", "gzip"),  # "*" не перекрывает явный запрет
+        ("gzip;q=0.1, *;q=0", "gzip"),
+        ("*;q=0", None),
+        ("br;q=abc", None),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_select_variant(header, expected):
+    path, encoding = select_variant(ASSET, header)
+    assert encoding == expected
+    assert path == (ASSET.variants[expected] if expected else ASSET.path)
@@ -0,0 +1,158 @@
+from contextlib import ExitStack
+
+import httpx
+import pytest
+
+import telegram_client
+from outbox import DeferredSendError, PermanentSendError
+from telegram_client import CircuitBreaker, SendOutcome
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(telegram_client.time, "monotonic", clock)
+    return clock
+
+
+def _breaker(**kwargs):
+    params = dict(window=10, min_calls=4, failure_ratio=0.5, slow_call_seconds=3,
+                  slow_call_ratio=0.8, open_seconds=30)
+    params.update(kwargs)
+    return CircuitBreaker("test", **params)
+
+
+def test_breaker_stays_closed_below_min_calls(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(False, 0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_opens_on_failure_ratio_and_half_opens_after_timeout(clock):
+    breaker = _breaker()
+    for success in (True, True, False, False):
+        breaker.record(success, 0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert not breaker.will_allow_before(clock.now + 10)
+    assert breaker.will_allow_before(clock.now + 31)
+
+    clock.now += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # Только один пробный вызов
+
+
+def test_breaker_opens_on_slow_calls(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(True, 5)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False, 0.1)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record(True, 0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def _client(monkeypatch, handler) -> telegram_client.TelegramClient:
+    client = telegram_client.TelegramClient("0:tests")
+    client._http = httpx.Client(transport=httpx.MockTransport(handler))
+    sleeps = []
+    monkeypatch.setattr(telegram_client.time, "sleep", sleeps.append)
+    client.sleeps = sleeps
+    return client
+
+
+def test_response_outcome_classifies_errors():
+    def outcome(status, body):
+        return telegram_client._response_outcome(httpx.Response(status, json=body), 1, "text")
+
+    assert outcome(200, {"ok": True}) == (SendOutcome(telegram_client.SEND_DELIVERED), True)
+    blocked, healthy = outcome(403, {"ok": False, "description": "Forbidden: bot was blocked by the user"})
+    assert blocked.status == telegram_client.SEND_PERMANENT and healthy
+    assert "blocked" in blocked.error
+    limited, healthy = outcome(429, {"ok": False, "parameters": {"retry_after": 7}})
+    assert (limited.status, limited.retry_after, healthy) == (telegram_client.SEND_RETRY, 7.0, False)
+    assert outcome(502, {})[0].status == telegram_client.SEND_RETRY
+    assert outcome(401, {})[0].status == telegram_client.SEND_DEFER
+
+
+def test_emergency_permanent_error_is_not_retried(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"ok": False, "description": "Bad Request: chat not found"})
+
+    client = _client(monkeypatch, handler)
+    with pytest.raises(PermanentSendError, match="chat not found"):
+        client.send_message(1, "SOS", emergency=True)
+    assert len(calls) == 1
+
+
+def test_emergency_waits_retry_after_within_deadline(monkeypatch):
+    responses = iter([
+        httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 2}}),
+        httpx.Response(200, json={"ok": True}),
+    ])
+    client = _client(monkeypatch, lambda request: next(responses))
+    assert client.send_message(1, "SOS", emergency=True) is True
+    assert client.sleeps == [2.0]
+
+
+def test_emergency_gives_up_when_retry_after_exceeds_deadline(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 60}})
+
+    client = _client(monkeypatch, handler)
+    assert client.send_message(1, "SOS", emergency=True) is False
+    assert len(calls) == 1 and client.sleeps == []
+
+
+def test_open_breaker_defers_until_half_open(monkeypatch, clock):
+    calls = []
+    client = _client(monkeypatch, lambda request: calls.append(request) or httpx.Response(200, json={"ok": True}))
+    for _ in range(telegram_client.BREAKER_MIN_CALLS):
+        client.breaker.record(False, 0.1)
+    clock.now += 10
+
+    with pytest.raises(DeferredSendError) as deferred:
+        client.send_message(1, "reminder")
+    assert deferred.value.delay == pytest.approx(telegram_client.BREAKER_OPEN_SECONDS - 10)
+    # Экстренное не ждет внутри бюджета дольше, чем breaker останется открытым
+    with pytest.raises(DeferredSendError):
+        client.send_message(1, "SOS", emergency=True)
+    assert calls == [] and client.sleeps == []
+
+
+def test_full_bulkhead_defers(monkeypatch):
+    monkeypatch.setattr(telegram_client, "TELEGRAM_BULKHEAD_WAIT", 0)
+    client = _client(monkeypatch, lambda request: httpx.Response(200, json={"ok": True}))
+    with ExitStack() as slots:
+        assert all(slots.enter_context(client._regular.slot()) for _ in range(telegram_client.TELEGRAM_MAX_CONCURRENCY))
+        with pytest.raises(DeferredSendError, match="bulkhead regular"):
+            client.send_message(1, "reminder")
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from events import EVENT_LEFT_HOME, EVENT_RETURNED_HOME
+from models import StatusEvent, User, UserStats
+from users import STATUS_AWAY, STATUS_HOME, set_status
+
+USER_ID = 4242
+
+
+@pytest.fixture
+def user_db(db):
+    for model in (StatusEvent, UserStats, User):
+        db.query(model).filter(model.user_id == USER_ID).delete()
+    db.add(User(user_id=USER_ID, chat_id=USER_ID, status=STATUS_HOME, emergency_contact_username="@friend"))
+    db.flush()
+    return db
+
+
+def _events(db):
+    return db.query(StatusEvent).filter(StatusEvent.user_id == USER_ID).order_by(StatusEvent.id).all()
+
+
+def test_repeated_away_closes_previous_outing(user_db):
+    first = datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc)
+    second = first + timedelta(minutes=30)
+
+    set_status(user_db, USER_ID, STATUS_AWAY, now=first)
+    set_status(user_db, USER_ID, STATUS_AWAY, now=second)
+    set_status(user_db, USER_ID, STATUS_HOME, now=second + timedelta(minutes=10))
+    user_db.flush()
+
+    events = _events(user_db)
+    assert [e.event_type for e in events] == [
+        EVENT_LEFT_HOME, EVENT_RETURNED_HOME, EVENT_LEFT_HOME, EVENT_RETURNED_HOME,
+    ]
+    assert [e.duration_seconds for e in events if e.event_type == EVENT_RETURNED_HOME] == [1800, 600]
+    stats = user_db.get(UserStats, USER_ID)
+    assert stats.outings_count == 2
+
+
+def test_home_when_already_home_records_nothing(user_db):
+    set_status(user_db, USER_ID, STATUS_HOME)
+    user_db.flush()
+    assert _events(user_db) == []
+
+
+def test_away_without_contact_leaves_user_unchanged(user_db):
+    user = user_db.get(User, USER_ID)
+    user.emergency_contact_username = None
+    user_db.flush()
+
+    assert set_status(user_db, USER_ID, STATUS_AWAY, timer_seconds=120) is None
+    user_db.flush()
+    user_db.expire_all()
+
+    user = user_db.get(User, USER_ID)
+    assert user.status == STATUS_HOME
+    assert user.left_home_time is None
+    assert user.timer_seconds != 120
+    assert _events(user_db) == []
+
+
+def test_new_user_without_contact_is_not_created_as_away(user_db):
+    user_db.query(User).filter(User.user_id == USER_ID).delete()
+    user_db.flush()
+
+    assert set_status(user_db, USER_ID, STATUS_AWAY) is None
+    user_db.flush()
+    assert user_db.get(User, USER_ID) is None
@@ -0,0 +1,219 @@
+"""
+Операции пользователя мини‑аппа: статус «дома»/«не дома», экстренный контакт, таймер.
+
+Функции работают в переданной сессии и не коммитят — транзакцией управляет вызывающий:
+web.py (get_db_session) или asgi.py (async_db.run_sync). Таймеры планировщика
+запускаются вызывающим после коммита.
+"""
+import logging
+from datetime import datetime, timezone
+
+from config import DEFAULT_TIMER_SECONDS
+from events import EVENT_LEFT_HOME, EVENT_RETURNED_HOME, record_event
+from groups import bump_member_groups
+from models import User, ensure_utc_aware, fix_user_left_home_time, get_or_create_user
+
+logger = logging.getLogger(__name__)
+
+STATUS_HOME = "дома"
+STATUS_AWAY = "не дома"
+STATUSES = (STATUS_HOME, STATUS_AWAY)
+
+MIN_TIMER_SECONDS = 60  # Минимум 1 минута
+
+
+def set_status(db, user_id: int, status: str, *, username=None, timer_seconds=None,
+               now: datetime | None = None) -> int | None:
+    """Переход пользователя в status.
+
+    Возвращает timer_seconds пользователя или None, если для выхода из дома
+    не указан экстренный контакт — тогда строка пользователя не меняется.
+    """
+    now = now or datetime.now(timezone.utc)
+    # Блокировка строки users: порядок users → user_stats как у планировщика
+    user = db.query(User).filter(User.user_id == user_id).with_for_update().first()
+
+    # Нельзя уходить из дома без указанного экстренного контакта. Проверка — до изменений:
+    # вызывающий коммитит сессию и при отказе, а «не дома» без события журнала и таймеров
+    # никто бы не отследил
+    if status == STATUS_AWAY and not (user and user.emergency_contact_username):
+        return None
+
+    previous_status = user.status if user else None
+    previous_left_home_time = user.left_home_time if user else None
+    previous_warnings = (user.warnings_sent or 0) if user else 0
+    if not user:
+        user = User(
+            user_id=user_id,
+            status=status,
+            username=username,
+            chat_id=user_id,
+            timer_seconds=timer_seconds if timer_seconds else DEFAULT_TIMER_SECONDS,
+        )
+        db.add(user)
+    else:
+        user.status = status
+        if not user.chat_id:
+            user.chat_id = user_id
+        if username is not None:
+            user.username = username
+        if timer_seconds is not None:
+            user.timer_seconds = timer_seconds
+
+    # Переход и событие журнала фиксируются одной транзакцией
+    if previous_status == STATUS_AWAY:
+        # Повторный «не дома» перезапускает таймер: прежний выход закрывается,
+        # чтобы в журнале не было двух открытых выходов подряд
+        record_event(
+            db,
+            user_id,
+            EVENT_RETURNED_HOME,
+            occurred_at=now,
+            outing_started_at=previous_left_home_time,
+            warnings_sent=previous_warnings,
+        )
+    if status == STATUS_AWAY:
+        user.left_home_time = now
+        record_event(db, user_id, EVENT_LEFT_HOME, occurred_at=now, outing_started_at=now)
+    else:
+        user.left_home_time = None
+    user.warnings_sent = 0
+    user.updated_at = now
+    bump_member_groups(db, user_id)
+    return user.timer_seconds
+
+
+def status_snapshot(db, user_id: int, now: datetime | None = None) -> dict:
+    """Ответ GET /status: статус, таймер и оставшееся время текущего выхода"""
+    now = now or datetime.now(timezone.utc)
+    user = get_or_create_user(db, user_id)
+    status = user.status or STATUS_HOME
+    time_remaining = None
+    elapsed_seconds = None
+    if status == STATUS_AWAY and user.left_home_time:
+        fix_user_left_home_time(user)  # Исправляем timezone-naive, если нужно
+        left_time = ensure_utc_aware(user.left_home_time)
+        timer_seconds = user.timer_seconds or DEFAULT_TIMER_SECONDS
+        elapsed_seconds = (now - left_time).total_seconds()
+        time_remaining = max(0, timer_seconds - elapsed_seconds)
+    logger.info("GET /status: user_id=%s, status=%s, left_home_time=%s, elapsed_seconds=%s",
+                user_id, status, user.left_home_time, elapsed_seconds)
+    return {
+        "status": status,
+        "emergency_contact_set": bool(user.emergency_contact_username),
+        "timer_seconds": user.timer_seconds or DEFAULT_TIMER_SECONDS,
+        "time_remaining": int(time_remaining) if time_remaining is not None else None,
+        "elapsed_seconds": int(elapsed_seconds) if elapsed_seconds is not None else None,
+    }
+
+
+def normalize_contact(contact) -> str | None:
+    """'name' / '@name' -> '@name'; None для некорректного значения"""
+    if not isinstance(contact, str):
+        return None
+    contact = contact.strip()
+    if contact and not contact.startswith("@"):
+        contact = "@" + contact
+    if not contact or contact == "@":
+        return None
+    return contact
+
+
+def set_emergency_contact(db, user_id: int, contact: str) -> None:
+    """Сохраняет экстренный контакт и сразу ищет его среди зарегистрированных пользователей"""
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        user = User(
+            user_id=user_id,
+            status=STATUS_HOME,
+            timer_seconds=DEFAULT_TIMER_SECONDS,
+        )
+        db.add(user)
+    user.emergency_contact_username = contact
+
+    # Это решает проблему, когда контакт уже зарегистрирован, но ID еще не установлен
+    contact_user = db.query(User).filter(
+        User.username == contact,
+        User.chat_id.isnot(None)
+    ).first()
+
+    if contact_user:
+        # Контакт уже зарегистрирован - сразу обновляем ID
+        user.emergency_contact_user_id = contact_user.user_id
+        logger.info("✅ При сохранении контакта сразу найден emergency_contact_user_id: user_id=%s, contact=%s, contact_user_id=%s",
+                    user_id, contact, contact_user.user_id)
+    else:
+        # Контакт еще не зарегистрирован - сбрасываем ID, он обновится при /start контакта
+        user.emergency_contact_user_id = None
+        logger.info("ℹ️ Контакт %s еще не зарегистрирован. ID обновится при /start контакта (user_id=%s)",
+                    contact, user_id)
+
+
+def get_emergency_contact(db, user_id: int) -> str:
+    return get_or_create_user(db, user_id).emergency_contact_username or ""
+
+
+def parse_timer_seconds(value) -> tuple[int | None, str | None]:
+    """(секунды, None) или (None, текст ошибки для ответа 400)"""
+    try:
+        timer_seconds = int(value)
+    except (ValueError, TypeError):
+        return None, "Invalid timer_seconds"
+    if timer_seconds < MIN_TIMER_SECONDS:
+        return None, "Timer must be at least 60 seconds"
+    return timer_seconds, None
+
+
+def set_timer(db, user_id: int, timer_seconds: int) -> None:
+    user = db.query(User).filter(User.user_id == user_id).with_for_update().first()
+    if not user:
+        db.add(User(user_id=user_id, timer_seconds=timer_seconds))
+    else:
+        user.timer_seconds = timer_seconds
+        user.updated_at = datetime.now(timezone.utc)
+    # Таймер влияет на time_remaining в статусе групп
+    bump_member_groups(db, user_id)
+
+
+def get_timer(db, user_id: int) -> int:
+    return get_or_create_user(db, user_id).timer_seconds or DEFAULT_TIMER_SECONDS
+
+
+def register_bot_user(db, user_id: int, username: str | None) -> bool:
+    """/start бота: регистрирует или обновляет пользователя. True — пользователь новый
+
+    Если у пользователя есть username, он привязывается как экстренный контакт
+    к тем, кто указал его до регистрации.
+    """
+    user = db.query(User).filter(User.user_id == user_id).first()
+    created = user is None
+    if created:
+        db.add(User(
+            user_id=user_id,
+            username=username,
+            chat_id=user_id,
+            status=STATUS_HOME,
+            warnings_sent=0,
+            timer_seconds=DEFAULT_TIMER_SECONDS,
+        ))
+        logger.info("✅ Новый пользователь зарегистрирован: user_id=%s, username=%s", user_id, username)
+    else:
+        # Обновляем данные существующего пользователя
+        if user.username != username:
+            bump_member_groups(db, user_id)  # username отображается в статусе групп
+        user.username = username
+        user.chat_id = user_id
+        logger.info("✅ Пользователь обновлен: user_id=%s, username=%s", user_id, username)
+
+    if username:
+        # Обновляем только тех, у кого еще не установлен ID
+        users_with_this_contact = db.query(User).filter(
+            User.emergency_contact_username == username,
+            User.emergency_contact_user_id.is_(None)
+        ).all()
+        for u in users_with_this_contact:
+            u.emergency_contact_user_id = user_id  # Используем user_id как chat_id для отправки сообщений
+        if users_with_this_contact:
+            logger.info("🔗 Обновлен emergency_contact_user_id для %s пользователей, которые указали %s как экстренный контакт",
+                        len(users_with_this_contact), username)
+    return created
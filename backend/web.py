@@ -0,0 +1,435 @@
+"""
+HTTP API мини‑аппа (Flask).
+
+Точка входа веб-процесса: gunicorn web:app (или python web.py).
+Модуль не импортирует python-telegram-bot и scheduler: уведомления ставятся в outbox,
+а таймеры запускает планировщик (в этом процессе — если он запущен через app.py,
+иначе — worker.py по данным из БД).
+"""
+import os
+import sys
+import logging
+from datetime import datetime, timezone
+
+from flask import Flask, request, jsonify, g
+from flask_cors import CORS, cross_origin
+
+from config import cors_allowed_origins, get_bot_token
+from events import stats_to_dict
+from groups import GroupError, create_group, group_status, join_group, leave_group, list_user_groups
+from models import User, UserStats, db_pools_snapshot, get_db_session, get_user
+from profiling import collapsed_stacks, get_profile, install_request_profiler, list_profiles
+from rate_limit import RateLimiter
+from static_files import register_miniapp
+from telegram_webapp_auth import (
+    INIT_DATA_HEADER,
+    init_data_candidates,
+    legacy_user_id,
+    telegram_user_id_from_init_data,
+)
+from users import (
+    STATUS_AWAY,
+    STATUSES,
+    get_emergency_contact,
+    get_timer,
+    normalize_contact,
+    parse_timer_seconds,
+    set_emergency_contact,
+    set_status,
+    set_timer,
+    status_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _local_scheduler():
+    """Модуль scheduler, если его загрузил этот процесс (app.py), иначе None.
+
+    Веб-процесс (gunicorn web:app) scheduler не импортирует: таймеров в нем нет,
+    а выход из дома подхватит worker.py при сверке с БД.
+    """
+    return sys.modules.get("scheduler")
+
+
+def _request_json_body():
+    return request.get_json(silent=True) if request.is_json else None
+
+
+def get_verified_telegram_user_id() -> int | None:
+    """user.id только из initData с проверенной подписью; результат кешируется на время запроса."""
+    if "verified_user_id" not in g:
+        g.verified_user_id = None
+        for raw in init_data_candidates(request.headers, request.args.get("init_data"), _request_json_body()):
+            uid = telegram_user_id_from_init_data(raw, get_bot_token())
+            if uid is not None:
+                g.verified_user_id = uid
+                break
+    return g.verified_user_id
+
+
+def get_authenticated_telegram_user_id() -> int | None:
+    """Сначала проверенный initData; при отсутствии/ошибке — опционально legacy user_id."""
+    uid = get_verified_telegram_user_id()
+    if uid is not None:
+        return uid
+    return legacy_user_id(_request_json_body(), request.args.get("user_id"))
+
+
+def rate_limit_key() -> str:
+    """
+    Ключ лимита: проверенный Telegram user id. Пользователи за одним NAT/прокси
+    Telegram не мешают друг другу. IP — только для запросов без валидного initData
+    (legacy user_id не используется: его может подставить любой клиент).
+    """
+    uid = get_verified_telegram_user_id()
+    if uid is not None:
+        return f"tg:{uid}"
+    return f"ip:{request.remote_addr or '127.0.0.1'}"
+
+
+app = Flask(__name__)
+CORS(
+    app,
+    origins=cors_allowed_origins(),
+    supports_credentials=False,
+    allow_headers=[
+        "Content-Type",
+        INIT_DATA_HEADER,
+        "X-Telegram-Web-App-Init-Data",
+        "Authorization",
+    ],
+)
+
+limiter = RateLimiter(
+    rate_limit_key,
+    app=app,
+    default_limits=["180 per minute"],
+    # memory:// — в памяти процесса; для нескольких воркеров: redis://host:6379/0
+    storage_uri=os.environ.get("RATE_LIMIT_STORAGE_URI", "memory://").strip(),
+)
+
+# Профилирование отдельных запросов по заголовку X-Debug-Profile: <DEBUG_SECRET>
+install_request_profiler(app)
+
+# Собранный мини‑апп (python build_static.py) — по MINIAPP_URL_PREFIX, по умолчанию /app/
+register_miniapp(app, limiter)
+
+
+@app.route("/")
+def root() -> str:
+    return "Backend работает ✅"
+
+
+@app.route("/status", methods=["POST"])
+@cross_origin()
+@limiter.limit("45 per minute")
+def http_update_status():
+    try:
+        user_id = get_authenticated_telegram_user_id()
+        if user_id is None:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "error": "unauthorized",
+                        "message": "Откройте мини‑апп из Telegram или обновите страницу.",
+                    }
+                ),
+                401,
+            )
+
+        payload = request.json or {}
+        status = payload.get("status")
+        username = payload.get("username")
+        timer_seconds = payload.get("timer_seconds")  # Новый параметр для таймера
+
+        if status not in STATUSES:
+            return jsonify({"success": False, "error": "Invalid data"}), 400
+
+        now = datetime.now(timezone.utc)
+        with get_db_session() as db:
+            saved_timer_seconds = set_status(db, user_id, status, username=username,
+                                             timer_seconds=timer_seconds, now=now)
+        if saved_timer_seconds is None:
+            return jsonify({"success": False, "error": "contact_required"}), 400
+
+        local_scheduler = _local_scheduler()
+        if status == STATUS_AWAY:
+            logger.info("🚶 Пользователь user_id=%s переключился в статус 'не дома'", user_id)
+            if local_scheduler is not None:
+                local_scheduler.cancel_all_jobs_for_user(user_id)
+            if local_scheduler is not None and local_scheduler.is_running():
+                try:
+                    local_scheduler.schedule_sequence_for_user(user_id, saved_timer_seconds, int(now.timestamp()))
+                except Exception as e:
+                    logger.exception("❌ Ошибка планирования таймеров для user_id=%s: %s", user_id, e)
+                    return jsonify({"success": False, "error": "Timer scheduling failed"}), 500
+                logger.info("✅ Запущены таймеры для user_id=%s (таймер: %s сек)", user_id, saved_timer_seconds)
+            else:
+                # Планировщик работает в worker.py и подхватит выход при ближайшей сверке с БД
+                logger.info("🗓️ Таймеры для user_id=%s запустит worker (таймер: %s сек)", user_id, saved_timer_seconds)
+        else:  # статус "дома"
+            logger.info("🏠 Пользователь user_id=%s переключился в статус 'дома'", user_id)
+            if local_scheduler is not None:
+                local_scheduler.cancel_all_jobs_for_user(user_id)
+
+        return jsonify({"success": True})
+    except Exception as e:
+        logger.exception("Ошибка /status: %s", e)
+        return jsonify({"success": False, "error": "Internal Server Error"}), 500
+
+
+@app.route("/status", methods=["GET"])
+@cross_origin()
+@limiter.limit("90 per minute")
+def http_get_status():
+    try:
+        user_id = get_authenticated_telegram_user_id()
+        if user_id is None:
+            return jsonify({"error": "unauthorized"}), 401
+
+        with get_db_session() as db:
+            return jsonify(status_snapshot(db, user_id)), 200
+    except Exception as e:
+        logger.exception("❌ Ошибка GET /status: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/contact", methods=["POST", "GET"])
+@cross_origin()
+@limiter.limit("60 per minute")
+def http_update_contact():
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": "unauthorized",
+                    "message": "Откройте мини‑апп из Telegram.",
+                }
+            ),
+            401,
+        )
+
+    if request.method == "POST":
+        payload = request.json or {}
+        contact = normalize_contact(payload.get("contact"))
+        if contact is None:
+            return jsonify({"success": False, "error": "Invalid contact"}), 400
+
+        with get_db_session() as db:
+            set_emergency_contact(db, user_id, contact)
+        return jsonify({"success": True})
+
+    # GET
+    with get_db_session() as db:
+        return jsonify({"emergency_contact": get_emergency_contact(db, user_id)}), 200
+
+
+@app.route("/timer", methods=["POST", "GET"])
+@cross_origin()
+@limiter.limit("60 per minute")
+def http_timer():
+    """Эндпоинт для работы с таймером"""
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": "unauthorized",
+                    "message": "Откройте мини‑апп из Telegram.",
+                }
+            ),
+            401,
+        )
+
+    if request.method == "POST":
+        payload = request.json or {}
+        timer_seconds, error = parse_timer_seconds(payload.get("timer_seconds"))
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+
+        with get_db_session() as db:
+            set_timer(db, user_id, timer_seconds)
+        return jsonify({"success": True})
+
+    # GET
+    with get_db_session() as db:
+        return jsonify({"timer_seconds": get_timer(db, user_id)}), 200
+
+
+@app.route("/stats", methods=["GET"])
+@cross_origin()
+@limiter.limit("60 per minute")
+def http_stats():
+    """Статистика выходов пользователя: одна строка user_stats по первичному ключу"""
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        with get_db_session() as db:
+            stats = db.get(UserStats, user_id)
+            return jsonify(stats_to_dict(stats)), 200
+    except Exception as e:
+        logger.exception("❌ Ошибка GET /stats: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _unauthorized_response():
+    return (
+        jsonify(
+            {
+                "success": False,
+                "error": "unauthorized",
+                "message": "Откройте мини‑апп из Telegram.",
+            }
+        ),
+        401,
+    )
+
+
+@app.route("/groups", methods=["POST", "GET"])
+@cross_origin()
+@limiter.limit("30 per minute")
+def http_groups():
+    """POST — создать группу (создатель становится участником), GET — группы пользователя"""
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return _unauthorized_response()
+
+    if request.method == "POST":
+        payload = request.json or {}
+        name = payload.get("name")
+        if not isinstance(name, str) or not name.strip() or len(name.strip()) > 64:
+            return jsonify({"success": False, "error": "Invalid name"}), 400
+        get_user(user_id)  # Создатель должен существовать в users, чтобы попасть в статус группы
+        with get_db_session() as db:
+            group = create_group(db, user_id, name.strip())
+        return jsonify({"success": True, **group}), 201
+
+    with get_db_session() as db:
+        return jsonify({"groups": list_user_groups(db, user_id)}), 200
+
+
+@app.route("/groups/join", methods=["POST"])
+@cross_origin()
+@limiter.limit("20 per minute")
+def http_join_group():
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return _unauthorized_response()
+
+    payload = request.json or {}
+    invite_code = payload.get("invite_code")
+    if not isinstance(invite_code, str) or not invite_code.strip():
+        return jsonify({"success": False, "error": "Invalid invite_code"}), 400
+    get_user(user_id)
+    try:
+        with get_db_session() as db:
+            group = join_group(db, user_id, invite_code.strip())
+    except GroupError as e:
+        return jsonify({"success": False, "error": e.code}), e.status
+    return jsonify({"success": True, **group}), 200
+
+
+@app.route("/groups/<int:group_id>/leave", methods=["POST"])
+@cross_origin()
+@limiter.limit("20 per minute")
+def http_leave_group(group_id: int):
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return _unauthorized_response()
+    try:
+        with get_db_session() as db:
+            leave_group(db, user_id, group_id)
+    except GroupError as e:
+        return jsonify({"success": False, "error": e.code}), e.status
+    return jsonify({"success": True}), 200
+
+
+@app.route("/groups/<int:group_id>/status", methods=["GET"])
+@cross_origin()
+@limiter.limit("90 per minute")
+def http_group_status(group_id: int):
+    """Статусы всех участников группы: один запрос к БД (два при промахе кеша)"""
+    user_id = get_authenticated_telegram_user_id()
+    if user_id is None:
+        return jsonify({"error": "unauthorized"}), 401
+    try:
+        with get_db_session() as db:
+            return jsonify(group_status(db, group_id, user_id)), 200
+    except GroupError as e:
+        return jsonify({"error": e.code}), e.status
+    except Exception as e:
+        logger.exception("❌ Ошибка GET /groups/%s/status: %s", group_id, e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def run_flask() -> None:
+    """Запуск Flask сервера"""
+    port = int(os.environ.get("PORT", 5000))
+    logger.info("Запуск Flask сервера на порту %s", port)
+    # Development server; в production — gunicorn web:app вместе с отдельным worker.py
+    app.run(host="0.0.0.0", port=port, debug=False)
+
+
+def _debug_secret_ok() -> bool:
+    secret = os.environ.get("DEBUG_SECRET", "").strip()
+    return bool(secret) and request.headers.get("X-Debug-Secret", "").strip() == secret
+
+
+@app.route("/debug", methods=["GET"])
+@limiter.limit("10 per minute")
+def http_debug():
+    if not _debug_secret_ok():
+        return jsonify({"error": "not found"}), 404
+    try:
+        with get_db_session() as db:
+            users = db.query(User).all()
+            snapshot = {}
+            for user in users:
+                snapshot[str(user.user_id)] = user.to_dict()
+        # telegram_client импортируется лениво: веб-процессу он нужен только здесь
+        from telegram_client import peek_client
+        client = peek_client()
+        local_scheduler = _local_scheduler()
+        return jsonify({
+            "user_data": snapshot,
+            "jobs_keys": list(local_scheduler.jobs.keys()) if local_scheduler else [],
+            "scheduler_cold_start": local_scheduler.cold_start if local_scheduler else {},
+            "telegram_breaker": client.breaker.state if client else None,
+            "db_pools": db_pools_snapshot(),
+        })
+    except Exception as e:
+        logger.exception("Ошибка /debug: %s", e)
+        return jsonify({"error": "debug failed"}), 500
+
+
+@app.route("/debug/profiles", methods=["GET"])
+@limiter.limit("30 per minute")
+def http_debug_profiles():
+    if not _debug_secret_ok():
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"profiles": list_profiles()})
+
+
+@app.route("/debug/profiles/<profile_id>", methods=["GET"])
+@limiter.limit("30 per minute")
+def http_debug_profile(profile_id: str):
+    """Профиль запроса: JSON или ?format=collapsed (flamegraph.pl / speedscope)"""
+    if not _debug_secret_ok():
+        return jsonify({"error": "not found"}), 404
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "profile not found"}), 404
+    if request.args.get("format") == "collapsed":
+        return collapsed_stacks(profile), 200, {"Content-Type": "text/plain; charset=utf-8"}
+    return jsonify(profile)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_flask()
@@ -0,0 +1,53 @@
+"""
+Фоновый процесс: планировщик напоминаний, доставка сообщений из outbox
+и создание секций журнала status_events.
+
+Точка входа: python worker.py
+SIGTERM (остановка контейнера) и Ctrl+C останавливают процесс штатно: дрейнер отмечает
+начатые отправки, планировщик записывает финальный снимок таймеров.
+Не импортирует Flask и python-telegram-bot: таймеры восстанавливаются из таблицы users,
+сообщения отправляются через Bot API клиентом telegram_client.
+"""
+import signal
+import logging
+from threading import Event, current_thread, main_thread
+
+from config import env_flag
+from events import start_partition_maintenance
+from models import init_db
+from outbox import start_outbox_worker
+from scheduler import start_scheduler, stop_scheduler
+from telegram_client import send_message
+
+logger = logging.getLogger(__name__)
+
+WORKER_STOP_TIMEOUT = 10  # Секунд на финальный снимок и на отправки, начатые до остановки
+
+
+def run_worker(stop_event: Event | None = None) -> None:
+    """Запускает планировщик и outbox-дрейнер и ждет stop_event"""
+    stop_event = stop_event or Event()
+    if current_thread() is main_thread():
+        # Обработчик сигнала можно установить только из главного потока
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    # Миграции схемы БД (MIGRATE_ON_STARTUP=0 — если они применяются отдельно: python migrate.py)
+    if env_flag("MIGRATE_ON_STARTUP", "1"):
+        init_db()
+    start_scheduler(stop_event)
+    outbox_thread = start_outbox_worker(send_message, stop_event)
+    start_partition_maintenance(stop_event)
+    logger.info("✅ Worker запущен: планировщик, outbox-дрейнер и обслуживание журнала статусов")
+    try:
+        while not stop_event.wait(60):
+            pass
+    except KeyboardInterrupt:
+        pass
+    logger.info("⏹️ Получен сигнал остановки")
+    stop_scheduler(stop_event, WORKER_STOP_TIMEOUT)
+    outbox_thread.join(WORKER_STOP_TIMEOUT)
+    logger.info("✅ Worker остановлен")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_worker()